@@ -3,10 +3,13 @@ from database.follower import Follower
 from database.engagement import Engagement 
 from database.post import Post
 from database.user import User
-from database.database import Database
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
+from database.database import Database, DEFAULT_BATCH_SIZE, report_load
+from database.schema import migrate, drop_all
+from database.insight_tables import InsightTables
+from database.tags import PostTag
 import pandas as pd
+import os
+import time
 
 user_db = User()
 post_db = Post()
@@ -15,110 +18,106 @@ engagement_db = Engagement()
 follower_db = Follower()
 
 def drop_tables_in_order():
-    try:
-        # Get a connection from the engine
-        with Database.get_engine().connect() as connection:
-            # Disable foreign key checks to allow dropping tables with dependencies
-            connection.execute(text("SET FOREIGN_KEY_CHECKS = 0;"))
-        
-            # Drop tables in reverse order of foreign key dependencies
-            Engagement(drop=True)  # No foreign key dependencies
-            Comment(drop=True)     # Depends on Post and User
-            Follower(drop=True)    # Depends on User
-            Post(drop=True)        # Depends on User
-            User(drop=True)        # Independent
-
-            print("All tables dropped successfully.")
-        
-            # Re-enable foreign key checks after dropping tables
-            connection.execute(text("SET FOREIGN_KEY_CHECKS = 1;"))
-
-    except SQLAlchemyError as e:
-        print(f"Error dropping tables: {e}")
-        raise
-
-
-def load_data_from_csv(file_path, table_class):
+    # Drops every table in reverse order of foreign key dependencies
+    drop_all()
+
+
+# Rows read from a CSV file per chunk; bounds the loader's peak memory
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def _to_records(data_df):
+    """Convert a DataFrame into plain dicts, with NaN mapped to None for the driver."""
+    data_df = data_df.astype(object).where(data_df.notna(), None)
+    return data_df.to_dict('records')
+
+
+def load_data_from_csv(file_path, table_class, column_map=None, transform=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                       ignore_duplicates=False):
     """
-    General function to load data from CSV into the corresponding table.
+    General function to stream data from CSV into the corresponding table.
+
+    The file is read `chunk_size` rows at a time with the table's dtypes, so
+    memory stays bounded regardless of the file size; each chunk is handed
+    to `bulk_write` before the next one is read.
     
     Args:
     file_path (str): Path to the CSV file.
     table_class (BaseTable): The class corresponding to the table (User, Post, Comment, etc.)
-    
+    column_map (dict): CSV column -> table column, for files whose headers differ.
+        Columns missing from the file are skipped.
+    transform (callable): Applied to each chunk (a DataFrame with table column names).
+    chunk_size (int): Number of CSV rows read per chunk.
+    batch_size (int): Number of rows per INSERT/transaction.
+    ignore_duplicates (bool): Skip rows whose key already exists in the table.
+
+    Returns:
+    int: Number of rows written.
     """
-    # Read the CSV data using pandas
-    data_df = pd.read_csv(file_path)
-    
+    column_map = column_map or {column: column for column in table_class.columns}
+    dtype = {
+        source: table_class.dtypes[target]
+        for source, target in column_map.items() if target in table_class.dtypes
+    }
+
     # Initialize the table object
     table_obj = table_class()
 
+    total = 0
+    start = time.perf_counter()
+    reader = pd.read_csv(file_path, usecols=lambda column: column in column_map, dtype=dtype, chunksize=chunk_size)
+    for chunk in reader:
+        chunk = chunk.rename(columns=column_map)
+        if transform is not None:
+            chunk = transform(chunk)
+        columns = [column for column in table_class.columns if column in chunk.columns]
+        total += table_obj.bulk_write(
+            _to_records(chunk[columns]), columns, batch_size,
+            report=False, ignore_duplicates=ignore_duplicates
+        )
 
-def load_users_from_csv(file_path):
-    data_df = pd.read_csv(file_path)
-    user_db = User()
+    report_load(table_obj.table_name, total, time.perf_counter() - start)
+    return total
 
-    for _, row in data_df.iterrows():
-        user_db.write(
-            user_id=int(row['user_id']) + 8,
-            username=row['username'], 
-            bio=row['bio'], 
-            followers_count=row['followers_count'], 
-            following_count=row['following_count'], 
-            location=row['location'], 
-            is_influential=row['is_influential']
-        )
-    print(f"Loaded {len(data_df)} records into the User table.")
 
-def load_posts_from_csv(file_path):
-    data_df = pd.read_csv(file_path)
-    post_db = Post()
+def _shift_user_ids(data_df):
+    # The dummy data's user ids are offset to sit after the seeded accounts
+    data_df['user_id'] = data_df['user_id'] + 8
+    return data_df
 
-    for _, row in data_df.iterrows():
-        post_db.write(
-            user_id=int(row['user_id']) + 8, 
-            media_type=row['media_type'], 
-            media_url=row['media_url'], 
-            caption=row['caption']
-        )
-    print(f"Loaded {len(data_df)} records into the Post table.")
 
+def load_users_from_csv(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    return load_data_from_csv(file_path, User, transform=_shift_user_ids, batch_size=batch_size)
 
-def load_comments_from_csv(file_path):
-    data_df = pd.read_csv(file_path)
-    comment_db = Comment()
+def load_posts_from_csv(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    return load_data_from_csv(file_path, Post, transform=_shift_user_ids, batch_size=batch_size)
 
-    for _, row in data_df.iterrows():
-        comment_db.write(
-            post_id=row['post_id'], 
-            user_id=int(row['user_id']) + 8, 
-            message=row['message'], 
-            like_count=row['like_count']
-        )
-    print(f"Loaded {len(data_df)} records into the Comment table.")
 
-def load_engagements_from_csv(file_path):
-    data_df = pd.read_csv(file_path)
-    engagement_db = Engagement()
+def load_comments_from_csv(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    return load_data_from_csv(file_path, Comment, transform=_shift_user_ids, batch_size=batch_size)
 
-    for _, row in data_df.iterrows():
-        engagement_db.write(
-            post_id=row['post_id'], 
-            likes_count=row['likes_count'], 
-            comments_count=row['comments_count'], 
-            shares_count=row['shares_count'], 
-            video_completion_rate=row['video_completion_rate']
-        )
-    print(f"Loaded {len(data_df)} records into the Engagement table.")
+def load_engagements_from_csv(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    return load_data_from_csv(file_path, Engagement, batch_size=batch_size)
 
-def main():
+def main(batch_size=DEFAULT_BATCH_SIZE):
     # drop_tables_in_order()
+    migrate()
 
     # Load data into each table from the corresponding CSV file
-    load_users_from_csv('data/Dummy_Users_Data.csv')
-    load_posts_from_csv('data/Dummy_Posts_Data.csv')
-    load_comments_from_csv('data/Dummy_Comments_Data.csv')
-    load_engagements_from_csv('data/Dummy_Engagement_Data.csv')
+    loaded = {
+        'users': load_users_from_csv('data/Dummy_Users_Data.csv', batch_size),
+        'posts': load_posts_from_csv('data/Dummy_Posts_Data.csv', batch_size),
+        'comments': load_comments_from_csv('data/Dummy_Comments_Data.csv', batch_size),
+        'engagements': load_engagements_from_csv('data/Dummy_Engagement_Data.csv', batch_size),
+    }
+    for table_name, count in loaded.items():
+        print(f"{table_name}: {count} rows")
+
+    # bulk loads skip the per-write hooks, so extract caption tags and
+    # recompute the aggregates
+    PostTag().rebuild_from_captions(batch_size)
+    InsightTables().rebuild()
 
     # Optionally, read and print data for validation
     user_db = User()
@@ -136,5 +135,5 @@ def main():
     Database.close_connection()
 
 if __name__ == "__main__":
-    main()
+    main(int(os.getenv('BATCH_SIZE', DEFAULT_BATCH_SIZE)))
 
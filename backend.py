@@ -1,15 +1,238 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import Body, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, List, Literal, Optional
+from datetime import datetime
 from sqlalchemy.exc import IntegrityError
 from database.comments import Comment
 from database.follower import Follower
 from database.engagement import Engagement 
+from database.engagement_history import EngagementHistory, EPOCH, with_growth
 from database.post import Post
 from database.user import User
-from database.database import Database
-
-app = FastAPI()
+from database.database import Database, DEFAULT_BATCH_SIZE, DEFAULT_PAGE_SIZE
+from database.async_database import AsyncDatabase, AsyncBaseTable
+from database.cache import get_cache
+from database.graph import get_graph, loaded_graph
+from database.analytics import get_analytics
+from database.insight_tables import InsightTables, dashboard
+from database.search import Search, SOURCES
+from database.tags import get_tag_index
+from database.metrics import get_metrics, log_event, render_prometheus
+from database.counter_buffer import get_counter_buffer
+from database.serialization import FastJSONResponse, RowMapper, dumps, etag, last_modified, not_modified
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from email.utils import format_datetime
+import asyncio
+import json
+import logging
+import os
+import time
+
+# Set when the counter buffer holds COUNTER_MAX_PENDING posts, to flush before the interval is up
+counters_full = asyncio.Event()
+
+async def flush_counters(counters):
+    while True:
+        try:
+            await asyncio.wait_for(counters_full.wait(), counters.flush_interval)
+        except asyncio.TimeoutError:
+            pass
+        counters_full.clear()
+        await flush_logged(counters)
+
+async def flush_logged(counters):
+    # A failed flush has spilled its deltas for the next one to retry
+    try:
+        await run_in_threadpool(counters.flush)
+    except Exception as e:
+        log_event('counter_flush_failed', level=logging.WARNING, error=str(e))
+
+@asynccontextmanager
+async def lifespan(app):
+    counters = get_counter_buffer()
+    flusher = asyncio.create_task(flush_counters(counters)) if counters is not None else None
+    yield
+    if flusher is not None:
+        flusher.cancel()
+        # Increments accepted since the last flush are written before the workers exit
+        await flush_logged(counters)
+    await AsyncDatabase.close_connection()
+
+app = FastAPI(lifespan=lifespan)
+
+# Responses of at least COMPRESSION_MIN_BYTES (default 1024) are compressed
+# for clients that accept it: brotli when the optional brotli-asgi package
+# is installed (gzip for clients without br), else gzip. Low levels, as a
+# page is compressed on every request
+load_dotenv(override=True)
+compression_min_bytes = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=compression_min_bytes)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=compression_min_bytes, compresslevel=5)
+
+# Latency of every request, labelled by its route template so `/users/1`
+# and `/users/2` share one series; unmatched paths are grouped together
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        get_metrics().record_request(request.method, route.path if route is not None else "unmatched",
+                                     status, time.perf_counter() - start)
+
+# Upper bound on the `limit` query parameter of list endpoints
+MAX_PAGE_SIZE = 1000
+
+# Upper bound on the number of ids in one batch request
+MAX_BATCH_IDS = 10000
+
+# Request body of the batch multi-get endpoints
+class BatchRequest(BaseModel):
+    ids: List[int] = Field(..., max_length=MAX_BATCH_IDS)
+
+def missing_ids(ids, rows):
+    return [row_id for row_id, row in zip(ids, rows) if row is None]
+
+# Outcome of each item of a bulk write, in request order
+class BulkItemStatus(BaseModel):
+    index: int
+    status: str  # created, invalid or error
+    detail: Optional[str] = None
+
+class BulkResultModel(BaseModel):
+    written: int
+    failed: int
+    items: List[BulkItemStatus]
+
+async def read_bulk_items(request):
+    """Yield the items of a JSON array body, or the raw lines of an NDJSON body as they arrive."""
+    if not request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        items = json.loads(await request.body())
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array or an application/x-ndjson body")
+        for item in items:
+            yield item
+        return
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+async def bulk_create(table, model, request, on_written=None):
+    """
+    Validate the items of a bulk request and insert them `DEFAULT_BATCH_SIZE` rows per transaction.
+
+    `on_written`, if given, is called with the rows of each batch that were written.
+    """
+    items, rows, indexes = [], [], []
+
+    async def flush():
+        errors = await table.write_many(rows)
+        for index, error in zip(indexes, errors):
+            items.append({"index": index, "status": "error" if error else "created", "detail": error})
+        if on_written is not None:
+            on_written([row for row, error in zip(rows, errors) if error is None])
+        rows.clear()
+        indexes.clear()
+
+    index = 0
+    async for item in read_bulk_items(request):
+        try:
+            if isinstance(item, bytes):
+                item = json.loads(item)
+            rows.append(model.model_validate(item).model_dump())
+            indexes.append(index)
+        except ValidationError as e:
+            detail = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            items.append({"index": index, "status": "invalid", "detail": detail})
+        except ValueError as e:
+            items.append({"index": index, "status": "invalid", "detail": f"Invalid JSON: {str(e)}"})
+        if len(rows) >= DEFAULT_BATCH_SIZE:
+            await flush()
+        index += 1
+    await flush()
+
+    items.sort(key=lambda item: item["index"])
+    written = sum(item["status"] == "created" for item in items)
+    return {"written": written, "failed": len(items) - written, "items": items}
+
+async def page(table, response, limit, after):
+    """Read one keyset page and advertise the cursor of the next one in `X-Next-Cursor`."""
+    rows = await table.read_all(limit, after)
+    if rows and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1][table.primary_key])
+    return rows
+
+def stream_ndjson(table, after, mapper):
+    """Stream every row after `after`, mapped by `mapper` like a page, as newline-delimited JSON from a server-side cursor."""
+    lines = (dumps(mapper(row)) + b"\n" async for row in table.stream(after))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+def trusted(content, response=None):
+    """
+    Send rows mapped by a `RowMapper` without the response_model pass (see
+    database.serialization). Headers set on the endpoint's `response` are
+    copied over, as FastAPI only applies them to responses it builds itself.
+    """
+    return FastJSONResponse(content, headers=response.headers if response is not None else None)
+
+def conditional(request, response, table, rows, mapper):
+    """
+    Send one row, or a page of rows, like `trusted` with an ETag (and the
+    Last-Modified of one row); a 304 without a body when the request's
+    If-None-Match or If-Modified-Since shows the client's copy is current.
+    """
+    single = isinstance(rows, dict)
+    response.headers["ETag"] = etag(table, [rows] if single else rows)
+    # Clients may keep the response but revalidate before every reuse
+    response.headers["Cache-Control"] = "no-cache"
+    modified = last_modified(rows) if single else None
+    if modified is not None:
+        response.headers["Last-Modified"] = format_datetime(modified, usegmt=True)
+    if not_modified(request.headers, response.headers["ETag"], modified):
+        return Response(status_code=304, headers=response.headers)
+    return trusted(mapper(rows) if single else mapper.many(rows), response)
+
+# Connection pool occupancy and checkout waits, for sizing POOL_SIZE/POOL_MAX_OVERFLOW
+@app.get("/metrics/pool")
+async def get_pool_metrics():
+    return {"async": AsyncDatabase.pool_status(), "sync": Database.pool_status()}
+
+# Hit/miss counters of the row cache behind the single-entity GET endpoints
+@app.get("/metrics/cache")
+async def get_cache_metrics():
+    return get_cache().stats.snapshot()
+
+# Pending posts and flush counts of the write-behind engagement counters
+@app.get("/metrics/counters")
+async def get_counter_metrics():
+    counters = get_counter_buffer()
+    return counters.snapshot() if counters is not None else {"write_behind": False}
+
+# Request latency, per-statement query timing and rows, pool and cache
+# counters, in the Prometheus text format for scraping
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    pools = {"async": AsyncDatabase.pool_status(), "sync": Database.pool_status()}
+    return PlainTextResponse(render_prometheus(pools, get_cache().stats.snapshot()),
+                             media_type="text/plain; version=0.0.4")
 
 # todo: hanlding d/t scenarios: checking for existing data to avoid data duplication/collision
 #           :user Table: user_name is unique
@@ -23,77 +246,145 @@ class PostModel(BaseModel):
     media_url: str
     caption: Optional[str] = None
 
+# A stored post, as reads return it
+class StoredPostModel(PostModel):
+    # None for posts imported from captions alone (gold_part_2/Caption.csv)
+    media_url: Optional[str]
+
+post_rows = RowMapper(StoredPostModel)
+
+# User instance
+user_table = AsyncBaseTable(User())
+
 # Post instance
-post_table = Post()
+post_table = AsyncBaseTable(Post())
+
+# Materialized insight tables, kept in step by post and engagement writes
+insight_tables = InsightTables()
+insight_table = AsyncBaseTable(insight_tables)
+
+# Engagement totals of one post, from `post_stats`
+class PostStatsModel(BaseModel):
+    post_id: int
+    user_id: int
+    media_type: str
+    likes_count: int
+    comments_count: int
+    shares_count: int
+    views_count: int
+    interactions: int
+    engagement_rate: Optional[float] = None
+
+post_stats_rows = RowMapper(PostStatsModel)
 
 # --- Endpoints ---
 
-# 1. Retrieve a list of all posts
-@app.get("/posts/", response_model=List[PostModel])
-def get_all_posts():
+# 1. Retrieve a page of posts, or every post as NDJSON with `stream=true`
+@app.get("/posts/", response_model=List[StoredPostModel])
+async def get_all_posts(request: Request, response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                  after: Optional[int] = None, stream: bool = False):
     try:
-        posts = post_table.read_all()
+        if stream:
+            return stream_ndjson(post_table, after, post_rows)
+        posts = await page(post_table, response, limit, after)
         if not posts:
             raise HTTPException(status_code=404, detail="No posts found")
-        return posts
+        return conditional(request, response, post_table, posts, post_rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # 2. Retrieve a single post by its ID
-@app.get("/posts/{post_id}", response_model=PostModel)
-def get_post(post_id: int):
+@app.get("/posts/{post_id}", response_model=StoredPostModel)
+async def get_post(request: Request, response: Response, post_id: int):
     try:
-        post = post_table.read_by_id(post_id)
+        post = await post_table.read_by_id(post_id)
         if not post:
             raise HTTPException(status_code=404, detail=f"Post with ID {post_id} not found")
-        return post
+        return conditional(request, response, post_table, post, post_rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 3. Create a new post
+# Posts in request order (null where missing) plus the ids that do not exist
+class PostBatchModel(BaseModel):
+    items: List[Optional[StoredPostModel]]
+    missing: List[int]
+
+# 3. Retrieve many posts by ID in one query
+@app.post("/posts/batch", response_model=PostBatchModel)
+async def get_posts_batch(batch: BatchRequest):
+    try:
+        posts = await post_table.read_many(batch.ids)
+        return trusted({"items": post_rows.many(posts), "missing": missing_ids(batch.ids, posts)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 4. Create a new post
 @app.post("/posts/", response_model=PostModel)
-def create_post(post: PostModel):
+async def create_post(post: PostModel):
     try:
         # Validate foreign key (user_id exists) internally
-        post_table.write(post.user_id, post.media_type, post.media_url, post.caption)
+        await post_table.write(**post.model_dump())
         return post
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail="Foreign key constraint failed")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 4. Update an existing post by ID
+# 5. Create many posts at once from a JSON array or NDJSON body
+@app.post("/posts/bulk", response_model=BulkResultModel)
+async def create_posts_bulk(request: Request):
+    try:
+        return await bulk_create(post_table, PostModel, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bulk body: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 6. Update an existing post by ID
 @app.put("/posts/{post_id}", response_model=PostModel)
-def update_post(post_id: int, updated_post: PostModel):
+async def update_post(post_id: int, updated_post: PostModel):
     try:
         # Check if the post exists
-        existing_post = post_table.read_by_id(post_id)
+        existing_post = await post_table.read_by_id(post_id)
         if not existing_post:
             raise HTTPException(status_code=404, detail=f"Post with ID {post_id} not found")
 
         # Update the post
-        post_table.update(post_id, updated_post.caption)
+        await post_table.update(post_id, caption=updated_post.caption)
         return updated_post
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail="Foreign key constraint failed")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 5. Delete a post by ID
+# 7. Delete a post by ID
 @app.delete("/posts/{post_id}")
-def delete_post(post_id: int):
+async def delete_post(post_id: int):
     try:
         # Check if the post exists
-        existing_post = post_table.read_by_id(post_id)
+        existing_post = await post_table.read_by_id(post_id)
         if not existing_post:
             raise HTTPException(status_code=404, detail=f"Post with ID {post_id} not found")
 
         # Delete the post
-        post_table.delete(post_id)
+        await post_table.delete(post_id)
         return {"status": "success", "message": f"Post with ID {post_id} has been deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# 8. Engagement totals and rate of a post, read from the materialized insight tables
+@app.get("/posts/{post_id}/stats", response_model=PostStatsModel)
+async def get_post_stats(post_id: int):
+    try:
+        stats = await insight_table.fetch_dicts(insight_tables.post_query(), {"post_id": post_id})
+        if not stats:
+            raise HTTPException(status_code=404, detail=f"No stats for post with ID {post_id}")
+        return trusted(post_stats_rows(stats[0]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 
 # User model for request/response
 class UserModel(BaseModel):
@@ -105,44 +396,66 @@ class UserModel(BaseModel):
     location: str
     is_influential: bool
 
-# User instance
-user_table = User()
+# A stored user, as reads return it
+class StoredUserModel(UserModel):
+    # Not in every imported profile
+    followers_count: Optional[int]
+    following_count: Optional[int]
+    location: Optional[str]
 
+user_rows = RowMapper(StoredUserModel)
 
-# 1. Retrieve a list of all users
-@app.get("/users/", response_model=List[UserModel])
-def get_all_users(limit: Optional[int] = 10):
+# 1. Retrieve a page of users, or every user as NDJSON with `stream=true`
+@app.get("/users/", response_model=List[StoredUserModel])
+async def get_all_users(request: Request, response: Response, limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+                  after: Optional[int] = None, stream: bool = False):
     try:
-        users = user_table.read_all(limit)
+        if stream:
+            return stream_ndjson(user_table, after, user_rows)
+        users = await page(user_table, response, limit, after)
         if not users:
             raise HTTPException(status_code=404, detail="No users found")
-        return users
+        return conditional(request, response, user_table, users, user_rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
 # [urgent] todo: create a postman request for this one
 # 2. Retrieve a single user by ID
-@app.get("/users/{user_id}", response_model=UserModel)
-def get_user(user_id: int):
+@app.get("/users/{user_id}", response_model=StoredUserModel)
+async def get_user(request: Request, response: Response, user_id: int):
     try:
-        user = user_table.read_by_id(user_id)
+        user = await user_table.read_by_id(user_id)
        
         if not user:
             raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
-        return user
+        return conditional(request, response, user_table, user, user_rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Users in request order (null where missing) plus the ids that do not exist
+class UserBatchModel(BaseModel):
+    items: List[Optional[StoredUserModel]]
+    missing: List[int]
+
+# 3. Retrieve many users by ID in one query
+@app.post("/users/batch", response_model=UserBatchModel)
+async def get_users_batch(batch: BatchRequest):
+    try:
+        users = await user_table.read_many(batch.ids)
+        return trusted({"items": user_rows.many(users), "missing": missing_ids(batch.ids, users)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 3. Create a new user
+# 4. Create a new user
 @app.post("/users/", response_model=UserModel)
-def create_user(user: UserModel):
+async def create_user(user: UserModel):
     try:
          # Check if the username already exists
-        if user_table.check_username_exists(user.username):
+        if await user_table.exists('username', user.username):
             raise HTTPException(status_code=400, detail="Username already taken")
         
-        user_table.write(user.user_id,user.username, user.bio, user.followers_count, user.following_count, user.location, user.is_influential)
+        await user_table.write(**user.model_dump())
         return user
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail="User with this username already exists")
@@ -154,17 +467,17 @@ class updateModel(BaseModel):
     bio: Optional[str] = None
 
 
-# 4. Update an existing user by ID
+# 5. Update an existing user by ID
 @app.put("/users/{user_id}", response_model=updateModel)
-def update_user(user_id: int, updated_user: updateModel):
+async def update_user(user_id: int, updated_user: updateModel):
     try:
         # Check if the user exists
-        existing_user = user_table.read_by_id(user_id)
+        existing_user = await user_table.read_by_id(user_id)
         if not existing_user:
             raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
 
         # Update the user
-        user_table.update(user_id, updated_user.username, updated_user.bio)# updated_user.followers_count, updated_user.following_count, updated_user.location, updated_user.is_influential)
+        await user_table.update(user_id, username=updated_user.username, bio=updated_user.bio)# updated_user.followers_count, updated_user.following_count, updated_user.location, updated_user.is_influential)
         return updated_user
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail="Username conflict or invalid update")
@@ -173,21 +486,205 @@ def update_user(user_id: int, updated_user: updateModel):
 
 
 # [urgent] todo: create a postman request for this one
-# 5. Delete a user by ID
+# 6. Delete a user by ID
 @app.delete("/users/{user_id}")
-def delete_user(user_id: int):
+async def delete_user(user_id: int):
     try:
         # Check if the user exists
-        existing_user = user_table.read_by_id(user_id)
+        existing_user = await user_table.read_by_id(user_id)
         if not existing_user:
             raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
 
         # Delete the user
-        user_table.delete(user_id)
+        await user_table.delete(user_id)
         return {"status": "success", "message": f"User with ID {user_id} has been deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Creator metrics with their percentile in each cohort, from the precomputed analytics
+class MetricInsightModel(BaseModel):
+    value: Optional[float] = None
+    percentile: Dict[str, Optional[float]]  # cohort -> share of the cohort at or below `value`
+
+class MediaTypeInsightModel(BaseModel):
+    media_type: Optional[str] = None
+    posts: int
+    avg_likes: Optional[float] = None
+
+class InsightsModel(BaseModel):
+    user_id: int
+    username: Optional[str] = None
+    cohort: str
+    post_count: int
+    metrics: Dict[str, MetricInsightModel]
+    media_types: List[MediaTypeInsightModel]
+    suggestions: List[str]
+
+# Materialized dashboard of a creator: totals, averages, per-media-type averages and top posts
+class MediaTypeStatsModel(BaseModel):
+    media_type: str
+    post_count: int
+    likes_total: int
+    comments_total: int
+    shares_total: int
+    views_total: int
+    avg_likes: Optional[float] = None
+    avg_comments: Optional[float] = None
+    avg_shares: Optional[float] = None
+    avg_views: Optional[float] = None
+
+class UserStatsModel(BaseModel):
+    user_id: int
+    post_count: int
+    likes_total: int
+    comments_total: int
+    shares_total: int
+    views_total: int
+    avg_likes: Optional[float] = None
+    avg_comments: Optional[float] = None
+    avg_shares: Optional[float] = None
+    avg_views: Optional[float] = None
+    engagement_rate: Optional[float] = None
+    media_types: List[MediaTypeStatsModel]
+    top_posts: List[PostStatsModel]
+
+# 7. Dashboard of a creator, read from the materialized insight tables
+@app.get("/users/{user_id}/stats", response_model=UserStatsModel)
+async def get_user_stats(user_id: int, top: int = Query(10, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        params = {"user_id": user_id, "limit": top}
+        stats = dashboard(
+            await insight_table.fetch_dicts(insight_tables.summary_query(), params),
+            await insight_table.fetch_dicts(insight_tables.media_types_query(), params),
+            await insight_table.fetch_dicts(insight_tables.top_posts_query(), params),
+        )
+        if stats is None:
+            raise HTTPException(status_code=404, detail=f"No stats for user with ID {user_id}")
+        return stats
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 8. Engagement rate, cadence and cohort percentiles of a creator
+@app.get("/users/{user_id}/insights", response_model=InsightsModel)
+async def get_user_insights(user_id: int):
+    try:
+        # The first build reads users, posts and engagements, keep it off the event loop
+        analytics = await run_in_threadpool(get_analytics)
+        insights = analytics.insights(user_id)
+        if insights is None:
+            raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+        return insights
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Benchmarks the insights are ranked against, per cohort and metric
+@app.get("/insights/cohorts")
+async def get_cohort_stats():
+    try:
+        return (await run_in_threadpool(get_analytics)).cohort_stats
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Follower graph queries; the graph is built on first use and kept in memory
+async def graph_for(user_id):
+    if not await user_table.read_by_id(user_id):
+        raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
+    # The first build reads both edge tables, keep it off the event loop
+    return await run_in_threadpool(get_graph)
+
+class GraphUsersModel(BaseModel):
+    user_id: int
+    count: int
+    user_ids: List[int]
+
+class ReachModel(BaseModel):
+    user_id: int
+    per_hop: List[int]
+    total: int
+
+class RelatedCreatorModel(BaseModel):
+    user_id: Optional[int] = None  # null for related profiles that are not users
+    username: Optional[str] = None
+    score: int
+    direct: bool
+
+# 9. Users who follow this user and are followed back
+@app.get("/users/{user_id}/graph/mutuals", response_model=GraphUsersModel)
+async def get_user_mutuals(user_id: int, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        mutuals = (await graph_for(user_id)).mutuals(user_id)
+        return {"user_id": user_id, "count": len(mutuals), "user_ids": mutuals[:limit]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 10. Users following both this user and `other_user_id`
+@app.get("/users/{user_id}/graph/common-followers/{other_user_id}", response_model=GraphUsersModel)
+async def get_common_followers(user_id: int, other_user_id: int,
+                               limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        common = (await graph_for(user_id)).common_followers(user_id, other_user_id)
+        return {"user_id": user_id, "count": len(common), "user_ids": common[:limit]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 11. Distinct accounts within `hops` follower hops (followers, their followers, ...)
+@app.get("/users/{user_id}/graph/reach", response_model=ReachModel)
+async def get_user_reach(user_id: int, hops: int = Query(2, ge=1, le=3)):
+    try:
+        return {"user_id": user_id, **(await graph_for(user_id)).reach(user_id, hops)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 12. Related creators, ranked by how many similar creators list them
+@app.get("/users/{user_id}/graph/related", response_model=List[RelatedCreatorModel])
+async def get_related_creators(user_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        return (await graph_for(user_id)).related_creators(user_id, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Tag usage from the in-memory tag index (database.tags)
+TagKind = Literal["hashtag", "mention", "tagged", "coauthor"]
+
+class TagCountModel(BaseModel):
+    kind: TagKind
+    tag: str
+    posts: int
+
+class CollaboratorModel(BaseModel):
+    account: str
+    user_id: Optional[int] = None  # null when the account is not in `users`
+    outgoing: int  # posts of this user naming the account
+    incoming: int  # posts of the account naming this user
+
+# 13. Hashtags, mentions, tagged accounts and co-authors a creator uses most
+@app.get("/users/{user_id}/tags", response_model=List[TagCountModel])
+async def get_user_tags(user_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        return (await run_in_threadpool(get_tag_index)).creator_tags_of(user_id, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 14. Accounts a creator works with: mentioned, tagged or co-authored, in either direction
+@app.get("/users/{user_id}/collaborators", response_model=List[CollaboratorModel])
+async def get_user_collaborators(user_id: int, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        return (await run_in_threadpool(get_tag_index)).collaborators(user_id, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 # Engagement model for request/response
 class EngagementModel(BaseModel):
     post_id: int
@@ -195,133 +692,329 @@ class EngagementModel(BaseModel):
     comments_count: int
     shares_count: int
     video_completion_rate: float
+    views_count: Optional[int] = None
+
+# A stored engagement, as reads return it
+class StoredEngagementModel(EngagementModel):
+    # NULL where the source had no value: imported engagements have no
+    # shares or completion rate, nor do rows created by counter increments
+    likes_count: Optional[int]
+    comments_count: Optional[int]
+    shares_count: Optional[int]
+    video_completion_rate: Optional[float]
+
+engagement_rows = RowMapper(StoredEngagementModel)
+
+# A point-in-time reading of a post's counters, appended to its engagement history
+class EngagementSnapshotModel(BaseModel):
+    post_id: int
+    captured_at: Optional[datetime] = None
+    likes_count: int
+    comments_count: int
+    shares_count: Optional[int] = None
+    video_completion_rate: Optional[float] = None
+
+# Additions to the counters of one post; a like is {"post_id": 1, "likes": 1}
+class EngagementIncrementModel(BaseModel):
+    post_id: int
+    likes: int = 0
+    comments: int = 0
+    shares: int = 0
+    views: int = 0
 
 # Engagement instance
-engagement_table = Engagement()
+engagement_table = AsyncBaseTable(Engagement())
+
+# Engagement history instance (snapshots plus hourly/daily rollups)
+engagement_history = EngagementHistory()
+engagement_history_table = AsyncBaseTable(engagement_history)
+
+async def record_snapshots(snapshots):
+    await engagement_history_table.execute_batch(engagement_history.statements(snapshots))
 
 # --- Endpoints ---
 
-# 1. Retrieve a list of all engagements
-@app.get("/engagements/", response_model=List[EngagementModel])
-def get_all_engagements():
+# 1. Retrieve a page of engagements, or every engagement as NDJSON with `stream=true`
+@app.get("/engagements/", response_model=List[StoredEngagementModel])
+async def get_all_engagements(request: Request, response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        after: Optional[int] = None, stream: bool = False):
     try:
-        engagements = engagement_table.read_all()
+        if stream:
+            return stream_ndjson(engagement_table, after, engagement_rows)
+        engagements = await page(engagement_table, response, limit, after)
         if not engagements:
             raise HTTPException(status_code=404, detail="No engagements found")
-        return engagements
+        return conditional(request, response, engagement_table, engagements, engagement_rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # 2. Retrieve a single engagement by ID
-@app.get("/engagements/{engagement_id}", response_model=EngagementModel)
-def get_engagement(engagement_id: int):
+@app.get("/engagements/{engagement_id}", response_model=StoredEngagementModel)
+async def get_engagement(request: Request, response: Response, engagement_id: int):
     try:
-        engagement = engagement_table.read_by_id(engagement_id)
+        engagement = await engagement_table.read_by_id(engagement_id)
         if not engagement:
             raise HTTPException(status_code=404, detail=f"Engagement with ID {engagement_id} not found")
-        return engagement
+        return conditional(request, response, engagement_table, engagement, engagement_rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # 3. Create a new engagement
 @app.post("/engagements/", response_model=EngagementModel)
-def create_engagement(engagement: EngagementModel):
+async def create_engagement(engagement: EngagementModel):
     try:
         # Validate foreign key (post_id exists) internally
-        engagement_table.write(engagement.post_id, engagement.likes_count, engagement.comments_count, engagement.shares_count, engagement.video_completion_rate)
+        # The engagement's first history snapshot is recorded by the same transaction
+        await engagement_table.write(**engagement.model_dump())
         return engagement
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail="Foreign key constraint failed")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 4. Update an existing engagement by ID
+# 4. Create many engagements at once from a JSON array or NDJSON body
+@app.post("/engagements/bulk", response_model=BulkResultModel)
+async def create_engagements_bulk(request: Request):
+    try:
+        return await bulk_create(engagement_table, EngagementModel, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bulk body: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 5. Append engagement snapshots to the history, upserting on (post_id, captured_at)
+@app.post("/engagements/snapshots")
+async def create_engagement_snapshots(snapshots: List[EngagementSnapshotModel] = Body(..., max_length=MAX_BATCH_IDS)):
+    try:
+        await record_snapshots([snapshot.model_dump() for snapshot in snapshots])
+        return {"status": "success", "recorded": len(snapshots)}
+    except IntegrityError as e:
+        raise HTTPException(status_code=400, detail="Foreign key constraint failed")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 6. Engagement growth of a post per hour or day, read from the rollups
+@app.get("/posts/{post_id}/engagement-history")
+async def get_engagement_history(post_id: int, granularity: Literal["hourly", "daily"] = "daily",
+                                 since: datetime = EPOCH):
+    try:
+        rollups = await engagement_history_table.fetch_dicts(
+            engagement_history.growth_query(granularity), {"post_id": post_id, "since": since}
+        )
+        return with_growth(rollups or [])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 7. Update an existing engagement by ID
 @app.put("/engagements/{engagement_id}", response_model=EngagementModel)
-def update_engagement(engagement_id: int, updated_engagement: EngagementModel):
+async def update_engagement(engagement_id: int, updated_engagement: EngagementModel):
     try:
         # Check if the engagement exists
-        existing_engagement = engagement_table.read_by_id(engagement_id)
+        existing_engagement = await engagement_table.read_by_id(engagement_id)
         if not existing_engagement:
             raise HTTPException(status_code=404, detail=f"Engagement with ID {engagement_id} not found")
 
-        # Update the engagement
-        engagement_table.update(engagement_id, updated_engagement.likes_count, updated_engagement.comments_count)
+        # Update the engagement; the same transaction appends the counts it
+        # now holds to its history (the `Engagement.updated` hook)
+        await engagement_table.update(engagement_id, likes_count=updated_engagement.likes_count,
+                                      comments_count=updated_engagement.comments_count)
         return updated_engagement
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 5. Delete an engagement by ID
+# 8. Delete an engagement by ID
 @app.delete("/engagements/{engagement_id}")
-def delete_engagement(engagement_id: int):
+async def delete_engagement(engagement_id: int):
     try:
         # Check if the engagement exists
-        existing_engagement = engagement_table.read_by_id(engagement_id)
+        existing_engagement = await engagement_table.read_by_id(engagement_id)
         if not existing_engagement:
             raise HTTPException(status_code=404, detail=f"Engagement with ID {engagement_id} not found")
 
         # Delete the engagement
-        engagement_table.delete(engagement_id)
+        await engagement_table.delete(engagement_id)
         return {"status": "success", "message": f"Engagement with ID {engagement_id} has been deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# 9. Add to the counters of posts without a read; with COUNTER_WRITE_BEHIND on the
+# increments are buffered and flushed in batches (see database.counter_buffer)
+@app.post("/engagements/increments")
+async def increment_engagements(response: Response,
+                                increments: List[EngagementIncrementModel] = Body(..., max_length=MAX_BATCH_IDS)):
+    try:
+        counters = get_counter_buffer()
+        if counters is None:
+            await run_in_threadpool(engagement_table.table.apply_increments, [increment.model_dump() for increment in increments])
+            return {"status": "success", "applied": len(increments)}
+        for increment in increments:
+            if counters.add(**increment.model_dump()):
+                counters_full.set()
+        response.status_code = 202
+        return {"status": "accepted", "buffered": len(increments)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 
 # Follower model for request/response
 class FollowerModel(BaseModel):
     user_id: int
     follower_user_id: int
 
+follower_rows = RowMapper(FollowerModel)
+
 # Follower instance
-follower_table = Follower()
+follower_table = AsyncBaseTable(Follower())
+
+def add_follows_to_graph(rows):
+    # Only a graph this process already built needs the new edges
+    graph = loaded_graph()
+    if graph is not None:
+        for row in rows:
+            graph.add_follow(row["user_id"], row["follower_user_id"])
 
 # --- Endpoints ---
 
-# 1. Retrieve a list of all followers
+# 1. Retrieve a page of followers, or every follower as NDJSON with `stream=true`
 @app.get("/followers/", response_model=List[FollowerModel])
-def get_all_followers():
+async def get_all_followers(request: Request, response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                      after: Optional[int] = None, stream: bool = False):
     try:
-        followers = follower_table.read_all()
+        if stream:
+            return stream_ndjson(follower_table, after, follower_rows)
+        followers = await page(follower_table, response, limit, after)
         if not followers:
             raise HTTPException(status_code=404, detail="No followers found")
-        return followers
+        return conditional(request, response, follower_table, followers, follower_rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # 2. Retrieve a single follower by ID
 @app.get("/followers/{follower_id}", response_model=FollowerModel)
-def get_follower(follower_id: int):
+async def get_follower(request: Request, response: Response, follower_id: int):
     try:
-        follower = follower_table.read_by_id(follower_id)
+        follower = await follower_table.read_by_id(follower_id)
         if not follower:
             raise HTTPException(status_code=404, detail=f"Follower with ID {follower_id} not found")
-        return follower
+        return conditional(request, response, follower_table, follower, follower_rows)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 # 3. Create a new follower
 @app.post("/followers/", response_model=FollowerModel)
-def create_follower(follower: FollowerModel):
+async def create_follower(follower: FollowerModel):
     try:
         # Validate foreign key (user_id and follower_user_id exist) internally
-        follower_table.write(follower.user_id, follower.follower_user_id)
+        await follower_table.write(**follower.model_dump())
+        add_follows_to_graph([follower.model_dump()])
         return follower
     except IntegrityError as e:
         raise HTTPException(status_code=400, detail="Foreign key constraint failed")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-# 4. Delete a follower by ID
+# 4. Create many followers at once from a JSON array or NDJSON body
+@app.post("/followers/bulk", response_model=BulkResultModel)
+async def create_followers_bulk(request: Request):
+    try:
+        return await bulk_create(follower_table, FollowerModel, request, on_written=add_follows_to_graph)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bulk body: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 5. Delete a follower by ID
 @app.delete("/followers/{follower_id}")
-def delete_follower(follower_id: int):
+async def delete_follower(follower_id: int):
     try:
         # Check if the follower exists
-        existing_follower = follower_table.read_by_id(follower_id)
+        existing_follower = await follower_table.read_by_id(follower_id)
         if not existing_follower:
             raise HTTPException(status_code=404, detail=f"Follower with ID {follower_id} not found")
 
         # Delete the follower
-        follower_table.delete(follower_id)
+        await follower_table.delete(follower_id)
+
+        # Duplicate rows for the same edge keep it in the graph
+        graph = loaded_graph()
+        edge = {"user_id": existing_follower["user_id"], "follower_user_id": existing_follower["follower_user_id"]}
+        if graph is not None and not await follower_table.fetch_dicts(
+                "SELECT 1 FROM `followers` WHERE `user_id` = :user_id AND `follower_user_id` = :follower_user_id LIMIT 1;",
+                edge):
+            graph.remove_follow(edge["user_id"], edge["follower_user_id"])
         return {"status": "success", "message": f"Follower with ID {follower_id} has been deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+
+# Search hit: a post caption, user profile or comment matching the query
+class SearchHitModel(BaseModel):
+    type: Literal["post", "user", "comment"]
+    id: int
+    user_id: Optional[int] = None
+    text: Optional[str] = None
+    score: float
+
+search_rows = RowMapper(SearchHitModel)
+
+# Search instance
+search = Search()
+search_table = AsyncBaseTable(search)
+
+# Search is ranked, so pages are addressed by position rather than by key
+MAX_SEARCH_OFFSET = 10000
+
+# 1. Ranked keyword, #hashtag and @mention search; `type` narrows it to posts, users or comments
+@app.get("/search", response_model=List[SearchHitModel])
+async def search_content(response: Response, q: str = Query(..., min_length=1, max_length=200),
+                         type: Optional[Literal["post", "user", "comment"]] = None,
+                         limit: int = Query(20, ge=1, le=100),
+                         cursor: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET)):
+    try:
+        params = search.search_params(q, limit, cursor)
+        if params is None:
+            raise HTTPException(status_code=400, detail="The query has no searchable word of 3 or more characters")
+        hits = await search_table.fetch_dicts(search.search_query([type] if type else list(SOURCES), params), params)
+        if hits is None:
+            raise HTTPException(status_code=500, detail="Search failed")
+        if len(hits) == limit:
+            response.headers["X-Next-Cursor"] = str(cursor + limit)
+        return trusted(search_rows.many(hits), response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+class TrendingTagModel(TagCountModel):
+    previous_posts: int  # posts in the window before
+
+class CreatorCountModel(BaseModel):
+    user_id: int
+    posts: int
+
+class TagModel(TagCountModel):
+    creators: List[CreatorCountModel]
+    related_tags: List[TagCountModel]  # hashtags used on the same posts
+
+# 1. Tags on the most posts in the last `days` (up to `until`, default the newest tagged post)
+@app.get("/tags/trending", response_model=List[TrendingTagModel])
+async def get_trending_tags(kind: TagKind = "hashtag", days: float = Query(7, gt=0, le=365),
+                            until: Optional[datetime] = None, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        return (await run_in_threadpool(get_tag_index)).trending(kind, days, until, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+# 2. Post count, top creators and co-occurring hashtags of one tag
+@app.get("/tags/{kind}/{tag}", response_model=TagModel)
+async def get_tag(kind: TagKind, tag: str, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    try:
+        stats = (await run_in_threadpool(get_tag_index)).tag(kind, tag, limit)
+        if stats is None:
+            raise HTTPException(status_code=404, detail=f"No posts with {kind} {tag}")
+        return stats
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
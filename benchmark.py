@@ -0,0 +1,595 @@
+from sqlalchemy import text
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from database.database import Database, DEFAULT_BATCH_SIZE
+from database.engagement import Engagement
+from database.follower import Follower
+from database.post import Post
+from database.schema import migrate, drop_all
+from database.user import User
+import numpy as np
+import argparse
+import asyncio
+import http.client
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+# Reproducible benchmarks of the loaders and the API, emitted as JSON so
+# runs can be compared across commits:
+#
+#   ingest     app.py's CSV loaders and gold_import.py, in rows per second
+#   endpoints  p50/p90/p99 latency and requests per second of every
+#              backend.py route, driven over HTTP against a uvicorn server
+#   memory     peak Python allocations of the list endpoints (one page and
+#              the NDJSON export) at each table size
+#   statements per-call cost of the table statements, built with `text()`
+#              on every call as they used to be and through their cached
+#              constructs, on one connection
+#
+# The ingest and memory suites drop and recreate every table, so the
+# database named in .env must be a scratch one, and --database must repeat
+# its name to confirm it.
+
+SUITES = ('ingest', 'endpoints', 'memory', 'statements')
+
+# Search strings cycled through by the /search benchmark
+SEARCH_QUERIES = ('love', 'travel food', '#photography', '@instagram', '"good morning"')
+
+# Items per request of the /bulk endpoints
+BULK_ITEMS = 10
+
+# Routes that are not part of the API
+EXCLUDED_ROUTES = {'/openapi.json', '/docs', '/docs/oauth2-redirect', '/redoc'}
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _throughput(rows, seconds):
+    return {'rows': rows, 'seconds': round(seconds, 4), 'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None}
+
+
+def reset_schema():
+    drop_all()
+    migrate()
+
+
+# --- Ingest ---
+
+def benchmark_ingest(args):
+    """Rows per second of each app.py loader, the derived-table rebuilds and the gold import."""
+    import app
+    import gold_import
+    from database.insight_tables import InsightTables
+    from database.tags import PostTag
+
+    results = {'app': {}}
+    reset_schema()
+    loaders = {
+        'users': (app.load_users_from_csv, 'data/Dummy_Users_Data.csv'),
+        'posts': (app.load_posts_from_csv, 'data/Dummy_Posts_Data.csv'),
+        'comments': (app.load_comments_from_csv, 'data/Dummy_Comments_Data.csv'),
+        'engagements': (app.load_engagements_from_csv, 'data/Dummy_Engagement_Data.csv'),
+    }
+    for name, (loader, path) in loaders.items():
+        rows, seconds = _timed(loader, path, args.batch_size)
+        results['app'][name] = _throughput(rows, seconds)
+    rows, seconds = _timed(PostTag().rebuild_from_captions, args.batch_size)
+    results['app']['post_tags'] = _throughput(rows or 0, seconds)
+    _, seconds = _timed(InsightTables().rebuild)
+    results['app']['insight_tables'] = {'seconds': round(seconds, 4)}
+
+    if not args.skip_gold:
+        reset_schema()
+        loaded, seconds = _timed(gold_import.import_gold_data, args.gold_root, args.workers,
+                                 batch_size=args.batch_size)
+        results['gold'] = {'workers': args.workers, 'loaders': loaded, **_throughput(sum(loaded.values()), seconds)}
+    return results
+
+
+# --- Endpoints ---
+
+class Fixtures:
+    """Rows created for the write benchmarks, with ids above everything already in the tables."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._next = {}
+
+    def fetch(self, query, params=None):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.execute(text(query), params or {})]
+
+    def sample(self, query, count):
+        rows = self.fetch(query)
+        return random.sample(rows, min(count, len(rows)))
+
+    def ids(self, table, count):
+        if table.table_name not in self._next:
+            self._next[table.table_name] = self.fetch(
+                f"SELECT COALESCE(MAX(`{table.primary_key}`), 0) FROM `{table.table_name}`;"
+            )[0][0] + 1
+        start = self._next[table.table_name]
+        self._next[table.table_name] += count
+        return list(range(start, start + count))
+
+    def create(self, table, rows):
+        table.bulk_write(rows, list(rows[0]), report=False)
+        return [row[table.primary_key] for row in rows]
+
+    def users(self, count):
+        return self.create(User(), [
+            {'user_id': user_id, 'username': f'bench_{user_id}', 'bio': 'benchmark #bench', 'followers_count': 0,
+             'following_count': 0, 'location': 'Nowhere', 'is_influential': False}
+            for user_id in self.ids(User, count)
+        ])
+
+    def posts(self, count, user_id):
+        return self.create(Post(), [
+            {'post_id': post_id, 'user_id': user_id, 'media_type': 'image',
+             'media_url': f'https://example.com/{post_id}.jpg', 'caption': 'benchmark #bench'}
+            for post_id in self.ids(Post, count)
+        ])
+
+    def engagements(self, post_ids):
+        return self.create(Engagement(), [
+            {'engagement_id': engagement_id, 'post_id': post_id, 'likes_count': 1, 'comments_count': 0,
+             'shares_count': 0, 'video_completion_rate': 0.0}
+            for engagement_id, post_id in zip(self.ids(Engagement, len(post_ids)), post_ids)
+        ])
+
+    def follows(self, pairs):
+        return self.create(Follower(), [
+            {'follower_id': follower_id, 'user_id': user_id, 'follower_user_id': follower_user_id}
+            for follower_id, (user_id, follower_user_id) in zip(self.ids(Follower, len(pairs)), pairs)
+        ])
+
+
+def _cycle(values, count):
+    return list(itertools.islice(itertools.cycle(values), count))
+
+
+def endpoint_requests(fixtures, count):
+    """
+    `count` requests for every benchmarked route, built before any is timed.
+
+    Returns:
+    dict: "METHOD /route/{param}" -> list of (method, url, JSON body or None),
+    or -> a string saying why the route could not be benchmarked.
+    """
+    users = [row[0] for row in fixtures.sample(
+        "SELECT DISTINCT `user_id` FROM `posts` WHERE `user_id` IS NOT NULL;", count)]
+    if not users:
+        raise SystemExit("The endpoint benchmark needs posts in the database; run the ingest suite first.")
+    posts = [row[0] for row in fixtures.sample("SELECT `post_id` FROM `posts`;", count)]
+    engagements = [row[0] for row in fixtures.sample("SELECT `engagement_id` FROM `engagements`;", count)]
+    followers = [row[0] for row in fixtures.sample("SELECT `follower_id` FROM `followers`;", count)]
+    tags = fixtures.sample("SELECT DISTINCT `kind`, `tag` FROM `post_tags`;", count)
+    owner = users[0]
+
+    # Targets the write routes create, change or delete, so no request depends on another
+    new_users = fixtures.ids(User, count)
+    updated_users = fixtures.users(count)
+    deleted_users = fixtures.users(count)
+    updated_posts = fixtures.posts(count, owner)
+    deleted_posts = fixtures.posts(count, owner)
+    unengaged_posts = fixtures.posts(count * (1 + BULK_ITEMS), owner)
+    engaged_posts = fixtures.posts(count * 2, owner)
+    engagement_rows = list(zip(fixtures.engagements(engaged_posts), engaged_posts))
+    deleted_follows = fixtures.follows([(user_id, owner) for user_id in _cycle(users, count)])
+
+    def post_body(user_id, i):
+        return {'user_id': user_id, 'media_type': 'image', 'media_url': f'https://example.com/bench/{i}.jpg',
+                'caption': f'benchmark post {i} #bench'}
+
+    def engagement_body(post_id, i):
+        return {'post_id': post_id, 'likes_count': i, 'comments_count': 1, 'shares_count': 1,
+                'video_completion_rate': 0.5, 'views_count': 10 * i}
+
+    def gets(path, values):
+        return [('GET', path.format(value), None) for value in _cycle(values, count)] if values else "no rows to sample"
+
+    def user_gets(suffix):
+        return gets('/users/{}' + suffix, users)
+
+    requests = {
+        'GET /metrics/pool': gets('/metrics/pool', [None]),
+        'GET /metrics/cache': gets('/metrics/cache', [None]),
+        'GET /metrics/counters': gets('/metrics/counters', [None]),
+        'GET /metrics': gets('/metrics', [None]),
+        'GET /posts/': gets('/posts/?limit=100', [None]),
+        'GET /posts/{post_id}': gets('/posts/{}', posts),
+        'POST /posts/batch': [('POST', '/posts/batch', {'ids': random.sample(posts, min(100, len(posts)))})
+                              for _ in range(count)],
+        'POST /posts/': [('POST', '/posts/', post_body(owner, i)) for i in range(count)],
+        'POST /posts/bulk': [('POST', '/posts/bulk', [post_body(owner, i * BULK_ITEMS + j) for j in range(BULK_ITEMS)])
+                             for i in range(count)],
+        'PUT /posts/{post_id}': [('PUT', f'/posts/{post_id}', post_body(owner, i))
+                                 for i, post_id in enumerate(updated_posts)],
+        'DELETE /posts/{post_id}': [('DELETE', f'/posts/{post_id}', None) for post_id in deleted_posts],
+        'GET /posts/{post_id}/stats': gets('/posts/{}/stats', posts),
+        'GET /users/': gets('/users/?limit=100', [None]),
+        'GET /users/{user_id}': user_gets(''),
+        'POST /users/batch': [('POST', '/users/batch', {'ids': random.sample(users, min(100, len(users)))})
+                              for _ in range(count)],
+        'POST /users/': [('POST', '/users/', {
+            'user_id': user_id, 'username': f'bench_new_{user_id}', 'bio': 'benchmark', 'followers_count': 0,
+            'following_count': 0, 'location': 'Nowhere', 'is_influential': False,
+        }) for user_id in new_users],
+        'PUT /users/{user_id}': [('PUT', f'/users/{user_id}', {'username': f'bench_renamed_{user_id}', 'bio': 'updated'})
+                                 for user_id in updated_users],
+        'DELETE /users/{user_id}': [('DELETE', f'/users/{user_id}', None) for user_id in deleted_users],
+        'GET /users/{user_id}/stats': user_gets('/stats'),
+        'GET /users/{user_id}/insights': user_gets('/insights'),
+        'GET /insights/cohorts': gets('/insights/cohorts', [None]),
+        'GET /users/{user_id}/graph/mutuals': user_gets('/graph/mutuals'),
+        'GET /users/{user_id}/graph/common-followers/{other_user_id}': [
+            ('GET', f'/users/{user_id}/graph/common-followers/{other}', None)
+            for user_id, other in zip(_cycle(users, count), _cycle(users[1:] or users, count))
+        ],
+        'GET /users/{user_id}/graph/reach': user_gets('/graph/reach?hops=2'),
+        'GET /users/{user_id}/graph/related': user_gets('/graph/related'),
+        'GET /users/{user_id}/tags': user_gets('/tags'),
+        'GET /users/{user_id}/collaborators': user_gets('/collaborators'),
+        'GET /engagements/': gets('/engagements/?limit=100', [None]),
+        'GET /engagements/{engagement_id}': gets('/engagements/{}', engagements),
+        'POST /engagements/': [('POST', '/engagements/', engagement_body(post_id, i))
+                               for i, post_id in enumerate(unengaged_posts[:count])],
+        'POST /engagements/bulk': [
+            ('POST', '/engagements/bulk', [engagement_body(post_id, i) for post_id in
+                                           unengaged_posts[count + i * BULK_ITEMS:count + (i + 1) * BULK_ITEMS]])
+            for i in range(count)
+        ],
+        'POST /engagements/snapshots': [('POST', '/engagements/snapshots', [
+            {'post_id': post_id, 'likes_count': i, 'comments_count': 1}
+        ]) for i, post_id in enumerate(_cycle(posts, count))],
+        'GET /posts/{post_id}/engagement-history': gets('/posts/{}/engagement-history', posts),
+        'PUT /engagements/{engagement_id}': [('PUT', f'/engagements/{engagement_id}', engagement_body(post_id, i))
+                                             for i, (engagement_id, post_id) in enumerate(engagement_rows[:count])],
+        'DELETE /engagements/{engagement_id}': [('DELETE', f'/engagements/{engagement_id}', None)
+                                                for engagement_id, _ in engagement_rows[count:]],
+        'POST /engagements/increments': [('POST', '/engagements/increments', [{'post_id': post_id, 'likes': 1, 'views': 1}])
+                                         for post_id in _cycle(posts, count)],
+        'GET /followers/': gets('/followers/?limit=100', [None]),
+        'GET /followers/{follower_id}': gets('/followers/{}', followers),
+        'POST /followers/': [('POST', '/followers/', {'user_id': user_id, 'follower_user_id': owner})
+                             for user_id in _cycle(users, count)],
+        'POST /followers/bulk': [('POST', '/followers/bulk', [{'user_id': user_id, 'follower_user_id': owner}
+                                                              for user_id in _cycle(users, BULK_ITEMS)])
+                                 for _ in range(count)],
+        'DELETE /followers/{follower_id}': [('DELETE', f'/followers/{follower_id}', None)
+                                            for follower_id in deleted_follows],
+        'GET /search': [('GET', '/search?' + 'q=' + urllib.parse.quote(q), None)
+                        for q in _cycle(SEARCH_QUERIES, count)],
+        'GET /tags/trending': gets('/tags/trending?kind=hashtag', [None]),
+        'GET /tags/{kind}/{tag}': [('GET', f'/tags/{kind}/{urllib.parse.quote(tag)}', None)
+                                   for kind, tag in _cycle(tags, count)] if tags else "no tags to sample",
+    }
+    return requests
+
+
+class Server:
+    """backend.py under uvicorn in a child process."""
+
+    def __init__(self, port, workers):
+        self.port = port
+        self.process = subprocess.Popen([
+            sys.executable, '-m', 'uvicorn', 'backend:app', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--log-level', 'warning',
+        ])
+
+    def wait_until_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit("The API server exited during startup.")
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=1)
+                conn.request('GET', '/metrics/pool')
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise SystemExit("The API server did not start in time.")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def run_load(port, requests, concurrency):
+    """
+    Send `requests` with `concurrency` keep-alive connections.
+
+    Returns:
+    dict: latency percentiles in milliseconds, requests per second and status counts.
+    """
+    local = threading.local()
+
+    def send(request):
+        method, url, body = request
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        start = time.perf_counter()
+        try:
+            conn.request(method, url, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            local.conn = None
+            status = 0
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, requests))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([seconds for seconds, _ in results]) * 1000
+    statuses = {}
+    for _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+    return {
+        'requests': len(results),
+        'rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(float(p50), 3),
+        'p90_ms': round(float(p90), 3),
+        'p99_ms': round(float(p99), 3),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'statuses': statuses,
+    }
+
+
+def benchmark_endpoints(args):
+    """Latency and throughput of every route of backend.py under `args.concurrency` concurrent clients."""
+    from backend import app
+
+    fixtures = Fixtures(Database.get_engine())
+    planned = endpoint_requests(fixtures, args.warmup + args.requests)
+    routes = {
+        f'{method} {route.path}' for route in app.routes if route.path not in EXCLUDED_ROUTES
+        for method in getattr(route, 'methods', ()) if method != 'HEAD'
+    }
+
+    results = {}
+    server = Server(args.port, args.server_workers)
+    try:
+        server.wait_until_ready()
+        for name in sorted(routes):
+            requests = planned.get(name, "no request template; add one to endpoint_requests")
+            if isinstance(requests, str):
+                results[name] = {'skipped': requests}
+                continue
+            # Untimed requests build the lazily loaded indexes (graph, analytics, tags)
+            run_load(args.port, requests[:args.warmup], 1)
+            results[name] = run_load(args.port, requests[args.warmup:], args.concurrency)
+            print(f"{name}: p50 {results[name]['p50_ms']}ms, p99 {results[name]['p99_ms']}ms, {results[name]['rps']} rps")
+    finally:
+        server.stop()
+    return {'concurrency': args.concurrency, 'server_workers': args.server_workers, 'routes': results}
+
+
+# --- Memory ---
+
+async def asgi_get(app, path, query=''):
+    """
+    Run one GET through the ASGI app in this process, discarding the body.
+
+    Returns:
+    tuple: (status, body bytes)
+    """
+    status, size = None, 0
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client never disconnects; the app cancels this once it is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status, size
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            size += len(message.get('body', b''))
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'benchmark')], 'client': ('127.0.0.1', 0), 'server': ('benchmark', 80),
+    }
+    await app(scope, receive, send)
+    return status, size
+
+
+def seed(fixtures, users, batch_size):
+    """Grow the users and posts tables to `users` rows each, one post per user."""
+    have = fixtures.fetch("SELECT COUNT(*) FROM `users`;")[0][0]
+    user_table, post_table = User(), Post()
+    for start in range(have + 1, users + 1, batch_size):
+        ids = range(start, min(start + batch_size, users + 1))
+        user_table.bulk_write([
+            {'user_id': user_id, 'username': f'bench_{user_id}', 'bio': 'benchmark #bench', 'followers_count': user_id,
+             'following_count': 0, 'location': 'Nowhere', 'is_influential': user_id % 100 == 0}
+            for user_id in ids
+        ], batch_size=batch_size, report=False)
+        post_table.bulk_write([
+            {'post_id': user_id, 'user_id': user_id, 'media_type': 'image',
+             'media_url': f'https://example.com/{user_id}.jpg', 'caption': 'benchmark #bench'}
+            for user_id in ids
+        ], ['post_id', 'user_id', 'media_type', 'media_url', 'caption'], batch_size, report=False)
+
+
+def benchmark_memory(args):
+    """Peak Python allocations while serving one page and the full NDJSON export of `users` and `posts`."""
+    from backend import app
+    from database.async_database import AsyncDatabase
+
+    async def measure(path, query):
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        status, size = await asgi_get(app, path, query)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'status': status, 'bytes_sent': size, 'peak_alloc_bytes': peak, 'seconds': round(elapsed, 4)}
+
+    async def measure_sizes():
+        fixtures = Fixtures(Database.get_engine())
+        results = {}
+        for rows in sorted(args.memory_sizes):
+            seed(fixtures, rows, args.batch_size)
+            results[str(rows)] = {}
+            for path in ('/users/', '/posts/'):
+                results[str(rows)][f'GET {path}?limit=1000'] = await measure(path, 'limit=1000')
+                results[str(rows)][f'GET {path}?stream=true'] = await measure(path, 'stream=true')
+            print(f"Measured list endpoints at {rows} rows.")
+        await AsyncDatabase.close_connection()
+        return results
+
+    reset_schema()
+    return asyncio.run(measure_sizes())
+
+
+# --- Statements ---
+
+def _construct(query):
+    return text(query) if isinstance(query, str) else query
+
+
+def _per_call(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return round((time.perf_counter() - start) / calls * 1e6, 2)
+
+
+def benchmark_statements(args):
+    """Microseconds per call of the hot table statements, rebuilt on every call versus cached, alone and executed."""
+    fixtures = Fixtures(Database.get_engine())
+    user_id = fixtures.users(1)[0]
+    post_id = fixtures.posts(1, user_id)[0]
+    user_ids = [row[0] for row in fixtures.sample("SELECT `user_id` FROM `users` LIMIT 1000;", 100)]
+    user_table, post_table = User(), Post()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    cases = {
+        'user by id': (user_table, '_by_id_query', (), {'row_id': user_id}),
+        'users page': (user_table, '_page_query', (True, True), {'after': 0, 'limit': 100}),
+        'users by ids': (user_table, '_by_ids_query', (), {'row_ids': user_ids}),
+        'username lookup': (user_table, '_exists_query', ('username',), {'value': f'bench_{user_id}'}),
+        'post update': (post_table, '_update_query', (['caption'],),
+                        {'row_id': post_id, 'caption': 'benchmark', 'updated_at': now}),
+    }
+
+    results = {}
+    with Database.get_engine().connect() as conn:
+        def execute(construct, params):
+            result = conn.execute(construct, params)
+            if result.returns_rows:
+                result.all()
+
+        for name, (table, builder, builder_args, params) in cases.items():
+            build = getattr(type(table), builder).__wrapped__
+            variants = {
+                # What every call did before: format the SQL and parse it with text()
+                'per_call': lambda: _construct(build(table, *builder_args)),
+                'cached': lambda: getattr(table, builder)(*builder_args),
+            }
+            results[name] = {'build_us': {}, 'execute_us': {}}
+            for variant, construct in variants.items():
+                # Warms SQLAlchemy's compiled cache and the dialect's rewrite cache
+                execute(construct(), params)
+                results[name]['build_us'][variant] = _per_call(construct, args.statement_calls)
+                results[name]['execute_us'][variant] = _per_call(lambda: execute(construct(), params), args.statement_calls)
+        # The updates are not kept
+        conn.rollback()
+    return results
+
+
+# --- Entry point ---
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    engine = Database.get_engine()
+    with engine.connect():
+        server_version = '.'.join(map(str, engine.dialect.server_version_info or ()))
+    return {
+        'commit': commit,
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': {'dialect': engine.dialect.name, 'version': server_version},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the loaders and the API; prints JSON results.")
+    parser.add_argument('--database', required=True,
+                        help="scratch database configured in .env (SQLITE_PATH on SQLite); its tables are dropped")
+    parser.add_argument('--suite', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--output', help="write the results to this file instead of stdout")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the sampled ids")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--gold-root', default='.', help="directory containing gold_part_1/ and gold_part_2/")
+    parser.add_argument('--workers', type=int, default=None, help="gold import worker processes per wave")
+    parser.add_argument('--skip-gold', action='store_true', help="only benchmark the app.py loaders")
+    parser.add_argument('--requests', type=int, default=500, help="timed requests per route")
+    parser.add_argument('--warmup', type=int, default=5, help="untimed requests per route")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--server-workers', type=int, default=1)
+    parser.add_argument('--memory-sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--statement-calls', type=int, default=10000, help="timed calls per statement and variant")
+    args = parser.parse_args()
+
+    database = Database()
+    configured = database.sqlite_path if database.dialect.name == 'sqlite' else database.database
+    if args.database != configured:
+        parser.error(f"--database {args.database!r} does not match the configured database {configured!r}")
+    random.seed(args.seed)
+
+    results = {'environment': environment(), 'args': vars(args)}
+    suites = {
+        'ingest': benchmark_ingest, 'endpoints': benchmark_endpoints, 'memory': benchmark_memory,
+        'statements': benchmark_statements,
+    }
+    for suite in SUITES:
+        if suite in args.suite:
+            results[suite], seconds = _timed(suites[suite], args)
+            results[suite]['seconds'] = round(seconds, 2)
+
+    output = json.dumps(results, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    Database.close_connection()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+from sqlalchemy.exc import SQLAlchemyError
+from dotenv import load_dotenv
+from .database import Database, sql
+import numpy as np
+import pandas as pd
+import os
+import threading
+import time
+
+# Creator benchmarking: every creator's engagement rate and posting cadence,
+# ranked against the influential (verified) cohort and everyone else.
+#
+# users, posts and engagements are loaded once into pandas frames and every
+# metric is computed for all creators at once with groupby/searchsorted, so
+# an insights request is a lookup in precomputed arrays. ANALYTICS_MAX_AGE
+# (seconds, default 900) bounds how stale the figures may get.
+
+# Metrics ranked against the cohorts, and whether higher is better
+METRICS = {
+    'engagement_rate': True,
+    'avg_likes': True,
+    'avg_comments': True,
+    'avg_views': True,
+    'posts_per_week': True,
+    'median_days_between_posts': False,
+}
+
+COHORTS = ('influential', 'others')
+
+# Percentiles reported for each cohort and metric
+COHORT_PERCENTILES = (25, 50, 75, 90)
+
+
+def _creator_metrics(users, posts):
+    """One row per user with the `METRICS` columns, from users and posts joined to their engagement."""
+    posts = posts.sort_values(['user_id', 'timestamp'])
+    posts['interactions'] = posts[['likes_count', 'comments_count', 'shares_count']].fillna(0).sum(axis=1)
+    followers = posts['user_id'].map(users.set_index('user_id')['followers_count']).astype('float64')
+    posts['engagement_rate'] = posts['interactions'] / followers.where(followers > 0)
+    posts['days_since_previous'] = posts.groupby('user_id')['timestamp'].diff().dt.total_seconds() / 86400
+
+    by_user = posts.groupby('user_id')
+    metrics = pd.DataFrame({
+        'post_count': by_user.size(),
+        'engagement_rate': by_user['engagement_rate'].mean(),
+        'avg_likes': by_user['likes_count'].mean(),
+        'avg_comments': by_user['comments_count'].mean(),
+        'avg_views': by_user['views_count'].mean(),
+        'median_days_between_posts': by_user['days_since_previous'].median(),
+    })
+    # A creator with a single post has posted for at least a week
+    active_weeks = (by_user['timestamp'].max() - by_user['timestamp'].min()).dt.total_seconds() / (7 * 86400)
+    metrics['posts_per_week'] = metrics['post_count'] / active_weeks.clip(lower=1)
+
+    metrics = users.set_index('user_id')[['username', 'is_influential']].join(metrics, how='left')
+    metrics['post_count'] = metrics['post_count'].fillna(0).astype('int64')
+    metrics['is_influential'] = metrics['is_influential'].fillna(False).astype(bool)
+    return metrics
+
+
+class CreatorAnalytics:
+    """
+    Precomputed creator metrics with percentile ranks against each cohort.
+
+    `percentiles[cohort][metric]` holds, for every user, the share of the
+    cohort with a value at or below theirs; `cohort_stats` holds the cohort
+    distributions the ranks come from.
+    """
+
+    def __init__(self, users, posts):
+        """
+        Args:
+        users (DataFrame): `user_id`, `username`, `followers_count`, `is_influential`.
+        posts (DataFrame): `post_id`, `user_id`, `media_type`, `timestamp` (datetime64),
+            plus the post's `likes_count`, `comments_count`, `shares_count`, `views_count`.
+        """
+        self.metrics = _creator_metrics(users, posts)
+        self.media_types = (
+            posts.groupby(['user_id', 'media_type'])['likes_count'].agg(['size', 'mean'])
+            .rename(columns={'size': 'posts', 'mean': 'avg_likes'})
+        )
+        self._row = {user_id: row for row, user_id in enumerate(self.metrics.index)}
+
+        cohort_masks = {
+            'influential': self.metrics['is_influential'].to_numpy(),
+            'others': ~self.metrics['is_influential'].to_numpy(),
+        }
+        self.cohort_stats = {}
+        self.percentiles = {}
+        for cohort, mask in cohort_masks.items():
+            self.cohort_stats[cohort] = {'creators': int(mask.sum())}
+            self.percentiles[cohort] = {}
+            for metric in METRICS:
+                values = self.metrics[metric].to_numpy(dtype='float64')
+                cohort_values = np.sort(values[mask & ~np.isnan(values)])
+                self.cohort_stats[cohort][metric] = (
+                    dict(zip((f'p{p}' for p in COHORT_PERCENTILES),
+                             np.percentile(cohort_values, COHORT_PERCENTILES).tolist()))
+                    if len(cohort_values) else None
+                )
+                # Every user's rank in the cohort in one searchsorted call
+                ranks = np.searchsorted(cohort_values, values, side='right') / max(len(cohort_values), 1) * 100
+                self.percentiles[cohort][metric] = np.where(
+                    np.isnan(values) | (len(cohort_values) == 0), np.nan, ranks
+                )
+
+    @classmethod
+    def load(cls, engine=None):
+        """Build the analytics from the `users`, `posts` and `engagements` tables."""
+        engine = engine or Database.get_engine()
+        try:
+            with engine.connect() as conn:
+                users = pd.read_sql(
+                    sql("SELECT `user_id`, `username`, `followers_count`, `is_influential` FROM `users`;"),
+                    conn, dtype={'user_id': 'int64', 'followers_count': 'Float64', 'is_influential': 'boolean'}
+                )
+                posts = pd.read_sql(
+                    sql("""
+                    SELECT `p`.`post_id`, `p`.`user_id`, `p`.`media_type`, `p`.`timestamp`,
+                           `e`.`likes_count`, `e`.`comments_count`, `e`.`shares_count`, `e`.`views_count`
+                    FROM `posts` AS `p`
+                    LEFT JOIN `engagements` AS `e` ON `e`.`post_id` = `p`.`post_id`
+                    WHERE `p`.`user_id` IS NOT NULL;
+                    """),
+                    conn, parse_dates=['timestamp'],
+                    dtype={'likes_count': 'float64', 'comments_count': 'float64',
+                           'shares_count': 'float64', 'views_count': 'float64'}
+                )
+        except SQLAlchemyError as e:
+            print(f"Error loading creator analytics: {e}")
+            raise
+        return cls(users, posts)
+
+    def insights(self, user_id):
+        """
+        Metrics of one creator, its percentile in each cohort and suggestions
+        where it trails the influential median. None if the user is unknown.
+        """
+        row = self._row.get(user_id)
+        if row is None:
+            return None
+        creator = self.metrics.iloc[row]
+
+        metrics, suggestions = {}, []
+        for metric, higher_is_better in METRICS.items():
+            value = _number(creator[metric])
+            metrics[metric] = {
+                'value': value,
+                'percentile': {cohort: _number(self.percentiles[cohort][metric][row]) for cohort in COHORTS},
+            }
+            benchmark = self.cohort_stats['influential'][metric]
+            if value is None or benchmark is None:
+                continue
+            median = benchmark['p50']
+            if (value < median) if higher_is_better else (value > median):
+                suggestions.append(
+                    f"{metric.replace('_', ' ').capitalize()} is {value:.4g} against an influential median of {median:.4g}."
+                )
+
+        media_types = []
+        if user_id in self.media_types.index.get_level_values(0):
+            for media_type, stats in self.media_types.loc[user_id].iterrows():
+                media_types.append({'media_type': media_type, 'posts': int(stats['posts']),
+                                    'avg_likes': _number(stats['avg_likes'])})
+            media_types.sort(key=lambda item: item['avg_likes'] or 0, reverse=True)
+            if len(media_types) > 1:
+                suggestions.append(f"{media_types[0]['media_type'].capitalize()} posts earn the most likes on average.")
+
+        return {
+            'user_id': user_id,
+            'username': creator['username'] if not pd.isna(creator['username']) else None,
+            'cohort': 'influential' if creator['is_influential'] else 'others',
+            'post_count': int(creator['post_count']),
+            'metrics': metrics,
+            'media_types': media_types,
+            'suggestions': suggestions,
+        }
+
+
+def _number(value):
+    return None if pd.isna(value) else float(value)
+
+
+_analytics = None
+_built_at = 0.0
+_max_age = None
+_build_lock = threading.Lock()
+
+def get_analytics():
+    """The process-wide analytics, (re)built from the database when missing or older than ANALYTICS_MAX_AGE."""
+    global _analytics, _built_at, _max_age
+    with _build_lock:
+        if _max_age is None:
+            load_dotenv(override=True)
+            _max_age = float(os.getenv('ANALYTICS_MAX_AGE', 900))
+        if _analytics is None or time.monotonic() - _built_at > _max_age:
+            start = time.perf_counter()
+            _analytics = CreatorAnalytics.load()
+            _built_at = time.monotonic()
+            print(f"Built creator analytics ({len(_analytics.metrics)} users) in {time.perf_counter() - start:.2f}s.")
+    return _analytics
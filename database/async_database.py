@@ -0,0 +1,225 @@
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from contextlib import asynccontextmanager
+from .database import Database, PoolMetrics, DEFAULT_BATCH_SIZE, DEFAULT_PAGE_SIZE, sql
+from .cache import get_cache
+from .metrics import instrument_engine
+import time
+
+class AsyncDatabase(Database):
+    """Same settings as `Database`, on an asyncio engine (aiomysql, psycopg or aiosqlite) for the API."""
+    _instance = None
+    _engine = None
+    pool_metrics = PoolMetrics()
+
+    def connect(self):
+        try:
+            AsyncDatabase._engine = create_async_engine(self.dialect.url(self, asynchronous=True), **self.pool_options)
+            self.dialect.configure(AsyncDatabase._engine)
+            instrument_engine(AsyncDatabase._engine)
+        except SQLAlchemyError as e:
+            print(f"Error connecting to the database: {e}")
+            exit(0)
+
+    @classmethod
+    async def close_connection(cls):
+        if cls._engine is not None:
+            await cls._engine.dispose()
+            cls._engine = None
+            print("Async connection closed.")
+
+class AsyncBaseTable:
+    """
+    Non-blocking CRUD on one table, for `async def` endpoints.
+
+    Wraps a sync table object (User, Post, ...) for its table name, primary
+    key and columns; the sync API stays available for app.py scripts.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.table_name = table.table_name
+        self.primary_key = table.primary_key
+        self.columns = table.columns
+        self.engine = AsyncDatabase.get_engine()
+
+    @asynccontextmanager
+    async def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = await self.engine.connect()
+        except PoolTimeoutError:
+            AsyncDatabase.pool_metrics.record_timeout()
+            raise
+        AsyncDatabase.pool_metrics.record_wait(time.perf_counter() - start)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    @asynccontextmanager
+    async def begin(self):
+        async with self.connect() as conn, conn.begin():
+            yield conn
+
+    async def execute_query(self, query, params=None):
+        try:
+            async with self.begin() as conn:
+                await conn.execute(sql(query), params or {})
+        except SQLAlchemyError as e:
+            print(f"Error executing query: {e}")
+            raise
+
+    async def fetch_dicts(self, query, params=None):
+        try:
+            async with self.begin() as conn:
+                result = await conn.execute(sql(query), params or {})
+                return [dict(row) for row in result.mappings()]
+        except SQLAlchemyError as e:
+            print(f"Error fetching query: {e}")
+            return None
+
+    async def execute_batch(self, statements):
+        """Run (query, rows) pairs in one transaction, each as a single executemany."""
+        try:
+            async with self.begin() as conn:
+                for query, rows in statements:
+                    await conn.execute(sql(query), rows)
+        except SQLAlchemyError as e:
+            print(f"Error executing query: {e}")
+            raise
+
+    async def read_all(self, limit=DEFAULT_PAGE_SIZE, after=None):
+        query = self.table._page_query(after is not None, limit is not None)
+        return await self.fetch_dicts(query, {'after': after, 'limit': limit})
+
+    async def stream(self, after=None, batch_size=DEFAULT_BATCH_SIZE):
+        async with self.connect() as conn:
+            result = await conn.stream(
+                self.table._page_query(after is not None).execution_options(yield_per=batch_size), {'after': after}
+            )
+            async for row in result.mappings():
+                yield dict(row)
+
+    async def read_by_id(self, row_id):
+        cache = get_cache()
+        key = self.table.cache_key(row_id)
+        row = cache.get(key)
+        if row is None:
+            rows = await self.fetch_dicts(self.table._by_id_query(), {'row_id': row_id})
+            row = rows[0] if rows else None
+            if row is not None:
+                cache.set(key, row)
+        return row
+
+    async def read_many(self, row_ids):
+        cache = get_cache()
+        found = {}
+        for row_id in row_ids:
+            row = cache.get(self.table.cache_key(row_id))
+            if row is not None:
+                found[row_id] = row
+
+        for chunk in self.table._id_chunks([row_id for row_id in row_ids if row_id not in found]):
+            for row in await self.fetch_dicts(self.table._by_ids_query(), {'row_ids': chunk}) or []:
+                found[row[self.primary_key]] = row
+                cache.set(self.table.cache_key(row[self.primary_key]), row)
+
+        return [found.get(row_id) for row_id in row_ids]
+
+    async def exists(self, column, value):
+        return bool(await self.fetch_dicts(self.table._exists_query(column), {'value': value}))
+
+    async def execute_statements(self, conn, statements):
+        for query, rows in statements:
+            if rows:
+                await conn.execute(sql(query), rows)
+
+    async def execute_id_statements(self, conn, columns):
+        for statement in self.table.dialect.inserted_id_statements(self.table_name, self.primary_key, columns):
+            await conn.execute(sql(statement))
+
+    async def write(self, **values):
+        values = self.table.stamp(values)
+        columns = [column for column in self.columns if column in values]
+        try:
+            async with self.begin() as conn:
+                await conn.execute(self.table._insert_query(columns), values)
+                await self.execute_statements(conn, self.table.inserted([values]))
+                await self.execute_id_statements(conn, columns)
+        except SQLAlchemyError as e:
+            print(f"Error executing query: {e}")
+            raise
+        if self.primary_key in values:
+            self.table.invalidate(values[self.primary_key])
+
+    async def write_many(self, rows):
+        """
+        Insert rows in a single transaction with one multi-row INSERT, or
+        one INSERT per row for a table with `hooks_read_last_insert_id`
+        when the rows have no ids.
+
+        If the batch fails, it is retried row by row, each inside its own
+        savepoint, so only the offending rows are rejected.
+
+        Returns:
+        list: One entry per row, None if it was written, else the error message.
+        """
+        if not rows:
+            return []
+        rows = [self.table.stamp(row) for row in rows]
+        columns = [column for column in self.columns if column in rows[0]]
+        query = self.table._insert_query(columns)
+        try:
+            async with self.begin() as conn:
+                if self.table.hooks_read_last_insert_id and self.primary_key not in columns:
+                    for row in rows:
+                        await conn.execute(query, row)
+                        await self.execute_statements(conn, self.table.inserted([row]))
+                else:
+                    await conn.execute(query, rows)
+                    await self.execute_statements(conn, self.table.inserted(rows))
+                await self.execute_id_statements(conn, columns)
+            errors = [None] * len(rows)
+        except SQLAlchemyError:
+            errors = []
+            async with self.begin() as conn:
+                for row in rows:
+                    try:
+                        async with conn.begin_nested():
+                            await conn.execute(query, row)
+                            await self.execute_statements(conn, self.table.inserted([row]))
+                        errors.append(None)
+                    except SQLAlchemyError as e:
+                        errors.append(str(getattr(e, 'orig', None) or e))
+                await self.execute_id_statements(conn, columns)
+
+        for row, error in zip(rows, errors):
+            if error is None and self.primary_key in row:
+                self.table.invalidate(row[self.primary_key])
+        return errors
+
+    async def update(self, row_id, **values):
+        # Same semantics as the sync `update` methods: None leaves a column unchanged
+        query = self.table._update_query(list(values))
+        await self.execute_change(query, self.table.stamp({**values, 'row_id': row_id}), row_id)
+        self.table.invalidate(row_id)
+
+    async def delete(self, row_id):
+        await self.execute_change(self.table._delete_query(), {'row_id': row_id}, row_id, deleting=True)
+        self.table.invalidate(row_id)
+
+    async def execute_change(self, query, params, row_id, deleting=False):
+        # Same as `BaseTable.execute_change`: the table's hooks run in the write's transaction
+        try:
+            async with self.begin() as conn:
+                before = None
+                if self.table.track_changes:
+                    result = await conn.execute(self.table._by_id_query(for_update=True), {'row_id': row_id})
+                    row = result.mappings().first()
+                    before = dict(row) if row is not None else None
+                await conn.execute(sql(query), params)
+                await self.execute_statements(conn, self.table.change_statements(before, params, deleting))
+        except SQLAlchemyError as e:
+            print(f"Error executing query: {e}")
+            raise
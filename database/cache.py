@@ -0,0 +1,159 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+import json
+import os
+import threading
+import time
+
+# Read-through cache for single-row lookups (`read_by_id`).
+#
+# CACHE_BACKEND selects the backend: `memory` (default) keeps an LRU in each
+# process, `redis` shares entries between workers through REDIS_URL, and
+# `none` disables caching. CACHE_TTL bounds how stale an entry may get when
+# another process writes the row, CACHE_SIZE caps the in-process LRU.
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class NullCache:
+    """Caches nothing; every lookup goes to the database."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    def get(self, key):
+        self.stats.record(False)
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class LRUCache:
+    """In-process LRU with a per-entry time to live."""
+
+    def __init__(self, max_size=10000, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self.stats.record(entry is not None)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        self.stats.record_invalidation()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """
+    Cache shared by every worker, stored in Redis as JSON with a TTL.
+
+    While Redis is unreachable, reads are misses and writes are skipped, so
+    lookups fall through to the database; an entry whose invalidation failed
+    can be served until its TTL runs out.
+    """
+
+    def __init__(self, url, ttl=30, prefix='lytport:'):
+        import redis  # optional dependency, only needed for CACHE_BACKEND=redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.1)
+        self.errors = redis.RedisError
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    def get(self, key):
+        try:
+            value = self.client.get(self.prefix + key)
+        except self.errors as e:
+            print(f"Error reading cache entry {key}: {e}")
+            value = None
+        self.stats.record(value is not None)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, json.dumps(value, default=str), ex=self.ttl)
+        except self.errors as e:
+            print(f"Error writing cache entry {key}: {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except self.errors as e:
+            print(f"Error invalidating cache entry {key}: {e}")
+        self.stats.record_invalidation()
+
+
+_cache = None
+
+def get_cache():
+    """The process-wide row cache, built from the environment on first use."""
+    global _cache
+    if _cache is None:
+        load_dotenv(override=True)
+        backend = os.getenv('CACHE_BACKEND', 'memory').lower()
+        ttl = int(os.getenv('CACHE_TTL', 30))
+        if backend == 'none':
+            _cache = NullCache()
+        elif backend == 'redis':
+            _cache = RedisCache(os.getenv('REDIS_URL', 'redis://localhost:6379/0'), ttl)
+        else:
+            _cache = LRUCache(int(os.getenv('CACHE_SIZE', 10000)), ttl)
+    return _cache
+
+def set_cache(cache):
+    """Replace the process-wide row cache, e.g. with an `LRUCache` standing in for Redis."""
+    global _cache
+    _cache = cache
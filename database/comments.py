@@ -1,71 +1,45 @@
-from .database import BaseTable
+from .database import BaseTable, statement
 
 class Comment(BaseTable):
-    def __init__(self, drop=False):
-        super().__init__()
-        self.table_name = 'comments'
-        
-        if drop:
-            self.drop_table()
-        else:
-            self.create_table()
-
-    def create_table(self):
-        try:
-            result = self.fetch_query(f"SHOW TABLES LIKE '{self.table_name}';")
-            if not result:
-                query = f"""
-                CREATE TABLE `{self.table_name}` (
-                    `comment_id` INT PRIMARY KEY AUTO_INCREMENT,
-                    `post_id` INT,
-                    `user_id` INT,
-                    `message` TEXT,
-                    `like_count` INT,
-                    `timestamp` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`),
-                    FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`)
-                );
-                """
-                self.execute_query(query)
-
-        except ... as e:
-            pass
-
-    def write(self, post_id, user_id, message, like_count):
-        query = f"""
+    table_name = 'comments'
+    primary_key = 'comment_id'
+    columns = ['comment_id', 'post_id', 'user_id', 'message', 'like_count', 'timestamp']
+    dtypes = {
+        'comment_id': 'Int64', 'post_id': 'Int64', 'user_id': 'Int64', 'message': 'string',
+        'like_count': 'Int64', 'timestamp': 'string'
+    }
+
+    @statement
+    def _write_query(self):
+        return f"""
         INSERT INTO `{self.table_name}` (`post_id`, `user_id`, `message`, `like_count`, `timestamp`)
         VALUES (:post_id, :user_id, :message, :like_count, CURRENT_TIMESTAMP);
         """
+
+    def write(self, post_id, user_id, message, like_count):
         params = {
             'post_id': post_id,
             'user_id': user_id,
             'message': message,
             'like_count': like_count
         }
-        self.execute_query(query, params)
+        self.execute_query(self._write_query(), params)
 
     def read(self):
-        query = f"SELECT * FROM `{self.table_name}`;"
-        return self.fetch_query(query)
+        return self.fetch_query(self._page_query())
 
     def update(self, comment_id, message=None, like_count=None):
-        query = f"""
-        UPDATE `{self.table_name}` SET 
-            `message` = COALESCE(:message, `message`),
-            `like_count` = COALESCE(:like_count, `like_count`)
-        WHERE `comment_id` = :comment_id;
-        """
         params = {
-            'comment_id': comment_id,
+            'row_id': comment_id,
             'message': message,
             'like_count': like_count
         }
-        self.execute_query(query, params)
+        self.execute_query(self._update_query(['message', 'like_count']), params)
+        self.invalidate(comment_id)
 
     def delete(self, comment_id):
-        query = f"DELETE FROM `{self.table_name}` WHERE `comment_id` = :comment_id;"
-        params = {'comment_id': comment_id}
-        self.execute_query(query, params)
+        self.execute_query(self._delete_query(), {'row_id': comment_id})
+        self.invalidate(comment_id)
 
     def drop_table(self):
         self.execute_query(f"DROP TABLE IF EXISTS `{self.table_name}`;")
\ No newline at end of file
@@ -0,0 +1,198 @@
+from dotenv import load_dotenv
+from .engagement import Engagement
+from .insight_tables import COUNTS
+from .metrics import log_event
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# Write-behind buffer for engagement counter increments.
+#
+# A `PUT /engagements/{id}` reads the row, then rewrites it under a row lock,
+# one transaction per change, so a viral post's row serializes every like.
+# With COUNTER_WRITE_BEHIND on, `POST /engagements/increments` only adds to
+# an in-memory delta per post; a background task of the API flushes every
+# pending post each COUNTER_FLUSH_MS (default 1000) as one batched
+# `likes_count = likes_count + :likes` upsert (`Engagement.apply_increments`),
+# so a post takes one row lock per flush however many increments it got.
+# Counters lag by at most one interval; COUNTER_MAX_PENDING waiting posts
+# (default 10000) flush early, and the API flushes once more on shutdown.
+#
+# A failed flush is not dropped: its deltas are written to a file under
+# COUNTER_SPILL_DIR and merged into the next flush of any worker sharing the
+# directory. A crash loses at most the increments of the current interval:
+# spill files a worker claimed but had not removed when it died are taken
+# over by the next flush.
+
+
+_CLAIMED_BY = re.compile(r'^claimed-(\d+)-')
+_SPILL_NAME = re.compile(r'pending-.*\.json$')
+
+
+def _abandoned(path):
+    """Whether a claimed spill file was left behind by a worker that died before removing it."""
+    pid = int(_CLAIMED_BY.match(os.path.basename(path)).group(1))
+    if pid == os.getpid():
+        # This worker removes its claims before a flush returns, and flushes
+        # one at a time, so its own claim is from a previous process
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+class CounterBuffer:
+    """Per-post counter deltas waiting to be written, coalesced in memory."""
+
+    def __init__(self, table, flush_interval=1.0, max_pending=10000, spill_dir='counter_spill'):
+        self.table = table
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_dir = spill_dir
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self.increments = 0
+        self.flushes = 0
+        self.flushed_posts = 0
+        self.spills = 0
+
+    def add(self, post_id, **deltas):
+        """
+        Add `deltas` (one per `COUNTS`, missing ones 0) to the pending counts of a post.
+
+        Returns:
+        bool: True once `max_pending` posts are waiting, so the caller should flush early.
+        """
+        with self._lock:
+            pending = self._pending.get(post_id)
+            if pending is None:
+                pending = self._pending[post_id] = dict.fromkeys(COUNTS, 0)
+            for count in COUNTS:
+                pending[count] += deltas.get(count) or 0
+            self.increments += 1
+            return len(self._pending) >= self.max_pending
+
+    def flush(self):
+        """
+        Write every pending delta, plus any spilled by earlier failed flushes, in one transaction.
+
+        If the write fails, for any reason, the deltas are spilled before
+        the error is raised again; if they cannot be spilled either, they go
+        back to the pending deltas.
+
+        Returns:
+        int: Posts written; 0 when there was nothing to write.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            claimed = self._claim_spills(pending)
+            deltas = [{'post_id': post_id, **counts} for post_id, counts in pending.items()
+                      if any(counts.values())]
+            if not deltas:
+                self._remove(claimed)
+                return 0
+            try:
+                self.table.apply_increments(deltas)
+            except BaseException:
+                try:
+                    # Written before the claimed files are removed: a crash in
+                    # between double counts rather than losing increments
+                    self._spill(deltas)
+                except OSError as e:
+                    log_event('counter_spill_failed', level=logging.ERROR, posts=len(deltas), error=str(e))
+                    self._restore(deltas)
+                self._remove(claimed)
+                raise
+            self._remove(claimed)
+            with self._lock:
+                self.flushes += 1
+                self.flushed_posts += len(deltas)
+            return len(deltas)
+
+    def _restore(self, deltas):
+        with self._lock:
+            for delta in deltas:
+                pending = self._pending.setdefault(delta['post_id'], dict.fromkeys(COUNTS, 0))
+                for count in COUNTS:
+                    pending[count] += delta[count]
+
+    def _claim_spills(self, pending):
+        """Take over the spill files in `spill_dir`, merging their deltas into `pending`."""
+        claimed = []
+        paths = glob.glob(os.path.join(self.spill_dir, 'pending-*.json'))
+        paths += [path for path in glob.glob(os.path.join(self.spill_dir, 'claimed-*.json')) if _abandoned(path)]
+        for path in sorted(paths):
+            spill = _SPILL_NAME.search(os.path.basename(path)).group()
+            claim = os.path.join(self.spill_dir, f'claimed-{os.getpid()}-{spill}')
+            try:
+                # Atomic, so each file goes to exactly one of the workers sharing the directory
+                os.rename(path, claim)
+            except FileNotFoundError:
+                continue
+            with open(claim) as spill:
+                for delta in json.load(spill):
+                    counts = pending.setdefault(delta['post_id'], dict.fromkeys(COUNTS, 0))
+                    for count in COUNTS:
+                        counts[count] += delta.get(count) or 0
+            claimed.append(claim)
+        return claimed
+
+    def _spill(self, deltas):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f'pending-{os.getpid()}-{time.time_ns()}.json')
+        with open(path + '.tmp', 'w') as spill:
+            json.dump(deltas, spill)
+            spill.flush()
+            os.fsync(spill.fileno())
+        # Renamed into place so no worker claims a partly written file
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            self.spills += 1
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            os.remove(path)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pending_posts': len(self._pending),
+                'increments': self.increments,
+                'flushes': self.flushes,
+                'flushed_posts': self.flushed_posts,
+                'spills': self.spills,
+                'flush_interval_seconds': self.flush_interval,
+            }
+
+
+_buffer = None
+_configured = False
+_buffer_lock = threading.Lock()
+
+def get_counter_buffer():
+    """The process-wide counter buffer, configured from the environment on first use; None when COUNTER_WRITE_BEHIND is off."""
+    global _buffer, _configured
+    with _buffer_lock:
+        if not _configured:
+            _configured = True
+            load_dotenv(override=True)
+            if os.getenv('COUNTER_WRITE_BEHIND', '').strip().lower() not in ('1', 'true', 'yes', 'on'):
+                return None
+            _buffer = CounterBuffer(
+                Engagement(),
+                float(os.getenv('COUNTER_FLUSH_MS', 1000)) / 1000,
+                int(os.getenv('COUNTER_MAX_PENDING', 10000)),
+                os.getenv('COUNTER_SPILL_DIR', 'counter_spill'),
+            )
+    return _buffer
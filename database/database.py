@@ -1,11 +1,123 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from dotenv import load_dotenv
+from .cache import get_cache
+from .dialects import get_dialect
+from .metrics import instrument_engine
+import functools
 import os
+import threading
+import time
+
+# Rows sent per INSERT batch by `BaseTable.bulk_write`
+DEFAULT_BATCH_SIZE = 1000
+
+# Rows returned per page by `BaseTable.read_all`
+DEFAULT_PAGE_SIZE = 100
+
+# Ids per `IN (...)` query in `BaseTable.read_many`
+READ_MANY_CHUNK_SIZE = 1000
+
+# Distinct SQL strings whose `text()` construct `sql` keeps
+STATEMENT_CACHE_SIZE = 4096
+
+# Statement constructs.
+#
+# `text()` parses a statement's bind parameters when it is built, and
+# SQLAlchemy derives a construct's compiled-cache key once per object, so a
+# construct built again on every call pays for both before the compiled
+# cache is even consulted. Statements are therefore built once and reused:
+# the SQL of a table's own statements comes from methods decorated with
+# `statement`, cached per table class and arguments, and any other SQL
+# string runs through `sql`. Values always travel as bind parameters; only
+# identifiers from the table definitions are written into the SQL, so the
+# same few strings also hit the dialect rewrite cache and the drivers'
+# prepared statements (psycopg prepares a query run often enough).
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _parsed(query):
+    return text(query)
+
+
+def sql(query):
+    """The shared `text()` construct of a SQL string; constructs are returned as they are."""
+    return _parsed(query) if isinstance(query, str) else query
+
+
+def statement(build):
+    """
+    Cache the construct of a statement builder per table class and arguments.
+
+    `build(self, *args)` returns SQL (or a construct) that depends only on
+    the table's class attributes and its arguments, which must be hashable;
+    list arguments are keyed as tuples.
+    """
+    statements = {}
+
+    @functools.wraps(build)
+    def cached(self, *args, **kwargs):
+        key = (type(self),
+               tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args),
+               tuple(sorted(kwargs.items())))
+        construct = statements.get(key)
+        if construct is None:
+            construct = statements[key] = sql(build(self, *args, **kwargs))
+        return construct
+    return cached
+
+
+def report_load(table_name, total, elapsed):
+    rate = total / elapsed if elapsed > 0 else float(total)
+    print(f"Loaded {total} records into `{table_name}` in {elapsed:.2f}s ({rate:.0f} rows/sec).")
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    return value.strip().lower() in ('1', 'true', 'yes', 'on') if value else default
+
+
+class PoolMetrics:
+    """Counts how long callers wait to check a connection out of the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_avg': self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+                'wait_seconds_max': self.wait_seconds_max,
+            }
+
 
 class Database:
     _instance = None
     _engine = None
+    pool_metrics = PoolMetrics()
 
     def __new__(cls):
         if cls._instance is None:
@@ -20,12 +132,25 @@ class Database:
         self.username = os.getenv('USERNAME')
         self.password = os.getenv('PASSWORD')
         self.port = os.getenv('PORT')
+        # Storage backend (see database.dialects); SQLITE_PATH is the database file of `sqlite`
+        self.dialect = get_dialect(os.getenv('DB_BACKEND', 'mysql'))
+        self.sqlite_path = os.getenv('SQLITE_PATH', 'lytport.db')
+        # Pool sizing; recycle below MySQL's wait_timeout and ping on checkout so
+        # connections the server dropped are replaced instead of failing a query
+        self.pool_options = {
+            'pool_size': _env_int('POOL_SIZE', 5),
+            'max_overflow': _env_int('POOL_MAX_OVERFLOW', 10),
+            'pool_timeout': _env_int('POOL_TIMEOUT', 30),
+            'pool_recycle': _env_int('POOL_RECYCLE', 3600),
+            'pool_pre_ping': _env_bool('POOL_PRE_PING', True),
+        }
         self.connect()
 
     def connect(self):
         try:
-            connection_string = f"mysql+pymysql://{self.username}:{self.password}@{self.server}:{self.port}/{self.database}"
-            Database._engine = create_engine(connection_string)
+            Database._engine = create_engine(self.dialect.url(self), **self.pool_options)
+            self.dialect.configure(Database._engine)
+            instrument_engine(Database._engine)
             print("Connection successful!")
         except SQLAlchemyError as e:
             print(f"Error connecting to the database: {e}")
@@ -37,6 +162,28 @@ class Database:
             cls()
         return cls._engine
 
+    @classmethod
+    def get_dialect(cls):
+        return cls().dialect
+
+    @classmethod
+    def pool_status(cls):
+        """Live pool occupancy plus checkout wait statistics."""
+        pool = cls.get_engine().pool
+        return {
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            **cls.pool_metrics.snapshot(),
+        }
+
+    @classmethod
+    def reset_pool(cls):
+        """Drop pooled connections inherited from a parent process, without closing them."""
+        if cls._engine is not None:
+            cls._engine.dispose(close=False)
+
     @classmethod
     def close_connection(cls):
         if cls._engine is not None:
@@ -45,22 +192,302 @@ class Database:
             print("Connection closed.")
 
 class BaseTable:
+    # Table name, primary key, columns accepted by `bulk_write` and their
+    # pandas dtypes, set by each subclass. Tables are created by `database.schema`.
+    table_name = None
+    primary_key = None
+    columns = []
+    dtypes = {}
+    # Set by tables whose `updated`/`deleted` hooks need the row as it was
+    # before the change; update/delete then lock and read it first
+    track_changes = False
+    # Set by tables whose `inserted` hook reads a generated id with
+    # LAST_INSERT_ID(), which names only the last row an INSERT created;
+    # rows without an id are then written one INSERT at a time
+    hooks_read_last_insert_id = False
+    # Set by tables whose rows carry a `version`, bumped by every update,
+    # and an `updated_at` (UTC) set by every write of the table's methods;
+    # the API derives ETag and Last-Modified from them
+    versioned = False
+
     def __init__(self):
         self.engine = Database.get_engine()
+        self.dialect = Database.get_dialect()
+
+    @contextmanager
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = self.engine.connect()
+        except PoolTimeoutError:
+            Database.pool_metrics.record_timeout()
+            raise
+        Database.pool_metrics.record_wait(time.perf_counter() - start)
+        with conn:
+            yield conn
+
+    @contextmanager
+    def begin(self):
+        with self.connect() as conn, conn.begin():
+            yield conn
+
+    def execute_query(self, query, params=None, statements=()):
+        """Run `query`, then any extra (query, rows) `statements` in the same transaction."""
+        try:
+            with self.begin() as conn:
+                conn.execute(sql(query), params or {})
+                self._run_statements(conn, statements)
+        except SQLAlchemyError as e:
+            print(f"Error executing query: {e}")
 
-    def execute_query(self, query, params=None):
+    def execute_change(self, query, params, row_id, deleting=False):
+        """
+        Run an UPDATE or DELETE of one row together with the statements its
+        `updated`/`deleted` hooks return, in one transaction.
+        """
         try:
-            with self.engine.begin() as conn:
-                conn.execute(text(query), params or {})
+            with self.begin() as conn:
+                before = self._locked_row(conn, row_id) if self.track_changes else None
+                conn.execute(sql(query), params)
+                self._run_statements(conn, self.change_statements(before, params, deleting))
         except SQLAlchemyError as e:
             print(f"Error executing query: {e}")
 
+    def stamp(self, values):
+        """`values` of an insert or update, plus the `updated_at` of a versioned table."""
+        if not self.versioned:
+            return values
+        return {**values, 'updated_at': datetime.now(timezone.utc).replace(tzinfo=None)}
+
+    def version_assignments(self, qualified=False):
+        """
+        What an UPDATE of a versioned table appends to its SET clause, comma first; '' otherwise.
+
+        `qualified` names the columns with the table, for an upsert whose
+        SELECT reads another table with the same columns.
+        """
+        if not self.versioned:
+            return ""
+        table = f"`{self.table_name}`." if qualified else ""
+        return f", {table}`version` = {table}`version` + 1, {table}`updated_at` = :updated_at"
+
+    @staticmethod
+    def _run_statements(conn, statements):
+        for query, rows in statements:
+            if rows:
+                conn.execute(sql(query), rows)
+
+    def _locked_row(self, conn, row_id):
+        rows = conn.execute(self._by_id_query(for_update=True), {'row_id': row_id}).mappings().all()
+        return dict(rows[0]) if rows else None
+
+    # Statements that keep derived tables in step with writes to this one,
+    # as (query, rows) pairs run in the write's transaction. `bulk_write`
+    # skips them; backfills rebuild the derived tables instead.
+    def inserted(self, rows):
+        return []
+
+    def updated(self, before, after):
+        return []
+
+    def deleted(self, rows):
+        return []
+
+    def change_statements(self, before, values, deleting=False):
+        """The hook statements for an update (None values leave a column unchanged) or delete of `before`."""
+        if before is None:
+            return []
+        if deleting:
+            return self.deleted([before])
+        after = {**before, **{column: value for column, value in values.items() if column in before and value is not None}}
+        return self.updated(before, after)
+
     def fetch_query(self, query, params=None):
         try:
-            with self.engine.begin() as conn:
-                result = conn.execute(text(query), params or {})
+            with self.begin() as conn:
+                result = conn.execute(sql(query), params or {})
                 return result.fetchall()
         except SQLAlchemyError as e:
             print(f"Error fetching query: {e}")
             return None
 
+    def fetch_dicts(self, query, params=None):
+        try:
+            with self.begin() as conn:
+                result = conn.execute(sql(query), params or {})
+                return [dict(row) for row in result.mappings()]
+        except SQLAlchemyError as e:
+            print(f"Error fetching query: {e}")
+            return None
+
+    @statement
+    def _page_query(self, after=False, limit=False):
+        # `after`/`limit`: whether the page starts after a key / has a size
+        column_list = ", ".join(f"`{column}`" for column in self.columns)
+        query = f"SELECT {column_list} FROM `{self.table_name}`"
+        if after:
+            query += f" WHERE `{self.primary_key}` > :after"
+        query += f" ORDER BY `{self.primary_key}`"
+        if limit:
+            query += " LIMIT :limit"
+        return query + ";"
+
+    def read_all(self, limit=DEFAULT_PAGE_SIZE, after=None):
+        """
+        Read one page of rows ordered by primary key.
+
+        Pages are keyset-paginated: pass the last primary key of the previous
+        page as `after`, so every page is an index range scan rather than an
+        OFFSET that rereads all the skipped rows.
+        """
+        return self.fetch_dicts(self._page_query(after is not None, limit is not None), {'after': after, 'limit': limit})
+
+    def cache_key(self, row_id):
+        return f"{self.table_name}:{row_id}"
+
+    def invalidate(self, row_id):
+        """Drop a row from the read cache after it was written."""
+        get_cache().delete(self.cache_key(row_id))
+
+    @statement
+    def _by_id_query(self, for_update=False):
+        column_list = ", ".join(f"`{column}`" for column in self.columns)
+        lock = " FOR UPDATE" if for_update else ""
+        return f"SELECT {column_list} FROM `{self.table_name}` WHERE `{self.primary_key}` = :row_id{lock};"
+
+    def read_by_id(self, row_id):
+        """Read one row as a dict, through the row cache; None if it does not exist."""
+        cache = get_cache()
+        key = self.cache_key(row_id)
+        row = cache.get(key)
+        if row is None:
+            rows = self.fetch_dicts(self._by_id_query(), {'row_id': row_id})
+            row = rows[0] if rows else None
+            if row is not None:
+                cache.set(key, row)
+        return row
+
+    @statement
+    def _by_ids_query(self):
+        column_list = ", ".join(f"`{column}`" for column in self.columns)
+        query = f"SELECT {column_list} FROM `{self.table_name}` WHERE `{self.primary_key}` IN :row_ids;"
+        return text(query).bindparams(bindparam('row_ids', expanding=True))
+
+    @statement
+    def _by_column_query(self, column):
+        column_list = ", ".join(f"`{name}`" for name in self.columns)
+        return f"SELECT {column_list} FROM `{self.table_name}` WHERE `{column}` = :value;"
+
+    def _id_chunks(self, row_ids):
+        unique_ids = list(dict.fromkeys(row_ids))
+        for offset in range(0, len(unique_ids), READ_MANY_CHUNK_SIZE):
+            yield unique_ids[offset:offset + READ_MANY_CHUNK_SIZE]
+
+    def read_many(self, row_ids):
+        """
+        Read many rows by primary key with one `IN (...)` query per chunk of ids.
+
+        Cached rows are served from the row cache; the rest are fetched and
+        cached. Returns a list aligned with `row_ids`, None where a row does
+        not exist.
+        """
+        cache = get_cache()
+        found = {}
+        for row_id in row_ids:
+            row = cache.get(self.cache_key(row_id))
+            if row is not None:
+                found[row_id] = row
+
+        for chunk in self._id_chunks([row_id for row_id in row_ids if row_id not in found]):
+            for row in self.fetch_dicts(self._by_ids_query(), {'row_ids': chunk}) or []:
+                found[row[self.primary_key]] = row
+                cache.set(self.cache_key(row[self.primary_key]), row)
+
+        return [found.get(row_id) for row_id in row_ids]
+
+    def stream(self, after=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Yield every row after `after` from a server-side cursor.
+
+        Rows are fetched from the driver `batch_size` at a time, so memory
+        stays constant however large the table is.
+        """
+        with self.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+                self._page_query(after is not None), {'after': after}
+            )
+            for row in result.mappings():
+                yield dict(row)
+
+    @statement
+    def _insert_query(self, columns, ignore_duplicates=False):
+        column_list = ", ".join(f"`{column}`" for column in columns)
+        value_list = ", ".join(f":{column}" for column in columns)
+        insert = "INSERT IGNORE" if ignore_duplicates else "INSERT"
+        return f"{insert} INTO `{self.table_name}` ({column_list}) VALUES ({value_list});"
+
+    @statement
+    def _update_query(self, columns):
+        # None leaves a column unchanged; the row is :row_id
+        assignments = ", ".join(f"`{column}` = COALESCE(:{column}, `{column}`)" for column in columns)
+        assignments += self.version_assignments()
+        return f"UPDATE `{self.table_name}` SET {assignments} WHERE `{self.primary_key}` = :row_id;"
+
+    @statement
+    def _delete_query(self):
+        return f"DELETE FROM `{self.table_name}` WHERE `{self.primary_key}` = :row_id;"
+
+    @statement
+    def _exists_query(self, column):
+        return f"SELECT 1 FROM `{self.table_name}` WHERE `{column}` = :value LIMIT 1;"
+
+    def insert_chunk(self, conn, query, columns, chunk, ignore_duplicates=False):
+        """Insert `chunk` on `conn` through the backend's fast path; returns the number of rows inserted."""
+        if self.dialect.bulk_insert(conn, self.table_name, columns, chunk, ignore_duplicates):
+            return len(chunk)
+        # Rows an INSERT IGNORE skipped are not counted
+        rowcount = conn.execute(query, chunk).rowcount
+        return rowcount if rowcount >= 0 else len(chunk)
+
+    def bulk_write(self, rows, columns=None, batch_size=DEFAULT_BATCH_SIZE, report=True,
+                   ignore_duplicates=False):
+        """
+        Insert many rows, one transaction per chunk of `batch_size` rows.
+
+        Each chunk goes through the backend's fast path: one executemany
+        call, which pymysql rewrites into a multi-row `INSERT ... VALUES`
+        statement, or a COPY on PostgreSQL.
+
+        Args:
+        rows (list[dict]): Rows keyed by column name.
+        columns (list[str]): Columns to insert, defaults to the `self.columns` present in the rows.
+        batch_size (int): Number of rows per INSERT/transaction.
+        report (bool): Print the row count and rows/sec when done.
+        ignore_duplicates (bool): Skip rows whose primary/unique key already exists.
+
+        Returns:
+        int: Number of rows inserted, without the duplicates `ignore_duplicates` skipped.
+        """
+        if not rows:
+            return 0
+        columns = columns or [column for column in self.columns if column in rows[0]]
+        query = self._insert_query(columns, ignore_duplicates)
+
+        total = 0
+        start = time.perf_counter()
+        try:
+            for offset in range(0, len(rows), batch_size):
+                with self.begin() as conn:
+                    total += self.insert_chunk(conn, query, columns, rows[offset:offset + batch_size], ignore_duplicates)
+            id_statements = self.dialect.inserted_id_statements(self.table_name, self.primary_key, columns)
+            if id_statements:
+                with self.begin() as conn:
+                    for statement in id_statements:
+                        conn.execute(sql(statement))
+        except SQLAlchemyError as e:
+            print(f"Error bulk loading `{self.table_name}` after {total} rows: {e}")
+            raise
+
+        if report:
+            report_load(self.table_name, total, time.perf_counter() - start)
+        return total
@@ -0,0 +1,308 @@
+from sqlalchemy import event, text
+import re
+
+# Storage backends behind `Database`, selected with DB_BACKEND: `mysql`
+# (default), `postgresql` (psycopg) or `sqlite` (pysqlite/aiosqlite).
+#
+# Table code writes MySQL-flavoured SQL: backtick-quoted identifiers,
+# `INSERT IGNORE`, `ON DUPLICATE KEY UPDATE`, `LAST_INSERT_ID()`, `REGEXP`.
+# The PostgreSQL and SQLite dialects rewrite a statement the first time the
+# engine runs it and reuse the rewrite afterwards, so neither the tables nor
+# the endpoints change with the backend. Migrations go through
+# `translate_ddl`, which also drops what a backend has no equivalent for
+# (FULLTEXT indexes). Bulk loads take each backend's fast path: pymysql's
+# multi-row INSERT rewrite, COPY on PostgreSQL, and executemany on SQLite
+# in WAL mode.
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_INSERT_IGNORE = re.compile(r'\bINSERT IGNORE INTO\b')
+_INSERT_TABLE = re.compile(r'\bINSERT (?:IGNORE )?INTO `(\w+)`')
+_UPSERT = re.compile(r'\bON DUPLICATE KEY UPDATE\b(.*?);?\s*$', re.S)
+_VALUES_OF = re.compile(r'\bVALUES\(`(\w+)`\)')
+_COLUMN = re.compile(r'(?<![.\w`])`(\w+)`(?!\.)')
+_QUALIFIER = re.compile(r'^`\w+`\.')
+
+_AUTO_INCREMENT = re.compile(r'`(\w+)` (BIG)?INT PRIMARY KEY AUTO_INCREMENT')
+_INLINE_INDEX = re.compile(r',\s*INDEX `(\w+)` \(([^)]*)\)')
+_CREATE_TABLE = re.compile(r'CREATE TABLE IF NOT EXISTS `(\w+)`')
+_GENERATED = re.compile(r'\bAS (\(.*\)) STORED')
+_COMPOSITE_KEY = re.compile(r'PRIMARY KEY \([^)]*,')
+_WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+
+def _outside_strings(statement, rewrite):
+    """Apply `rewrite` to the parts of `statement` that are not string literals."""
+    parts, last = [], 0
+    for match in _STRING.finditer(statement):
+        parts += [rewrite(statement[last:match.start()]), match.group()]
+        last = match.end()
+    parts.append(rewrite(statement[last:]))
+    return ''.join(parts)
+
+
+def _split_top_level(clause):
+    """Split `clause` at the commas that are not inside parentheses."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(clause):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(clause[start:i])
+            start = i + 1
+    parts.append(clause[start:])
+    return parts
+
+
+def _regexp(pattern, value):
+    # Case-insensitive, like REGEXP under MySQL's default collation
+    return value is not None and re.search(pattern, value, re.IGNORECASE) is not None
+
+
+class Dialect:
+    """MySQL, which the table code is written for: statements run as they are."""
+    name = 'mysql'
+    driver = 'pymysql'
+    async_driver = 'aiomysql'
+
+    # Rewritten statements kept before the cache starts over; IN lists of
+    # every length are distinct statements
+    CACHE_SIZE = 10000
+
+    def __init__(self):
+        self._translations = {}
+
+    def url(self, database, asynchronous=False):
+        driver = self.async_driver if asynchronous else self.driver
+        return (f"{self.name}+{driver}://{database.username}:{database.password}"
+                f"@{database.server}:{database.port}/{database.database}")
+
+    def configure(self, engine):
+        """Install statement translation and connection setup on a new (sync or async) engine."""
+        engine = getattr(engine, 'sync_engine', engine)
+        if type(self).rewrite is not Dialect.rewrite:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute, retval=True)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        return self.translate(statement), parameters
+
+    def translate(self, statement):
+        translated = self._translations.get(statement)
+        if translated is None:
+            if len(self._translations) >= self.CACHE_SIZE:
+                self._translations.clear()
+            translated = self._translations[statement] = self.rewrite(statement)
+        return translated
+
+    def rewrite(self, statement):
+        return statement
+
+    def translate_ddl(self, statement):
+        """The statements that apply one migration statement on this backend; empty if it has no equivalent."""
+        return [statement]
+
+    def bulk_insert(self, conn, table_name, columns, rows, ignore_duplicates=False):
+        """Insert `rows` through a native fast path; False to have the caller run its INSERT instead."""
+        return False
+
+    def inserted_id_statements(self, table_name, primary_key, columns):
+        """Statements to run after rows were inserted with explicit primary keys."""
+        return []
+
+    def explain(self, conn, query, params):
+        """Whether `query` would scan a whole table, and a one-line summary of its plan."""
+        plan = conn.execute(text("EXPLAIN " + query), params).mappings().first()
+        # type is ALL for a full scan; NULL means a unique key proved no row matches
+        return plan['type'] == 'ALL', f"type={plan['type']} key={plan['key']}"
+
+
+class StandardDialect(Dialect):
+    """
+    Rewrites shared by PostgreSQL and SQLite, which both spell upserts `ON CONFLICT`.
+
+    Each backend defines `ignore_insert` and `auto_increment`, the column
+    definition that replaces `INT PRIMARY KEY AUTO_INCREMENT`.
+    """
+    ignore_insert = None
+
+    def conflict_keys(self, table_name):
+        from .schema import UPSERT_KEYS
+        return UPSERT_KEYS[table_name]
+
+    def existing(self, table_name, expression):
+        """`expression` of an upsert's SET clause, with its columns naming the stored row."""
+        return expression
+
+    def rewrite(self, statement):
+        upsert = _UPSERT.search(statement)
+        if upsert is not None:
+            table_name = _INSERT_TABLE.search(statement).group(1)
+            assignments = []
+            for assignment in _split_top_level(upsert.group(1)):
+                column, expression = assignment.split('=', 1)
+                expression = _VALUES_OF.sub(r'excluded.`\1`', expression)
+                # The assigned column is the target table's, never qualified in ON CONFLICT
+                column = _QUALIFIER.sub('', column.strip())
+                assignments.append(f"{column} = {self.existing(table_name, expression).strip()}")
+            target = ", ".join(f"`{key}`" for key in self.conflict_keys(table_name))
+            statement = (statement[:upsert.start()]
+                         + f"ON CONFLICT ({target}) DO UPDATE SET " + ", ".join(assignments) + ";")
+        elif _INSERT_IGNORE.search(statement):
+            statement = self.ignore_insert(statement)
+        return _outside_strings(statement, self.rewrite_tokens)
+
+    def rewrite_tokens(self, sql):
+        return sql
+
+    def translate_ddl(self, statement):
+        if 'FULLTEXT' in statement:
+            return []
+        statement = statement.replace(' ON UPDATE CURRENT_TIMESTAMP', '')
+        statement = _GENERATED.sub(r'GENERATED ALWAYS AS \1 STORED', statement)
+        statement = _AUTO_INCREMENT.sub(self.auto_increment, statement)
+
+        # Secondary indexes are separate statements outside MySQL
+        table = _CREATE_TABLE.search(statement)
+        indexes = []
+        if table is not None:
+            indexes = [
+                f"CREATE INDEX IF NOT EXISTS `{name}` ON `{table.group(1)}` ({columns});"
+                for name, columns in _INLINE_INDEX.findall(statement)
+            ]
+            statement = self.create_table(_INLINE_INDEX.sub('', statement))
+        return [statement] + indexes
+
+    def create_table(self, statement):
+        return statement
+
+
+class PostgreSQLDialect(StandardDialect):
+    name = 'postgresql'
+    driver = 'psycopg'
+    async_driver = 'psycopg_async'
+
+    def ignore_insert(self, statement):
+        statement = _INSERT_IGNORE.sub('INSERT INTO', statement).rstrip().rstrip(';')
+        return statement + " ON CONFLICT DO NOTHING;"
+
+    def existing(self, table_name, expression):
+        # Unqualified, a column would be ambiguous with the `excluded` row
+        return _COLUMN.sub(rf'`{table_name}`.`\1`', expression)
+
+    def rewrite_tokens(self, sql):
+        sql = sql.replace('`', '"').replace('LAST_INSERT_ID()', 'lastval()')
+        return sql.replace(' REGEXP ', ' ~* ')
+
+    def auto_increment(self, match):
+        return f"`{match.group(1)}` {'BIGSERIAL' if match.group(2) else 'SERIAL'} PRIMARY KEY"
+
+    def translate_ddl(self, statement):
+        return [statement.replace(' DATETIME', ' TIMESTAMP') for statement in super().translate_ddl(statement)]
+
+    def bulk_insert(self, conn, table_name, columns, rows, ignore_duplicates=False):
+        # COPY cannot skip conflicting rows; those loads run INSERT ... ON CONFLICT DO NOTHING
+        if ignore_duplicates:
+            return False
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        cursor = conn.connection.driver_connection.cursor()
+        with cursor.copy(f'COPY "{table_name}" ({column_list}) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row([row.get(column) for column in columns])
+        return True
+
+    def explain(self, conn, query, params):
+        # Without sequential scans the planner takes an index wherever one
+        # applies, even on the small tables it would rather read in full
+        conn.execute(text("SET LOCAL enable_seqscan = off;"))
+        plan = [row[0] for row in conn.execute(text("EXPLAIN " + query), params)]
+        return any('Seq Scan' in step for step in plan), plan[0].strip()
+
+    def inserted_id_statements(self, table_name, primary_key, columns):
+        # Explicit ids do not advance a SERIAL sequence the way they move
+        # MySQL's AUTO_INCREMENT; NULL (no sequence) makes setval a no-op
+        if primary_key is None or primary_key not in columns:
+            return []
+        return [
+            f"SELECT setval(pg_get_serial_sequence('{table_name}', '{primary_key}'), "
+            f"(SELECT COALESCE(MAX(\"{primary_key}\"), 0) + 1 FROM \"{table_name}\"), false);"
+        ]
+
+
+class SQLiteDialect(StandardDialect):
+    name = 'sqlite'
+    driver = 'pysqlite'
+    async_driver = 'aiosqlite'
+
+    # Run on every new connection: WAL lets readers work during a write,
+    # NORMAL syncs at checkpoints rather than every commit
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL;",
+        "PRAGMA synchronous = NORMAL;",
+        "PRAGMA foreign_keys = ON;",
+        "PRAGMA busy_timeout = 30000;",
+    )
+
+    def url(self, database, asynchronous=False):
+        return f"{self.name}+{self.async_driver if asynchronous else self.driver}:///{database.sqlite_path}"
+
+    def configure(self, engine):
+        super().configure(engine)
+        engine = getattr(engine, 'sync_engine', engine)
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'begin', self._on_begin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        # SQLAlchemy, not the driver, opens transactions, so SAVEPOINTs work
+        dbapi_connection.isolation_level = None
+        dbapi_connection.create_function('regexp', 2, _regexp, deterministic=True)
+        cursor = dbapi_connection.cursor()
+        for pragma in self.PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    def _on_begin(self, conn):
+        conn.info['sqlite_begin_pending'] = True
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # The transaction opens with its first statement: IMMEDIATE takes the
+        # write lock up front (waiting out busy_timeout) for a write or a
+        # SELECT ... FOR UPDATE, since a read transaction that later writes
+        # fails at once if another connection wrote in between
+        if conn.info.pop('sqlite_begin_pending', False):
+            writes = statement.lstrip().startswith(_WRITES) or ' FOR UPDATE' in statement
+            cursor.execute("BEGIN IMMEDIATE" if writes else "BEGIN")
+        return super()._before_cursor_execute(conn, cursor, statement, parameters, context, executemany)
+
+    def ignore_insert(self, statement):
+        return _INSERT_IGNORE.sub('INSERT OR IGNORE INTO', statement)
+
+    def explain(self, conn, query, params):
+        # SCAN reads every row of a table or index; SEARCH looks up a key
+        plan = [row[3] for row in conn.execute(text("EXPLAIN QUERY PLAN " + query), params)]
+        return any(step.startswith('SCAN') for step in plan), '; '.join(plan)
+
+    def rewrite_tokens(self, sql):
+        sql = sql.replace('LAST_INSERT_ID()', 'last_insert_rowid()').replace(' FOR UPDATE', '')
+        return sql.replace('GREATEST(', 'MAX(').replace('LEAST(', 'MIN(')
+
+    def auto_increment(self, match):
+        # INTEGER PRIMARY KEY is the rowid, assigned like AUTO_INCREMENT
+        return f"`{match.group(1)}` INTEGER PRIMARY KEY"
+
+    def create_table(self, statement):
+        # Composite keys become the clustered index, as in InnoDB; inserts
+        # into these tables also leave last_insert_rowid() alone
+        if _COMPOSITE_KEY.search(statement):
+            statement = statement.rstrip().rstrip(';') + " WITHOUT ROWID;"
+        return statement
+
+
+DIALECTS = {dialect.name: dialect for dialect in (Dialect, PostgreSQLDialect, SQLiteDialect)}
+
+def get_dialect(name):
+    """A new dialect for a DB_BACKEND value."""
+    try:
+        return DIALECTS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown DB_BACKEND {name!r}; expected one of {', '.join(DIALECTS)}")
@@ -1,79 +1,120 @@
-from database.database import BaseTable
+from database.database import BaseTable, statement
+from database.engagement_history import EngagementHistory
+from database.insight_tables import COUNTS, engagement_change_statements, engagement_delta, engagement_statements
+from sqlalchemy import bindparam, text
 from sqlalchemy.exc import SQLAlchemyError
 
 
 class Engagement(BaseTable):
-    def __init__(self, drop=False):
-        super().__init__()
-        self.table_name = 'engagements'
-        
-        if drop:
-            self.drop_table()
-        else:
-            self.create_table()
-
-    def create_table(self):
-        try:
-            result = self.fetch_query(f"SHOW TABLES LIKE '{self.table_name}';")
-            if not result:
-                query = f"""
-                CREATE TABLE `{self.table_name}` (
-                    `engagement_id` INT PRIMARY KEY AUTO_INCREMENT,
-                    `post_id` INT,
-                    `likes_count` INT,
-                    `comments_count` INT,
-                    `shares_count` INT,
-                    `video_completion_rate` FLOAT,
-                    FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`)
-                );
-                """
-                self.execute_query(query)
-                print(f"Table `{self.table_name}` created successfully.")
-            
-        except SQLAlchemyError as e:
-            print(f"Error creating table `{self.table_name}`: {e}")
-            raise  
+    table_name = 'engagements'
+    primary_key = 'engagement_id'
+    columns = [
+        'engagement_id', 'post_id', 'likes_count', 'comments_count', 'shares_count', 'video_completion_rate',
+        'views_count', 'version', 'updated_at'
+    ]
+    dtypes = {
+        'engagement_id': 'Int64', 'post_id': 'Int64', 'likes_count': 'Int64', 'comments_count': 'Int64',
+        'shares_count': 'Int64', 'video_completion_rate': 'Float64', 'views_count': 'Int64',
+        'version': 'Int64', 'updated_at': 'datetime64[ns]'
+    }
+    track_changes = True
+    versioned = True
 
-        except Exception as e:
-            print(f"Unexpected error creating table `{self.table_name}`: {e}")
-            raise  
+    def __init__(self):
+        super().__init__()
+        self.history = EngagementHistory()
 
     def write(self, post_id, likes_count, comments_count, shares_count, video_completion_rate):
-        query = f"""
-        INSERT INTO `{self.table_name}` (`post_id`, `likes_count`, `comments_count`, `shares_count`, `video_completion_rate`)
-        VALUES (:post_id, :likes_count, :comments_count, :shares_count, :video_completion_rate);
-        """
-        params = {
+        params = self.stamp({
             'post_id': post_id,
             'likes_count': likes_count,
             'comments_count': comments_count,
             'shares_count': shares_count,
             'video_completion_rate': video_completion_rate
-        }
-        self.execute_query(query, params)
+        })
+        self.execute_query(self._insert_query(list(params)), params, self.inserted([params]))
 
     def read(self):
-        query = f"SELECT * FROM `{self.table_name}`;"
-        return self.fetch_query(query)
+        return self.fetch_query(self._page_query())
 
     def update(self, engagement_id, likes_count=None, comments_count=None):
-        query = f"""
-        UPDATE `{self.table_name}` SET 
-            `likes_count` = COALESCE(:likes_count, `likes_count`), 
-            `comments_count` = COALESCE(:comments_count, `comments_count`)
-        WHERE `engagement_id` = :engagement_id;
-        """
-        params = {
-            'engagement_id': engagement_id,
+        params = self.stamp({
+            'row_id': engagement_id,
             'likes_count': likes_count,
             'comments_count': comments_count
-        }
-        self.execute_query(query, params)
+        })
+        self.execute_change(self._update_query(['likes_count', 'comments_count']), params, engagement_id)
+        self.invalidate(engagement_id)
 
     def delete(self, engagement_id):
-        query = f"DELETE FROM `{self.table_name}` WHERE `engagement_id` = :engagement_id;"
-        params = {'engagement_id': engagement_id}
-        self.execute_query(query, params)
+        self.execute_change(self._delete_query(), {'row_id': engagement_id}, engagement_id, deleting=True)
+        self.invalidate(engagement_id)
+
+    @statement
+    def increment_query(self):
+        counts = ", ".join(f"`{count}_count`" for count in COUNTS)
+        values = ", ".join(f":{count}" for count in COUNTS)
+        updates = ", ".join(
+            f"`{self.table_name}`.`{count}_count` = COALESCE(`{self.table_name}`.`{count}_count`, 0) + :{count}"
+            for count in COUNTS
+        )
+        # Selected from `posts` so increments of a deleted post are dropped
+        # rather than failing the whole batch on the foreign key. `posts` is
+        # versioned as well, so the updated columns name their table
+        return f"""
+        INSERT INTO `{self.table_name}` (`post_id`, {counts}, `updated_at`)
+        SELECT `post_id`, {values}, :updated_at FROM `posts` WHERE `post_id` = :post_id
+        ON DUPLICATE KEY UPDATE {updates}{self.version_assignments(qualified=True)};
+        """
+
+    def apply_increments(self, deltas):
+        """
+        Add counter deltas to the engagement of each post, creating it on a
+        post's first increment, in one transaction with the insight tables
+        and a history snapshot of the new counts.
+
+        Args:
+        deltas (list[dict]): `post_id` plus one delta per `COUNTS`; repeated posts are summed.
+        """
+        merged = {}
+        for delta in deltas:
+            counts = merged.setdefault(delta['post_id'], dict.fromkeys(COUNTS, 0))
+            for count in COUNTS:
+                counts[count] += delta.get(count) or 0
+        # In post order, so concurrent flushes lock rows in the same order instead of deadlocking
+        rows = [self.stamp({'post_id': post_id, **counts}) for post_id, counts in sorted(merged.items())]
+        if not rows:
+            return
+        engagements = []
+        try:
+            with self.begin() as conn:
+                conn.execute(self.increment_query(), rows)
+                self._run_statements(conn, engagement_statements(rows))
+                for chunk in self._id_chunks(list(merged)):
+                    engagements += conn.execute(self._by_posts_query(), {'post_ids': chunk}).mappings().all()
+                self._run_statements(conn, self.history.statements(engagements))
+        except SQLAlchemyError as e:
+            print(f"Error applying counter increments: {e}")
+            raise
+        for engagement in engagements:
+            self.invalidate(engagement['engagement_id'])
+
+    @statement
+    def _by_posts_query(self):
+        column_list = ", ".join(f"`{column}`" for column in self.columns)
+        query = f"SELECT {column_list} FROM `{self.table_name}` WHERE `post_id` IN :post_ids;"
+        return text(query).bindparams(bindparam('post_ids', expanding=True))
+
+    # Keep the materialized insight tables in step (see database.insight_tables),
+    # and snapshot the counts of every written row into the engagement history
+    def inserted(self, rows):
+        return engagement_statements([engagement_delta(row) for row in rows]) + self.history.statements(rows)
+
+    def updated(self, before, after):
+        return engagement_change_statements(before, after) + self.history.statements([after])
+
+    def deleted(self, rows):
+        return engagement_statements([engagement_delta(row, -1) for row in rows])
 
 
     def drop_table(self):
@@ -0,0 +1,136 @@
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime, timezone
+from .database import BaseTable, DEFAULT_BATCH_SIZE, statement
+
+# Lower bound used when a growth query has no `since`
+EPOCH = datetime(1970, 1, 1)
+
+# Rollup tables and how a capture time is truncated to their bucket
+ROLLUPS = {
+    'hourly': ('engagement_hourly', lambda captured_at: captured_at.replace(minute=0, second=0, microsecond=0)),
+    'daily': ('engagement_daily', lambda captured_at: captured_at.replace(hour=0, minute=0, second=0, microsecond=0)),
+}
+
+
+def _utc(captured_at):
+    if captured_at is not None and captured_at.tzinfo is not None:
+        return captured_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return captured_at
+
+
+def with_growth(rollup_rows):
+    """
+    Add likes/comments growth to rollup rows ordered by bucket.
+
+    Growth is measured from the previous bucket's last capture, or from the
+    bucket's own first capture for the earliest bucket.
+    """
+    previous = None
+    for row in rollup_rows:
+        for metric in ('likes_count', 'comments_count'):
+            start = previous[f'last_{metric}'] if previous else row[f'first_{metric}']
+            end = row[f'last_{metric}']
+            row[f'{metric.replace("_count", "")}_growth'] = end - start if None not in (start, end) else None
+        previous = row
+    return rollup_rows
+
+
+class EngagementHistory(BaseTable):
+    """
+    Append-only engagement snapshots, keyed by (post_id, captured_at).
+
+    Every write also folds the snapshot into the hourly and daily rollups,
+    so growth queries read one row per bucket instead of raw snapshots.
+    """
+    table_name = 'engagement_snapshots'
+    columns = ['post_id', 'captured_at', 'likes_count', 'comments_count', 'shares_count', 'video_completion_rate']
+
+    @statement
+    def _snapshot_query(self):
+        column_list = ", ".join(f"`{column}`" for column in self.columns)
+        value_list = ", ".join(f":{column}" for column in self.columns)
+        updates = ", ".join(f"`{column}` = VALUES(`{column}`)" for column in self.columns[2:])
+        return f"INSERT INTO `{self.table_name}` ({column_list}) VALUES ({value_list}) ON DUPLICATE KEY UPDATE {updates};"
+
+    @statement
+    def _rollup_query(self, rollup_table):
+        # MySQL applies the assignments left to right, so the first_*/last_*
+        # counts are compared against the stored capture times before those
+        # move (the other backends evaluate every assignment on the stored row)
+        return f"""
+        INSERT INTO `{rollup_table}` (
+            `post_id`, `bucket`, `first_captured_at`, `first_likes_count`, `first_comments_count`,
+            `last_captured_at`, `last_likes_count`, `last_comments_count`, `last_shares_count`
+        )
+        VALUES (
+            :post_id, :bucket, :captured_at, :likes_count, :comments_count,
+            :captured_at, :likes_count, :comments_count, :shares_count
+        )
+        ON DUPLICATE KEY UPDATE
+            `first_likes_count` = CASE WHEN VALUES(`first_captured_at`) <= `first_captured_at` THEN VALUES(`first_likes_count`) ELSE `first_likes_count` END,
+            `first_comments_count` = CASE WHEN VALUES(`first_captured_at`) <= `first_captured_at` THEN VALUES(`first_comments_count`) ELSE `first_comments_count` END,
+            `first_captured_at` = LEAST(`first_captured_at`, VALUES(`first_captured_at`)),
+            `last_likes_count` = CASE WHEN VALUES(`last_captured_at`) >= `last_captured_at` THEN VALUES(`last_likes_count`) ELSE `last_likes_count` END,
+            `last_comments_count` = CASE WHEN VALUES(`last_captured_at`) >= `last_captured_at` THEN VALUES(`last_comments_count`) ELSE `last_comments_count` END,
+            `last_shares_count` = CASE WHEN VALUES(`last_captured_at`) >= `last_captured_at` THEN VALUES(`last_shares_count`) ELSE `last_shares_count` END,
+            `last_captured_at` = GREATEST(`last_captured_at`, VALUES(`last_captured_at`));
+        """
+
+    def statements(self, snapshots):
+        """
+        The upserts that record `snapshots`, as (query, rows) pairs to run in one transaction.
+
+        Capture times are stored as naive UTC: aware ones are converted, and
+        snapshots without `captured_at` are stamped with the current time.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        rows = [
+            {**{column: snapshot.get(column) for column in self.columns}, 'captured_at': _utc(snapshot.get('captured_at')) or now}
+            for snapshot in snapshots
+        ]
+        statements = [(self._snapshot_query(), rows)]
+        for rollup_table, truncate in ROLLUPS.values():
+            statements.append((
+                self._rollup_query(rollup_table),
+                [{**row, 'bucket': truncate(row['captured_at'])} for row in rows]
+            ))
+        return statements
+
+    def record(self, snapshots, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Append snapshots and update the rollups, one transaction per chunk.
+
+        Re-sending a snapshot for the same (post_id, captured_at) overwrites
+        it rather than adding a duplicate.
+
+        Returns:
+        int: Number of snapshots recorded.
+        """
+        total = 0
+        try:
+            for offset in range(0, len(snapshots), batch_size):
+                chunk = snapshots[offset:offset + batch_size]
+                with self.begin() as conn:
+                    for query, rows in self.statements(chunk):
+                        conn.execute(query, rows)
+                total += len(chunk)
+        except SQLAlchemyError as e:
+            print(f"Error recording engagement snapshots after {total} rows: {e}")
+            raise
+        return total
+
+    @statement
+    def growth_query(self, granularity):
+        rollup_table = ROLLUPS[granularity][0]
+        return f"""
+        SELECT `bucket`, `first_captured_at`, `first_likes_count`, `first_comments_count`,
+               `last_captured_at`, `last_likes_count`, `last_comments_count`, `last_shares_count`
+        FROM `{rollup_table}`
+        WHERE `post_id` = :post_id AND `bucket` >= :since
+        ORDER BY `bucket`;
+        """
+
+    def growth(self, post_id, granularity='daily', since=EPOCH):
+        """Per-bucket engagement of one post with likes/comments growth, read from the rollups."""
+        rows = self.fetch_dicts(self.growth_query(granularity), {'post_id': post_id, 'since': since})
+        return with_growth(rows or [])
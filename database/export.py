@@ -0,0 +1,352 @@
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime, timezone
+from .database import Database, DEFAULT_BATCH_SIZE
+from .comments import Comment
+from .engagement import Engagement
+from .follower import Follower
+from .post import Post
+from .user import User
+import argparse
+import json
+import os
+import time
+
+# Columnar snapshots of the core tables for offline analytics.
+#
+# Each table is read from a server-side cursor, `batch_size` rows at a time,
+# and written as typed Arrow record batches into numbered part files of at
+# most `partition_rows` rows under `<out>/<table>/`, as Parquet (compressed,
+# the default) or Arrow IPC (uncompressed, mapped without decoding). A
+# `_manifest.json` per table lists the parts and the export's watermark: an
+# incremental export only reads rows past it, by primary key, by creation
+# timestamp for posts and comments (whose ids come from Instagram and are
+# not in insertion order), or by `updated_at` for the versioned tables.
+# Only `updated` catches changes to rows already exported, such as new
+# engagement counts; it misses rows loaded through `bulk_write`, which have
+# no `updated_at` until their first update, so those need a full export or
+# one by primary key. Deletions reach an export only by a full one.
+# `load_export` memory-maps the parts listed in the manifest straight into
+# one DataFrame, keeping the latest export of each row. Needs pyarrow
+# (`pip install pyarrow`).
+#
+#   python -m database.export --out exports
+#   python -m database.export --out exports --incremental --key timestamp
+#   python -m database.export --out exports --incremental --key updated
+
+# Table name -> (table class, creation timestamp column or None)
+EXPORT_TABLES = {
+    'users': (User, None),
+    'posts': (Post, 'timestamp'),
+    'engagements': (Engagement, None),
+    'comments': (Comment, 'timestamp'),
+    'followers': (Follower, None),
+}
+
+# Rows per part file
+DEFAULT_PARTITION_ROWS = 1000000
+
+# Rows per Parquet row group; cursor batches are gathered up to this so the
+# files are not split into thousands of small row groups
+ROW_GROUP_ROWS = 65536
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+MANIFEST = '_manifest.json'
+
+
+def _pyarrow():
+    try:
+        import pyarrow  # optional dependency, only needed for exports
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Columnar exports need pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+def arrow_schema(table, timestamp_column=None):
+    """The Arrow schema of a table (class or instance), from its pandas `dtypes`; the creation timestamp as a timestamp."""
+    pa = _pyarrow()
+    types = {
+        'Int64': pa.int64(), 'Float64': pa.float64(), 'boolean': pa.bool_(), 'string': pa.string(),
+        'datetime64[ns]': pa.timestamp('us'),
+    }
+    return pa.schema([
+        (column, pa.timestamp('us') if column == timestamp_column else types[table.dtypes[column]])
+        for column in table.columns
+    ])
+
+
+def _timestamp(value):
+    # SQLite returns timestamps as text
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _converter(arrow_type):
+    pa = _pyarrow()
+    if arrow_type == pa.bool_():
+        # MySQL BOOLEAN is TINYINT(1) and comes back as 0/1
+        return lambda values: [None if value is None else bool(value) for value in values]
+    if pa.types.is_timestamp(arrow_type):
+        return lambda values: [_timestamp(value) for value in values]
+    return None
+
+
+def read_manifest(directory):
+    """The manifest of one exported table, or None if it was never exported."""
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as manifest:
+        return json.load(manifest)
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2, default=str)
+    os.replace(path + '.tmp', path)
+
+
+class PartWriter:
+    """Writes record batches into consecutive part files of at most `partition_rows` rows."""
+
+    def __init__(self, directory, schema, file_format, partition_rows, first_part):
+        self.directory = directory
+        self.schema = schema
+        self.file_format = file_format
+        self.partition_rows = partition_rows
+        self.next_part = first_part
+        self.parts = []
+        self._writer = None
+        self._rows = 0
+        self._batches = []
+        self._batched_rows = 0
+
+    def write(self, batch):
+        while batch.num_rows:
+            if self._writer is None:
+                self._open()
+            taken = batch.slice(0, self.partition_rows - self._rows)
+            if self.file_format == 'arrow':
+                self._writer.write_batch(taken)
+            else:
+                self._batches.append(taken)
+                self._batched_rows += taken.num_rows
+                if self._batched_rows >= ROW_GROUP_ROWS:
+                    self._write_row_group()
+            self._rows += taken.num_rows
+            batch = batch.slice(taken.num_rows)
+            if self._rows == self.partition_rows:
+                self.close()
+
+    def _open(self):
+        pa = _pyarrow()
+        name = f"part-{self.next_part:05d}{FORMATS[self.file_format]}"
+        self._path = os.path.join(self.directory, name)
+        # Written under a temporary name; only parts in the manifest are ever read
+        if self.file_format == 'arrow':
+            self._writer = pa.ipc.new_file(self._path + '.tmp', self.schema)
+        else:
+            self._writer = pa.parquet.ParquetWriter(self._path + '.tmp', self.schema, compression='zstd')
+        self.next_part += 1
+        self._rows = 0
+
+    def _write_row_group(self):
+        pa = _pyarrow()
+        if self._batches:
+            self._writer.write_table(pa.Table.from_batches(self._batches, self.schema), row_group_size=self._batched_rows)
+        self._batches = []
+        self._batched_rows = 0
+
+    def close(self):
+        if self._writer is None:
+            return
+        if self.file_format == 'parquet':
+            self._write_row_group()
+        self._writer.close()
+        os.replace(self._path + '.tmp', self._path)
+        self.parts.append({'file': os.path.basename(self._path), 'rows': self._rows})
+        self._writer = None
+
+
+class TableExport:
+    """Export of one table into `<out>/<table>/`."""
+
+    def __init__(self, table_name, out, file_format='parquet', partition_rows=DEFAULT_PARTITION_ROWS,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        table_class, self.timestamp_column = EXPORT_TABLES[table_name]
+        self.table = table_class()
+        self.directory = os.path.join(out, table_name)
+        self.file_format = file_format
+        self.partition_rows = partition_rows
+        self.batch_size = batch_size
+        self.schema = arrow_schema(self.table, self.timestamp_column)
+
+    def supports(self, key):
+        """Whether the table has the watermark column of `key`."""
+        if key == 'timestamp':
+            return self.timestamp_column is not None
+        if key == 'updated':
+            return self.table.versioned
+        return True
+
+    def key_column(self, key):
+        if not self.supports(key):
+            raise ValueError(f"`{self.table.table_name}` has no {key} column; export it by primary key")
+        if key == 'timestamp':
+            return self.timestamp_column
+        if key == 'updated':
+            return 'updated_at'
+        return self.table.primary_key
+
+    def query(self, key, watermark, incremental=False):
+        column_list = ", ".join(f"`{column}`" for column in self.table.columns)
+        query = f"SELECT {column_list} FROM `{self.table.table_name}`"
+        if watermark is not None:
+            # Rows written in the watermark's second may have come after the
+            # last export read it; the loader drops the repeats by primary key
+            operator = '>' if key == 'pk' else '>='
+            query += f" WHERE `{self.key_column(key)}` {operator} :watermark"
+        elif incremental and key == 'updated':
+            # Nothing was updated before the last export: only rows updated since
+            query += " WHERE `updated_at` IS NOT NULL"
+        return query + f" ORDER BY `{self.table.primary_key}`;"
+
+    def export(self, incremental=False, key='pk'):
+        """
+        Write the table, or with `incremental` only the rows past the last export's watermark.
+
+        Returns:
+        int: Rows written.
+        """
+        pa = _pyarrow()
+        key_column = self.key_column(key)
+        previous = read_manifest(self.directory)
+        manifest = previous if incremental else None
+        if manifest is not None and (manifest['key'] != key or manifest['format'] != self.file_format):
+            raise ValueError(f"{self.directory} was exported by {manifest['key']} as {manifest['format']}; "
+                             f"run a full export to change either")
+        watermark = manifest['watermark'] if manifest is not None else None
+        if watermark is not None and key != 'pk':
+            watermark = datetime.fromisoformat(watermark)
+
+        os.makedirs(self.directory, exist_ok=True)
+        existing = previous['parts'] if previous is not None else []
+        first_part = max((int(part['file'][5:10]) for part in existing), default=-1) + 1
+        writer = PartWriter(self.directory, self.schema, self.file_format, self.partition_rows, first_part)
+        converters = [_converter(field.type) for field in self.schema]
+        key_index = self.table.columns.index(key_column)
+        total = 0
+        try:
+            with self.table.connect() as conn:
+                result = conn.execution_options(stream_results=True, yield_per=self.batch_size).execute(
+                    text(self.query(key, watermark, manifest is not None)),
+                    {'watermark': watermark} if watermark is not None else {}
+                )
+                for rows in result.partitions(self.batch_size):
+                    columns = list(zip(*rows))
+                    arrays = [
+                        pa.array(convert(values) if convert else values, type=field.type)
+                        for values, convert, field in zip(columns, converters, self.schema)
+                    ]
+                    writer.write(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+                    batch_max = max((value for value in columns[key_index] if value is not None), default=None)
+                    if batch_max is not None:
+                        batch_max = _timestamp(batch_max)
+                        watermark = batch_max if watermark is None else max(watermark, batch_max)
+                    total += len(rows)
+            writer.close()
+        except SQLAlchemyError as e:
+            print(f"Error exporting `{self.table.table_name}` after {total} rows: {e}")
+            raise
+
+        _write_manifest(self.directory, {
+            'table': self.table.table_name,
+            'primary_key': self.table.primary_key,
+            'key': key,
+            'format': self.file_format,
+            'watermark': watermark.isoformat() if isinstance(watermark, datetime) else watermark,
+            'exported_at': datetime.now(timezone.utc).isoformat(),
+            'parts': (manifest['parts'] if manifest is not None else []) + writer.parts,
+        })
+        # A full export replaces the previous parts once the new manifest is in place
+        if manifest is None:
+            for part in existing:
+                path = os.path.join(self.directory, part['file'])
+                if os.path.exists(path):
+                    os.remove(path)
+        return total
+
+
+def load_export(out, table_name, columns=None):
+    """
+    One exported table as a DataFrame with the table's nullable pandas dtypes.
+
+    Parts are memory-mapped rather than read into buffers first; rows that
+    incremental exports wrote more than once keep their latest version.
+
+    Args:
+    out (str): Directory the export was written to.
+    table_name (str): One of `EXPORT_TABLES`.
+    columns (list[str]): Columns to load, default all.
+    """
+    import pandas as pd
+
+    pa = _pyarrow()
+    directory = os.path.join(out, table_name)
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No export of `{table_name}` in {out}")
+    read_columns = columns
+    if columns is not None and manifest['primary_key'] not in columns:
+        read_columns = [manifest['primary_key']] + list(columns)
+
+    tables = []
+    for part in manifest['parts']:
+        path = os.path.join(directory, part['file'])
+        if manifest['format'] == 'arrow':
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            tables.append(table.select(read_columns) if read_columns is not None else table)
+        else:
+            tables.append(pa.parquet.read_table(path, columns=read_columns, memory_map=True))
+    if not tables:
+        schema = arrow_schema(*EXPORT_TABLES[table_name])
+        tables.append(schema.empty_table().select(read_columns) if read_columns is not None else schema.empty_table())
+
+    types = {
+        pa.int64(): pd.Int64Dtype(), pa.float64(): pd.Float64Dtype(),
+        pa.bool_(): pd.BooleanDtype(), pa.string(): pd.StringDtype(),
+    }
+    # Parts written before a migration added columns have them as nulls
+    frame = pa.concat_tables(tables, promote_options='default').to_pandas(types_mapper=types.get)
+    if len(manifest['parts']) > 1:
+        frame = frame.drop_duplicates(manifest['primary_key'], keep='last', ignore_index=True)
+    return frame[columns] if columns is not None else frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export tables to partitioned Parquet/Arrow files.")
+    parser.add_argument('--out', default='exports', help="directory to write `<table>/part-*` files into")
+    parser.add_argument('--tables', nargs='+', choices=EXPORT_TABLES, default=list(EXPORT_TABLES))
+    parser.add_argument('--format', choices=FORMATS, default='parquet')
+    parser.add_argument('--incremental', action='store_true', help="only export rows past the last export")
+    parser.add_argument('--key', choices=['pk', 'timestamp', 'updated'], default='pk',
+                        help="watermark column of incremental exports; timestamp applies to posts and comments, "
+                             "updated to users, posts and engagements")
+    parser.add_argument('--partition-rows', type=int, default=DEFAULT_PARTITION_ROWS)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    for table_name in args.tables:
+        export = TableExport(table_name, args.out, args.format, args.partition_rows, args.batch_size)
+        key = args.key if export.supports(args.key) else 'pk'
+        start = time.perf_counter()
+        total = export.export(args.incremental, key)
+        elapsed = time.perf_counter() - start
+        print(f"Exported {total} rows of `{table_name}` in {elapsed:.2f}s "
+              f"({total / elapsed if elapsed > 0 else total:.0f} rows/sec).")
+    Database.close_connection()
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,21 @@
 from database.database import BaseTable
 
 class Follower(BaseTable):
-    def __init__(self, drop=False):
-        super().__init__()
-        self.table_name = 'followers'
-
-        if drop:
-            self.drop_table()
-        else:
-            self.create_table()
-
-    def create_table(self):
-        try:
-            result = self.fetch_query(f"SHOW TABLES LIKE '{self.table_name}';")
-            if not result:
-                query = f"""
-                CREATE TABLE `{self.table_name}` (
-                    `follower_id` INT PRIMARY KEY AUTO_INCREMENT,
-                    `user_id` INT,
-                    `follower_user_id` INT,
-                    FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`),
-                    FOREIGN KEY (`follower_user_id`) REFERENCES `users`(`user_id`)
-                );
-                """
-                self.execute_query(query)
-        except ... as e:
-            pass
+    table_name = 'followers'
+    primary_key = 'follower_id'
+    columns = ['follower_id', 'user_id', 'follower_user_id']
+    dtypes = {'follower_id': 'Int64', 'user_id': 'Int64', 'follower_user_id': 'Int64'}
 
     def write(self, user_id, follower_user_id):
-        query = f"""
-        INSERT INTO `{self.table_name}` (`user_id`, `follower_user_id`)
-        VALUES (:user_id, :follower_user_id);
-        """
         params = {'user_id': user_id, 'follower_user_id': follower_user_id}
-        self.execute_query(query, params)
+        self.execute_query(self._insert_query(list(params)), params)
 
     def read(self):
-        query = f"SELECT * FROM `{self.table_name}`;"
-        return self.fetch_query(query)
+        return self.fetch_query(self._page_query())
 
     def delete(self, follower_id):
-        query = f"DELETE FROM `{self.table_name}` WHERE `follower_id` = :follower_id;"
-        params = {'follower_id': follower_id}
-        self.execute_query(query, params)
+        self.execute_query(self._delete_query(), {'row_id': follower_id})
+        self.invalidate(follower_id)
 
     def drop_table(self):
         self.execute_query(f"DROP TABLE IF EXISTS `{self.table_name}`;")
\ No newline at end of file
@@ -0,0 +1,310 @@
+from sqlalchemy.exc import SQLAlchemyError
+from dotenv import load_dotenv
+from .database import Database, sql
+import numpy as np
+import pandas as pd
+import os
+import threading
+import time
+
+# In-memory follower graph for mutuals, reach and related-creator queries.
+#
+# The `followers` and `related_profiles` tables are loaded once into
+# CSR-style adjacency arrays, so a query is a few array slices instead of
+# repeated self-joins in MySQL. Writes made through the API are applied to
+# the loaded graph as they happen; GRAPH_MAX_AGE (seconds, default 300)
+# bounds how long writes made by other processes go unseen before the graph
+# is rebuilt.
+
+# Overlay edges per adjacency before they are folded into the arrays
+COMPACT_THRESHOLD = 10000
+
+
+class Adjacency:
+    """
+    Directed adjacency lists in CSR form.
+
+    The neighbours of node `i` are `indices[indptr[i]:indptr[i + 1]]`,
+    sorted and without duplicates. Edges added or removed after the build
+    live in small per-node overlays until `compacted` folds them in.
+    """
+
+    def __init__(self, sources, targets, node_count):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        order = np.lexsort((targets, sources))
+        sources, targets = sources[order], targets[order]
+        if len(sources):
+            distinct = np.ones(len(sources), dtype=bool)
+            distinct[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+            sources, targets = sources[distinct], targets[distinct]
+
+        self.indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=node_count), out=self.indptr[1:])
+        self.indices = targets.astype(np.int32)
+        self._added = {}
+        self._removed = {}
+        self.pending = 0
+
+    def _base(self, node):
+        if node + 1 >= len(self.indptr):
+            return self.indices[:0]
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbors(self, node):
+        neighbors = self._base(node)
+        removed = self._removed.get(node)
+        if removed:
+            neighbors = neighbors[~np.isin(neighbors, list(removed))]
+        added = self._added.get(node)
+        if added:
+            neighbors = np.union1d(neighbors, np.fromiter(added, dtype=np.int32, count=len(added)))
+        return neighbors
+
+    def gather(self, nodes):
+        """Neighbours of every node in `nodes`, concatenated (a node reached twice appears twice)."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        overlaid = np.fromiter(self._added.keys() | self._removed.keys(), dtype=np.int64)
+        plain = nodes[~np.isin(nodes, overlaid) & (nodes + 1 < len(self.indptr))]
+
+        # Positions of every neighbour of `plain` in `indices`, without a Python loop
+        starts, lengths = self.indptr[plain], self.indptr[plain + 1] - self.indptr[plain]
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        parts = [self.indices[np.repeat(starts, lengths) + offsets]]
+        parts += [self.neighbors(node) for node in nodes[np.isin(nodes, overlaid)]]
+        return np.concatenate(parts)
+
+    def degree(self, node):
+        return len(self.neighbors(node))
+
+    def add(self, source, target):
+        self._removed.get(source, set()).discard(target)
+        self._added.setdefault(source, set()).add(target)
+        self.pending += 1
+
+    def remove(self, source, target):
+        self._added.get(source, set()).discard(target)
+        self._removed.setdefault(source, set()).add(target)
+        self.pending += 1
+
+    def compacted(self, node_count):
+        """A new `Adjacency` with the overlays folded into the arrays."""
+        sources = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        targets = self.indices.astype(np.int64)
+        removed = [(source, target) for source, targets_ in self._removed.items() for target in targets_]
+        if removed:
+            removed_keys = np.array([source * node_count + target for source, target in removed], dtype=np.int64)
+            keep = ~np.isin(sources * node_count + targets, removed_keys)
+            sources, targets = sources[keep], targets[keep]
+        added = [(source, target) for source, targets_ in self._added.items() for target in targets_]
+        if added:
+            added = np.array(added, dtype=np.int64)
+            sources = np.concatenate([sources, added[:, 0]])
+            targets = np.concatenate([targets, added[:, 1]])
+        return Adjacency(sources, targets, node_count)
+
+
+class FollowerGraph:
+    """
+    Follow edges between users plus related-profile edges from creators.
+
+    Nodes are user ids; a related profile whose username is not in `users`
+    becomes a node keyed by that username, so it can still be suggested.
+    """
+
+    def __init__(self, follows, related):
+        """
+        Args:
+        follows (DataFrame): `user_id`, `follower_user_id` columns.
+        related (DataFrame): `user_id`, `related_username`, `related_user_id`
+            (null when the related profile is not a known user).
+        """
+        related_keys = related['related_user_id'].astype(object).where(
+            related['related_user_id'].notna(), related['related_username']
+        )
+        keys = pd.concat([
+            follows['user_id'].astype(object), follows['follower_user_id'].astype(object),
+            related['user_id'].astype(object), related_keys
+        ], ignore_index=True)
+        codes, nodes = pd.factorize(keys)
+        self._keys = [key if isinstance(key, str) else int(key) for key in nodes]
+        self._index = {key: node for node, key in enumerate(self._keys)}
+        self._lock = threading.RLock()
+
+        follow_count, related_count = len(follows), len(related)
+        followed, follower = codes[:follow_count], codes[follow_count:2 * follow_count]
+        creator = codes[2 * follow_count:2 * follow_count + related_count]
+        profile = codes[2 * follow_count + related_count:]
+
+        node_count = len(self._keys)
+        self.followers = Adjacency(followed, follower, node_count)
+        self.following = Adjacency(follower, followed, node_count)
+        self.related = Adjacency(creator, profile, node_count)
+        self.related_by = Adjacency(profile, creator, node_count)
+
+    @classmethod
+    def load(cls, engine=None):
+        """Build the graph from the `followers` and `related_profiles` tables."""
+        engine = engine or Database.get_engine()
+        try:
+            with engine.connect() as conn:
+                follows = pd.read_sql(
+                    sql("SELECT `user_id`, `follower_user_id` FROM `followers` "
+                         "WHERE `user_id` IS NOT NULL AND `follower_user_id` IS NOT NULL;"),
+                    conn, dtype={'user_id': 'int64', 'follower_user_id': 'int64'}
+                )
+                related = pd.read_sql(
+                    sql("""
+                    SELECT `r`.`user_id`, `r`.`related_username`, `u`.`user_id` AS `related_user_id`
+                    FROM `related_profiles` AS `r`
+                    LEFT JOIN `users` AS `u` ON `u`.`username` = `r`.`related_username`;
+                    """),
+                    conn, dtype={'user_id': 'int64', 'related_username': 'object', 'related_user_id': 'Int64'}
+                )
+        except SQLAlchemyError as e:
+            print(f"Error loading the follower graph: {e}")
+            raise
+        return cls(follows, related)
+
+    @property
+    def node_count(self):
+        return len(self._keys)
+
+    def _node(self, key, create=False):
+        node = self._index.get(key)
+        if node is None and create:
+            node = self._index[key] = len(self._keys)
+            self._keys.append(key)
+        return node
+
+    def _user_ids(self, nodes):
+        return [self._keys[node] for node in nodes]
+
+    def _profile(self, node):
+        key = self._keys[node]
+        return {'user_id': None, 'username': key} if isinstance(key, str) else {'user_id': key, 'username': None}
+
+    # --- Incremental updates ---
+
+    def _maybe_compact(self):
+        if max(adjacency.pending for adjacency in (self.followers, self.following, self.related)) < COMPACT_THRESHOLD:
+            return
+        node_count = self.node_count
+        self.followers = self.followers.compacted(node_count)
+        self.following = self.following.compacted(node_count)
+        self.related = self.related.compacted(node_count)
+        self.related_by = self.related_by.compacted(node_count)
+
+    def add_follow(self, user_id, follower_user_id):
+        with self._lock:
+            followed, follower = self._node(user_id, create=True), self._node(follower_user_id, create=True)
+            self.followers.add(followed, follower)
+            self.following.add(follower, followed)
+            self._maybe_compact()
+
+    def remove_follow(self, user_id, follower_user_id):
+        with self._lock:
+            followed, follower = self._node(user_id), self._node(follower_user_id)
+            if followed is None or follower is None:
+                return
+            self.followers.remove(followed, follower)
+            self.following.remove(follower, followed)
+            self._maybe_compact()
+
+    def add_related(self, user_id, related_username, related_user_id=None):
+        with self._lock:
+            creator = self._node(user_id, create=True)
+            profile = self._node(related_user_id if related_user_id is not None else related_username, create=True)
+            self.related.add(creator, profile)
+            self.related_by.add(profile, creator)
+            self._maybe_compact()
+
+    # --- Queries ---
+
+    def mutuals(self, user_id):
+        """Users who follow `user_id` and are followed back by it."""
+        with self._lock:
+            node = self._node(user_id)
+            if node is None:
+                return []
+            return self._user_ids(np.intersect1d(self.followers.neighbors(node), self.following.neighbors(node)))
+
+    def common_followers(self, user_id, other_user_id):
+        """Users following both `user_id` and `other_user_id`."""
+        with self._lock:
+            node, other = self._node(user_id), self._node(other_user_id)
+            if node is None or other is None:
+                return []
+            return self._user_ids(np.intersect1d(self.followers.neighbors(node), self.followers.neighbors(other)))
+
+    def reach(self, user_id, hops=2):
+        """
+        Distinct accounts within `hops` follower hops of `user_id`: its
+        followers, their followers, and so on.
+
+        Returns:
+        dict: `per_hop` (new accounts reached at each hop) and `total`.
+        """
+        with self._lock:
+            per_hop = []
+            node = self._node(user_id)
+            if node is not None:
+                seen = np.zeros(self.node_count, dtype=bool)
+                seen[node] = True
+                frontier = np.array([node], dtype=np.int64)
+                for _ in range(hops):
+                    reached = np.unique(self.followers.gather(frontier))
+                    frontier = reached[~seen[reached]]
+                    seen[frontier] = True
+                    per_hop.append(len(frontier))
+            per_hop += [0] * (hops - len(per_hop))
+            return {'per_hop': per_hop, 'total': sum(per_hop)}
+
+    def related_creators(self, user_id, limit=20):
+        """
+        Creators related to `user_id`, ranked by how many similar creators list them.
+
+        Similar creators are those sharing at least one related profile with
+        `user_id`; a profile's score is the number of them (including
+        `user_id`) that list it. `direct` marks profiles `user_id` lists itself.
+        """
+        with self._lock:
+            node = self._node(user_id)
+            if node is None:
+                return []
+            direct = self.related.neighbors(node)
+            similar = np.union1d(self.related_by.gather(direct), [node]).astype(np.int64)
+            scores = np.bincount(self.related.gather(similar), minlength=self.node_count)
+            scores[node] = 0
+            # Rank by score, direct profiles first on ties
+            candidates = np.flatnonzero(scores)
+            is_direct = np.isin(candidates, direct)
+            order = np.lexsort((~is_direct, -scores[candidates]))[:limit]
+            return [
+                {**self._profile(candidates[i]), 'score': int(scores[candidates[i]]), 'direct': bool(is_direct[i])}
+                for i in order
+            ]
+
+
+_graph = None
+_built_at = 0.0
+_max_age = None
+_build_lock = threading.Lock()
+
+def get_graph():
+    """The process-wide graph, (re)built from the database when missing or older than GRAPH_MAX_AGE."""
+    global _graph, _built_at, _max_age
+    with _build_lock:
+        if _max_age is None:
+            load_dotenv(override=True)
+            _max_age = float(os.getenv('GRAPH_MAX_AGE', 300))
+        if _graph is None or time.monotonic() - _built_at > _max_age:
+            start = time.perf_counter()
+            _graph = FollowerGraph.load()
+            _built_at = time.monotonic()
+            print(f"Built the follower graph ({_graph.node_count} nodes) in {time.perf_counter() - start:.2f}s.")
+    return _graph
+
+def loaded_graph():
+    """The process-wide graph if it has been built, else None; writes only update a loaded graph."""
+    return _graph
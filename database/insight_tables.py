@@ -0,0 +1,257 @@
+from sqlalchemy.exc import SQLAlchemyError
+from .database import BaseTable, Database, sql, statement
+import argparse
+import time
+
+# Materialized dashboard aggregates, kept in step with posts and engagements.
+#
+# user_stats and media_type_stats hold running totals per creator and per
+# creator/media type; post_stats holds each engaged post's counts with an
+# `interactions` column indexed for top-post reads. Post and engagement
+# writes apply deltas to them in their own transaction (the `inserted`,
+# `updated` and `deleted` hooks of Post and Engagement). Loaders that go
+# through `bulk_write` skip the hooks and end with `rebuild()`, which is
+# also run by `python -m database.insight_tables --rebuild`.
+
+COUNTS = ('likes', 'comments', 'shares', 'views')
+
+# Posts without a media type are grouped under this key
+UNKNOWN_MEDIA_TYPE = 'unknown'
+
+
+# The hook statements are parsed once, at import; only their rows change per write
+
+# Scalar subqueries rather than UPDATE ... JOIN, which only MySQL has
+_SUBTRACTED_TOTALS = ", ".join(
+    f"`{count}_total` = `{count}_total` - "
+    f"COALESCE((SELECT `{count}_count` FROM `post_stats` WHERE `post_id` = :post_id), 0)"
+    for count in COUNTS
+)
+_POST_DELETED = [sql(query) for query in (
+    f"""
+    UPDATE `user_stats` SET {_SUBTRACTED_TOTALS}
+    WHERE `user_id` = :user_id;
+    """,
+    f"""
+    UPDATE `media_type_stats` SET {_SUBTRACTED_TOTALS}
+    WHERE `user_id` = :user_id AND `media_type` = :media_type;
+    """,
+    "DELETE FROM `post_stats` WHERE `post_id` = :post_id;",
+    "UPDATE `user_stats` SET `post_count` = `post_count` - 1 WHERE `user_id` = :user_id;",
+    """
+    UPDATE `media_type_stats` SET `post_count` = `post_count` - 1
+    WHERE `user_id` = :user_id AND `media_type` = :media_type;
+    """,
+)]
+_POST_INSERTED = [sql(query) for query in (
+    """
+    INSERT INTO `user_stats` (`user_id`, `post_count`) VALUES (:user_id, 1)
+    ON DUPLICATE KEY UPDATE `post_count` = `post_count` + 1;
+    """,
+    """
+    INSERT INTO `media_type_stats` (`user_id`, `media_type`, `post_count`) VALUES (:user_id, :media_type, 1)
+    ON DUPLICATE KEY UPDATE `post_count` = `post_count` + 1;
+    """,
+)]
+
+
+def _engagement_queries():
+    values = ", ".join(f":{count}" for count in COUNTS)
+    post_counts = ", ".join(f"`{count}_count`" for count in COUNTS)
+    post_updates = ", ".join(f"`{count}_count` = `{count}_count` + :{count}" for count in COUNTS)
+    totals = ", ".join(f"`{count}_total`" for count in COUNTS)
+    total_updates = ", ".join(f"`{count}_total` = `{count}_total` + :{count}" for count in COUNTS)
+    media_type = f"COALESCE(`media_type`, '{UNKNOWN_MEDIA_TYPE}')"
+    return [sql(query) for query in (
+        f"""
+        INSERT INTO `post_stats` (`post_id`, `user_id`, `media_type`, {post_counts})
+        SELECT `post_id`, `user_id`, {media_type}, {values} FROM `posts`
+        WHERE `post_id` = :post_id AND `user_id` IS NOT NULL
+        ON DUPLICATE KEY UPDATE {post_updates};
+        """,
+        f"""
+        INSERT INTO `user_stats` (`user_id`, {totals})
+        SELECT `user_id`, {values} FROM `posts`
+        WHERE `post_id` = :post_id AND `user_id` IS NOT NULL
+        ON DUPLICATE KEY UPDATE {total_updates};
+        """,
+        f"""
+        INSERT INTO `media_type_stats` (`user_id`, `media_type`, {totals})
+        SELECT `user_id`, {media_type}, {values} FROM `posts`
+        WHERE `post_id` = :post_id AND `user_id` IS NOT NULL
+        ON DUPLICATE KEY UPDATE {total_updates};
+        """,
+    )]
+
+_ENGAGEMENT_CHANGED = _engagement_queries()
+
+
+def post_statements(rows, sign=1):
+    """
+    Deltas for posts created (`sign` 1) or deleted (`sign` -1).
+
+    Rows carry `user_id` and `media_type`, plus `post_id` when deleting so
+    the post's engagement is taken out of the totals as well.
+    """
+    rows = [
+        {**row, 'media_type': row.get('media_type') or UNKNOWN_MEDIA_TYPE}
+        for row in rows if row.get('user_id') is not None
+    ]
+    return [(query, rows) for query in (_POST_DELETED if sign < 0 else _POST_INSERTED)]
+
+
+def engagement_delta(row, sign=1):
+    """The counts of an engagement row as a delta on its post, negated for `sign` -1."""
+    return {'post_id': row['post_id'], **{count: sign * (row.get(f'{count}_count') or 0) for count in COUNTS}}
+
+
+def engagement_statements(deltas):
+    """Apply engagement deltas (`post_id` plus one value per `COUNTS`) to the post, creator and media type."""
+    deltas = [delta for delta in deltas if delta['post_id'] is not None and any(delta[count] for count in COUNTS)]
+    return [(query, deltas) for query in _ENGAGEMENT_CHANGED]
+
+
+def engagement_change_statements(before, after):
+    """Deltas for an engagement row changed from `before` to `after`."""
+    if before['post_id'] == after['post_id']:
+        after_delta, before_delta = engagement_delta(after), engagement_delta(before)
+        return engagement_statements([{
+            'post_id': after['post_id'], **{count: after_delta[count] - before_delta[count] for count in COUNTS}
+        }])
+    return engagement_statements([engagement_delta(before, -1), engagement_delta(after)])
+
+
+def _averages(row):
+    posts = row['post_count'] or 0
+    for count in COUNTS:
+        row[f'avg_{count}'] = row[f'{count}_total'] / posts if posts else None
+    return row
+
+
+def dashboard(summary_rows, media_type_rows, top_post_rows):
+    """Assemble the dashboard of one creator from the rows of the three dashboard queries; None if it has no stats."""
+    if not summary_rows:
+        return None
+    summary = _averages(summary_rows[0])
+    followers = summary.pop('followers_count', None)
+    interactions = sum(summary[f'avg_{count}'] or 0 for count in ('likes', 'comments', 'shares'))
+    summary['engagement_rate'] = interactions / followers if followers and summary['post_count'] else None
+    return {
+        **summary,
+        'media_types': [_averages(row) for row in media_type_rows or []],
+        'top_posts': top_post_rows or [],
+    }
+
+
+class InsightTables(BaseTable):
+    """Reads and rebuilds of the materialized dashboard tables."""
+    table_name = 'user_stats'
+    primary_key = 'user_id'
+    columns = ['user_id', 'post_count'] + [f'{count}_total' for count in COUNTS]
+
+    @statement
+    def summary_query(self):
+        column_list = ", ".join(f"`s`.`{column}`" for column in self.columns)
+        return f"""
+        SELECT {column_list}, `u`.`followers_count`
+        FROM `user_stats` AS `s` LEFT JOIN `users` AS `u` ON `u`.`user_id` = `s`.`user_id`
+        WHERE `s`.`user_id` = :user_id;
+        """
+
+    @statement
+    def media_types_query(self):
+        totals = ", ".join(f"`{count}_total`" for count in COUNTS)
+        return f"""
+        SELECT `media_type`, `post_count`, {totals} FROM `media_type_stats`
+        WHERE `user_id` = :user_id ORDER BY `media_type`;
+        """
+
+    def _post_stats_select(self):
+        # Engagement rate of a post: its interactions per follower of its creator
+        counts = ", ".join(f"`p`.`{count}_count`" for count in COUNTS)
+        return f"""
+        SELECT `p`.`post_id`, `p`.`user_id`, `p`.`media_type`, {counts}, `p`.`interactions`,
+               `p`.`interactions` * 1.0 / NULLIF(`u`.`followers_count`, 0) AS `engagement_rate`
+        FROM `post_stats` AS `p` LEFT JOIN `users` AS `u` ON `u`.`user_id` = `p`.`user_id`
+        """
+
+    @statement
+    def top_posts_query(self):
+        return self._post_stats_select() + """
+        WHERE `p`.`user_id` = :user_id ORDER BY `p`.`interactions` DESC LIMIT :limit;
+        """
+
+    @statement
+    def post_query(self):
+        return self._post_stats_select() + """
+        WHERE `p`.`post_id` = :post_id;
+        """
+
+    def dashboard(self, user_id, top=10):
+        """Totals, averages, engagement rate, per-media-type averages and top posts of one creator."""
+        params = {'user_id': user_id, 'limit': top}
+        return dashboard(
+            self.fetch_dicts(self.summary_query(), params),
+            self.fetch_dicts(self.media_types_query(), params),
+            self.fetch_dicts(self.top_posts_query(), params),
+        )
+
+    def rebuild(self):
+        """Recompute every materialized table from posts and engagements in one transaction."""
+        media_type = f"COALESCE(`p`.`media_type`, '{UNKNOWN_MEDIA_TYPE}')"
+        post_counts = ", ".join(f"`{count}_count`" for count in COUNTS)
+        engagement_counts = ", ".join(f"COALESCE(`e`.`{count}_count`, 0)" for count in COUNTS)
+        totals = ", ".join(f"`{count}_total`" for count in COUNTS)
+        sums = ", ".join(f"COALESCE(SUM(`s`.`{count}_count`), 0)" for count in COUNTS)
+        statements = [
+            "DELETE FROM `post_stats`;",
+            "DELETE FROM `user_stats`;",
+            "DELETE FROM `media_type_stats`;",
+            f"""
+            INSERT INTO `post_stats` (`post_id`, `user_id`, `media_type`, {post_counts})
+            SELECT `p`.`post_id`, `p`.`user_id`, {media_type}, {engagement_counts}
+            FROM `posts` AS `p` JOIN `engagements` AS `e` ON `e`.`post_id` = `p`.`post_id`
+            WHERE `p`.`user_id` IS NOT NULL;
+            """,
+            f"""
+            INSERT INTO `user_stats` (`user_id`, `post_count`, {totals})
+            SELECT `p`.`user_id`, COUNT(*), {sums}
+            FROM `posts` AS `p` LEFT JOIN `post_stats` AS `s` ON `s`.`post_id` = `p`.`post_id`
+            WHERE `p`.`user_id` IS NOT NULL
+            GROUP BY `p`.`user_id`;
+            """,
+            f"""
+            INSERT INTO `media_type_stats` (`user_id`, `media_type`, `post_count`, {totals})
+            SELECT `p`.`user_id`, {media_type}, COUNT(*), {sums}
+            FROM `posts` AS `p` LEFT JOIN `post_stats` AS `s` ON `s`.`post_id` = `p`.`post_id`
+            WHERE `p`.`user_id` IS NOT NULL
+            GROUP BY `p`.`user_id`, {media_type};
+            """,
+        ]
+        start = time.perf_counter()
+        try:
+            with self.begin() as conn:
+                for query in statements:
+                    conn.execute(sql(query))
+        except SQLAlchemyError as e:
+            print(f"Error rebuilding insight tables: {e}")
+            raise
+        print(f"Rebuilt insight tables in {time.perf_counter() - start:.2f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the materialized insight tables.")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="recompute user_stats, media_type_stats and post_stats from posts and engagements")
+    parser.add_argument('--user', type=int, help="print the dashboard of one creator")
+    args = parser.parse_args()
+
+    tables = InsightTables()
+    if args.rebuild:
+        tables.rebuild()
+    if args.user is not None:
+        print(tables.dashboard(args.user))
+    Database.close_connection()
+
+if __name__ == "__main__":
+    main()
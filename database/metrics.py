@@ -0,0 +1,264 @@
+from sqlalchemy import event
+from dotenv import load_dotenv
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+# Request and query instrumentation, exported in the Prometheus text format.
+#
+# The API records one latency observation per request, labelled by route
+# template (`/users/{user_id}`, not `/users/42`) so the series stay bounded.
+# `instrument_engine` hooks SQLAlchemy's cursor events, so every statement
+# either engine runs is timed and counted under its normalized SQL: literals
+# and bind parameters become `?` and `IN (...)` lists of any length collapse
+# to one form. Statements slower than SLOW_QUERY_MS (default 200) are logged;
+# STRUCTURED_LOGS=true writes those and one line per request as JSON.
+
+# Latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Distinct normalized statements tracked; later ones are counted under `other`
+MAX_QUERY_SERIES = 500
+
+logger = logging.getLogger('lytport')
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, as Prometheus expects it."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, observations at or below it) per bucket, ending with +Inf."""
+        total, pairs = 0, []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class QueryStats:
+    """Timing, rows and errors of one normalized statement."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"%\([^)]*\)s|%s|\?|:\w+")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+def normalize_sql(statement):
+    """`statement` with literals and parameters as `?`, `(?, ?, ...)` lists as `(...)` and whitespace collapsed."""
+    statement = _LITERAL.sub('?', statement)
+    statement = _PARAMETER.sub('?', statement)
+    statement = _LIST.sub('(...)', statement)
+    return _SPACE.sub(' ', statement).strip().rstrip(';').strip()
+
+
+class Metrics:
+    """Process-wide request and query metrics."""
+
+    def __init__(self, slow_query_seconds=0.2, structured_logs=False):
+        self.slow_query_seconds = slow_query_seconds
+        self.structured_logs = structured_logs
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.queries = {}
+        self.slow_queries = 0
+
+    def record_request(self, method, route, status, seconds):
+        with self._lock:
+            histogram = self.requests.get((method, route, status))
+            if histogram is None:
+                histogram = self.requests[(method, route, status)] = Histogram()
+            histogram.observe(seconds)
+        if self.structured_logs:
+            log_event('request', method=method, route=route, status=status, duration_ms=round(seconds * 1000, 3))
+
+    def _query(self, statement):
+        stats = self.queries.get(statement)
+        if stats is None:
+            if len(self.queries) >= MAX_QUERY_SERIES:
+                statement = 'other'
+                stats = self.queries.get(statement)
+            if stats is None:
+                stats = self.queries[statement] = QueryStats()
+        return stats
+
+    def record_query(self, statement, seconds, rows, failed=False):
+        normalized = normalize_sql(statement)
+        with self._lock:
+            stats = self._query(normalized)
+            stats.latency.observe(seconds)
+            if rows > 0:
+                stats.rows += rows
+            if failed:
+                stats.errors += 1
+            slow = seconds >= self.slow_query_seconds
+            if slow:
+                self.slow_queries += 1
+        if slow:
+            log_event('slow_query', level=logging.WARNING, statement=normalized,
+                      duration_ms=round(seconds * 1000, 3), rows=rows, failed=failed)
+
+    def snapshot(self):
+        with self._lock:
+            requests = {key: (histogram.cumulative(), histogram.sum) for key, histogram in self.requests.items()}
+            queries = {
+                statement: (stats.latency.cumulative(), stats.latency.sum, stats.rows, stats.errors)
+                for statement, stats in self.queries.items()
+            }
+            return requests, queries, self.slow_queries
+
+
+def log_event(event_name, level=logging.INFO, **fields):
+    """Log one event, as a JSON object when STRUCTURED_LOGS is on and as `key=value` pairs otherwise."""
+    if get_metrics().structured_logs:
+        message = json.dumps({'event': event_name, 'time': time.time(), **fields}, default=str)
+    else:
+        message = event_name + ' ' + ' '.join(f'{key}={value!r}' for key, value in fields.items())
+    logger.log(level, message)
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    """The process-wide metrics, configured from the environment on first use."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            load_dotenv(override=True)
+            structured = os.getenv('STRUCTURED_LOGS', '').strip().lower() in ('1', 'true', 'yes', 'on')
+            _metrics = Metrics(float(os.getenv('SLOW_QUERY_MS', 200)) / 1000, structured)
+            if not logger.handlers:
+                handler = logging.StreamHandler()
+                handler.setFormatter(logging.Formatter('%(message)s' if structured else '%(levelname)s %(name)s: %(message)s'))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+    return _metrics
+
+
+# --- Engine hooks ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    # Rows returned by a buffered SELECT, rows affected by a write; -1 or
+    # unknown for server-side cursors, which are not counted
+    rows = getattr(cursor, 'rowcount', -1)
+    get_metrics().record_query(statement, seconds, rows if isinstance(rows, int) and rows < 2 ** 63 - 1 else -1)
+
+def _handle_error(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started and context.statement is not None:
+        get_metrics().record_query(context.statement, time.perf_counter() - started.pop(), -1, failed=True)
+
+def instrument_engine(engine):
+    """Time every statement `engine` runs; an async engine is instrumented through its sync core."""
+    engine = getattr(engine, 'sync_engine', engine)
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+    return engine
+
+
+# --- Prometheus exposition ---
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label(value)}"' for name, value in labels.items()) + '}'
+
+def _bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+def _histogram_lines(name, labels, cumulative, total):
+    lines = [f'{name}_bucket{_labels(**labels, le=_bound(bound))} {count}' for bound, count in cumulative]
+    lines.append(f'{name}_sum{_labels(**labels)} {total}')
+    lines.append(f'{name}_count{_labels(**labels)} {cumulative[-1][1]}')
+    return lines
+
+def render_prometheus(pools=None, cache=None):
+    """
+    Every metric in the Prometheus text exposition format.
+
+    Args:
+    pools (dict): engine name -> `Database.pool_status()` snapshot.
+    cache (dict): `CacheStats.snapshot()` of the row cache.
+    """
+    requests, queries, slow_queries = get_metrics().snapshot()
+    lines = [
+        '# HELP lytport_http_request_duration_seconds Time to the response start, per route template.',
+        '# TYPE lytport_http_request_duration_seconds histogram',
+    ]
+    for (method, route, status), (cumulative, total) in sorted(requests.items()):
+        lines += _histogram_lines('lytport_http_request_duration_seconds',
+                                  {'method': method, 'route': route, 'status': status}, cumulative, total)
+
+    lines += [
+        '# HELP lytport_db_query_duration_seconds Statement execution time, per normalized statement.',
+        '# TYPE lytport_db_query_duration_seconds histogram',
+    ]
+    for statement, (cumulative, total, _, _) in sorted(queries.items()):
+        lines += _histogram_lines('lytport_db_query_duration_seconds', {'statement': statement}, cumulative, total)
+    lines += [
+        '# HELP lytport_db_query_rows_total Rows returned or affected, per normalized statement.',
+        '# TYPE lytport_db_query_rows_total counter',
+    ]
+    lines += [f'lytport_db_query_rows_total{_labels(statement=statement)} {rows}'
+              for statement, (_, _, rows, _) in sorted(queries.items())]
+    lines += [
+        '# HELP lytport_db_query_errors_total Failed executions, per normalized statement.',
+        '# TYPE lytport_db_query_errors_total counter',
+    ]
+    lines += [f'lytport_db_query_errors_total{_labels(statement=statement)} {errors}'
+              for statement, (_, _, _, errors) in sorted(queries.items())]
+    lines += [
+        '# HELP lytport_db_slow_queries_total Statements slower than SLOW_QUERY_MS.',
+        '# TYPE lytport_db_slow_queries_total counter',
+        f'lytport_db_slow_queries_total {slow_queries}',
+    ]
+
+    # `pool_status()` key -> metric name, type and help; counters end in _total
+    pool_series = {
+        'checkouts': ('checkouts_total', 'counter', 'Connections checked out of the pool.'),
+        'timeouts': ('timeouts_total', 'counter', 'Checkouts that timed out waiting for a connection.'),
+        'wait_seconds_total': ('wait_seconds_total', 'counter', 'Total time spent waiting for a connection.'),
+        'wait_seconds_max': ('wait_seconds_max', 'gauge', 'Longest wait for a connection.'),
+        'checked_out': ('checked_out', 'gauge', 'Connections currently checked out.'),
+        'checked_in': ('checked_in', 'gauge', 'Idle connections in the pool.'),
+        'overflow': ('overflow', 'gauge', 'Connections open beyond POOL_SIZE.'),
+    }
+    for key, (metric, kind, description) in pool_series.items():
+        name = f'lytport_db_pool_{metric}'
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{_labels(engine=engine)} {status[key]}' for engine, status in (pools or {}).items()]
+
+    if cache is not None:
+        for key in ('hits', 'misses', 'invalidations'):
+            name = f'lytport_cache_{key}_total'
+            lines += [f'# HELP {name} Row cache {key}.', f'# TYPE {name} counter', f'{name} {cache[key]}']
+    return '\n'.join(lines) + '\n'
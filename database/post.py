@@ -1,66 +1,59 @@
-from database.database import BaseTable
-from sqlalchemy.exc import SQLAlchemyError
+from database.database import BaseTable, statement
+from database.insight_tables import post_statements
+from database.tags import retag_statements, tag_statements
 
 class Post(BaseTable):
-    def __init__(self, drop = False):
-        super().__init__()
-        self.table_name = 'posts'
-        
-        if drop:
-            self.drop_table()
-        else:
-            self.create_table()
-
-    def create_table(self):
-        try:
-            result = self.fetch_query(f"SHOW TABLES LIKE '{self.table_name}';")
-            if not result:
-                query = f"""
-                CREATE TABLE `{self.table_name}` (
-                    `post_id` INT PRIMARY KEY AUTO_INCREMENT,
-                    `user_id` INT,
-                    `media_type` VARCHAR(50),
-                    `media_url` VARCHAR(255),
-                    `caption` TEXT,
-                    `timestamp` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`)
-                );
-                """
-                self.execute_query(query)
-
-        except SQLAlchemyError as e:
-            pass
+    table_name = 'posts'
+    primary_key = 'post_id'
+    columns = ['post_id', 'user_id', 'media_type', 'media_url', 'caption', 'timestamp', 'version', 'updated_at']
+    dtypes = {
+        'post_id': 'Int64', 'user_id': 'Int64', 'media_type': 'string', 'media_url': 'string',
+        'caption': 'string', 'timestamp': 'string', 'version': 'Int64', 'updated_at': 'datetime64[ns]'
+    }
+    track_changes = True
+    hooks_read_last_insert_id = True
+    versioned = True
+
+    @statement
+    def _write_query(self):
+        return f"""
+        INSERT INTO `{self.table_name}` (`user_id`, `media_type`, `media_url`, `caption`, `timestamp`, `updated_at`)
+        VALUES (:user_id, :media_type, :media_url, :caption, CURRENT_TIMESTAMP, :updated_at);
+        """
 
     def write(self, user_id, media_type, media_url, caption):
-        query = f"""
-        INSERT INTO `{self.table_name}` (`user_id`, `media_type`, `media_url`, `caption`, `timestamp`)
-        VALUES (:user_id, :media_type, :media_url, :caption, CURRENT_TIMESTAMP);
-        """
-        params = {
+        params = self.stamp({
             'user_id': user_id,
             'media_type': media_type,
             'media_url': media_url,
             'caption': caption
-        }
-        self.execute_query(query, params)
+        })
+        self.execute_query(self._write_query(), params, self.inserted([params]))
 
     def read(self):
-        query = f"SELECT * FROM `{self.table_name}`;"
-        return self.fetch_query(query)
+        return self.fetch_query(self._page_query())
 
     def update(self, post_id, caption=None):
-        query = f"""
-        UPDATE `{self.table_name}` SET 
-            `caption` = COALESCE(:caption, `caption`)
-        WHERE `post_id` = :post_id;
-        """
-        params = {'post_id': post_id, 'caption': caption}
-        self.execute_query(query, params)
+        params = self.stamp({'row_id': post_id, 'caption': caption})
+        self.execute_change(self._update_query(['caption']), params, post_id)
+        self.invalidate(post_id)
 
     def delete(self, post_id):
-        query = f"DELETE FROM `{self.table_name}` WHERE `post_id` = :post_id;"
-        params = {'post_id': post_id}
-        self.execute_query(query, params)
+        self.execute_change(self._delete_query(), {'row_id': post_id}, post_id, deleting=True)
+        self.invalidate(post_id)
+
+    # Keep the caption tags and the materialized insight tables in step
+    # (see database.tags and database.insight_tables); tags are deleted
+    # with their post by the foreign key
+    def inserted(self, rows):
+        # Tags first: they may rely on LAST_INSERT_ID() of the post insert
+        return tag_statements(rows) + post_statements(rows)
+
+    def updated(self, before, after):
+        return retag_statements(before, after)
+
+    def deleted(self, rows):
+        return post_statements(rows, sign=-1)
 
 
     def drop_table(self):
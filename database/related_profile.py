@@ -0,0 +1,16 @@
+from database.database import BaseTable
+
+
+class RelatedProfile(BaseTable):
+    # The "related profiles" Instagram lists on a creator's page. The related
+    # side is only known by username; it may or may not be a row in `users`.
+    table_name = 'related_profiles'
+    columns = ['user_id', 'related_username']
+    dtypes = {'user_id': 'Int64', 'related_username': 'string'}
+
+    def read_for_user(self, user_id):
+        query = f"SELECT `related_username` FROM `{self.table_name}` WHERE `user_id` = :user_id;"
+        return self.fetch_dicts(query, {'user_id': user_id})
+
+    def drop_table(self):
+        self.execute_query(f"DROP TABLE IF EXISTS `{self.table_name}`;")
@@ -0,0 +1,350 @@
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from .database import Database
+import argparse
+import sys
+
+# Versioned schema migrations, applied once per deployment with
+# `python -m database.schema`. Applied versions are recorded in
+# `schema_version`; never edit a released migration, append a new one.
+# Statements are written for MySQL and translated for the other backends
+# by `database.dialects`.
+#
+# Version 1 uses IF NOT EXISTS so databases created by the old per-table
+# `create_table` methods adopt it as their baseline.
+MIGRATIONS = [
+    (1, "create users, posts, followers, engagements and comments", [
+        """
+        CREATE TABLE IF NOT EXISTS `users` (
+            `user_id` BIGINT PRIMARY KEY AUTO_INCREMENT,
+            `username` VARCHAR(255),
+            `bio` TEXT,
+            `followers_count` INT,
+            `following_count` INT,
+            `location` VARCHAR(255),
+            `is_influential` BOOLEAN
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `posts` (
+            `post_id` BIGINT PRIMARY KEY AUTO_INCREMENT,
+            `user_id` BIGINT,
+            `media_type` VARCHAR(50),
+            `media_url` VARCHAR(255),
+            `caption` TEXT,
+            `timestamp` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `followers` (
+            `follower_id` INT PRIMARY KEY AUTO_INCREMENT,
+            `user_id` BIGINT,
+            `follower_user_id` BIGINT,
+            FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`),
+            FOREIGN KEY (`follower_user_id`) REFERENCES `users`(`user_id`)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `engagements` (
+            `engagement_id` INT PRIMARY KEY AUTO_INCREMENT,
+            `post_id` BIGINT,
+            `likes_count` INT,
+            `comments_count` INT,
+            `shares_count` INT,
+            `video_completion_rate` FLOAT,
+            FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `comments` (
+            `comment_id` INT PRIMARY KEY AUTO_INCREMENT,
+            `post_id` BIGINT,
+            `user_id` BIGINT,
+            `message` TEXT,
+            `like_count` INT,
+            `timestamp` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`),
+            FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`)
+        );
+        """,
+    ]),
+    (2, "index the username, follower, post and comment lookup paths", [
+        "CREATE UNIQUE INDEX `ux_users_username` ON `users` (`username`);",
+        "CREATE INDEX `ix_followers_user_follower` ON `followers` (`user_id`, `follower_user_id`);",
+        "CREATE INDEX `ix_posts_user_timestamp` ON `posts` (`user_id`, `timestamp`);",
+        "CREATE INDEX `ix_comments_post_timestamp` ON `comments` (`post_id`, `timestamp`);",
+        "CREATE UNIQUE INDEX `ux_engagements_post` ON `engagements` (`post_id`);",
+    ]),
+    (3, "append-only engagement snapshots with hourly and daily rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS `engagement_snapshots` (
+            `post_id` BIGINT NOT NULL,
+            `captured_at` DATETIME NOT NULL,
+            `likes_count` INT,
+            `comments_count` INT,
+            `shares_count` INT,
+            `video_completion_rate` FLOAT,
+            PRIMARY KEY (`post_id`, `captured_at`),
+            FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `engagement_hourly` (
+            `post_id` BIGINT NOT NULL,
+            `bucket` DATETIME NOT NULL,
+            `first_captured_at` DATETIME NOT NULL,
+            `first_likes_count` INT,
+            `first_comments_count` INT,
+            `last_captured_at` DATETIME NOT NULL,
+            `last_likes_count` INT,
+            `last_comments_count` INT,
+            `last_shares_count` INT,
+            PRIMARY KEY (`post_id`, `bucket`),
+            FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `engagement_daily` (
+            `post_id` BIGINT NOT NULL,
+            `bucket` DATETIME NOT NULL,
+            `first_captured_at` DATETIME NOT NULL,
+            `first_likes_count` INT,
+            `first_comments_count` INT,
+            `last_captured_at` DATETIME NOT NULL,
+            `last_likes_count` INT,
+            `last_comments_count` INT,
+            `last_shares_count` INT,
+            PRIMARY KEY (`post_id`, `bucket`),
+            FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`)
+        );
+        """,
+    ]),
+    (4, "related profiles of creators, for the follower graph", [
+        """
+        CREATE TABLE IF NOT EXISTS `related_profiles` (
+            `user_id` BIGINT NOT NULL,
+            `related_username` VARCHAR(255) NOT NULL,
+            PRIMARY KEY (`user_id`, `related_username`),
+            FOREIGN KEY (`user_id`) REFERENCES `users`(`user_id`)
+        );
+        """,
+        "CREATE INDEX `ix_related_profiles_username` ON `related_profiles` (`related_username`);",
+    ]),
+    (5, "video view counts on engagements", [
+        "ALTER TABLE `engagements` ADD COLUMN `views_count` BIGINT;",
+    ]),
+    # Derived from posts and engagements, so no foreign keys: rows are
+    # dropped and rebuilt freely by `database.insight_tables`
+    (6, "materialized per-creator, per-media-type and per-post insight tables", [
+        """
+        CREATE TABLE IF NOT EXISTS `user_stats` (
+            `user_id` BIGINT PRIMARY KEY,
+            `post_count` INT NOT NULL DEFAULT 0,
+            `likes_total` BIGINT NOT NULL DEFAULT 0,
+            `comments_total` BIGINT NOT NULL DEFAULT 0,
+            `shares_total` BIGINT NOT NULL DEFAULT 0,
+            `views_total` BIGINT NOT NULL DEFAULT 0,
+            `updated_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `media_type_stats` (
+            `user_id` BIGINT NOT NULL,
+            `media_type` VARCHAR(50) NOT NULL,
+            `post_count` INT NOT NULL DEFAULT 0,
+            `likes_total` BIGINT NOT NULL DEFAULT 0,
+            `comments_total` BIGINT NOT NULL DEFAULT 0,
+            `shares_total` BIGINT NOT NULL DEFAULT 0,
+            `views_total` BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (`user_id`, `media_type`)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS `post_stats` (
+            `post_id` BIGINT PRIMARY KEY,
+            `user_id` BIGINT NOT NULL,
+            `media_type` VARCHAR(50) NOT NULL,
+            `likes_count` BIGINT NOT NULL DEFAULT 0,
+            `comments_count` BIGINT NOT NULL DEFAULT 0,
+            `shares_count` BIGINT NOT NULL DEFAULT 0,
+            `views_count` BIGINT NOT NULL DEFAULT 0,
+            `interactions` BIGINT AS (`likes_count` + `comments_count` + `shares_count`) STORED,
+            INDEX `ix_post_stats_user_interactions` (`user_id`, `interactions`)
+        );
+        """,
+    ]),
+    # The first FULLTEXT index of a table rebuilds it to add FTS_DOC_ID
+    (7, "full-text indexes on captions, usernames/bios and comments", [
+        "ALTER TABLE `posts` ADD FULLTEXT INDEX `ft_posts_caption` (`caption`);",
+        "ALTER TABLE `users` ADD FULLTEXT INDEX `ft_users_username_bio` (`username`, `bio`);",
+        "ALTER TABLE `comments` ADD FULLTEXT INDEX `ft_comments_message` (`message`);",
+    ]),
+    (8, "hashtags, mentions, tagged accounts and co-authors of posts", [
+        """
+        CREATE TABLE IF NOT EXISTS `post_tags` (
+            `post_id` BIGINT NOT NULL,
+            `kind` VARCHAR(16) NOT NULL,
+            `tag` VARCHAR(255) NOT NULL,
+            PRIMARY KEY (`post_id`, `kind`, `tag`),
+            INDEX `ix_post_tags_kind_tag` (`kind`, `tag`),
+            FOREIGN KEY (`post_id`) REFERENCES `posts`(`post_id`) ON DELETE CASCADE
+        );
+        """,
+    ]),
+    # Bumped and set by the table methods rather than by the database, so
+    # `updated_at` is UTC on every backend; rows loaded in bulk have none
+    # until their first update
+    (9, "row versions and update times of users, posts and engagements, for conditional GETs", [
+        "ALTER TABLE `users` ADD COLUMN `version` INT NOT NULL DEFAULT 1;",
+        "ALTER TABLE `users` ADD COLUMN `updated_at` DATETIME NULL;",
+        "ALTER TABLE `posts` ADD COLUMN `version` INT NOT NULL DEFAULT 1;",
+        "ALTER TABLE `posts` ADD COLUMN `updated_at` DATETIME NULL;",
+        "ALTER TABLE `engagements` ADD COLUMN `version` INT NOT NULL DEFAULT 1;",
+        "ALTER TABLE `engagements` ADD COLUMN `updated_at` DATETIME NULL;",
+    ]),
+    # InnoDB indexes a foreign key by itself, and drops that index for this
+    # one; PostgreSQL and SQLite index only what they are told to
+    (10, "index the accounts a user follows on every backend", [
+        "CREATE INDEX `ix_followers_follower` ON `followers` (`follower_user_id`);",
+    ]),
+]
+
+# Conflict targets of the tables written with ON DUPLICATE KEY UPDATE;
+# PostgreSQL and SQLite name them in the ON CONFLICT they are rewritten to
+UPSERT_KEYS = {
+    'engagement_snapshots': ['post_id', 'captured_at'],
+    'engagement_hourly': ['post_id', 'bucket'],
+    'engagement_daily': ['post_id', 'bucket'],
+    'user_stats': ['user_id'],
+    'media_type_stats': ['user_id', 'media_type'],
+    'post_stats': ['post_id'],
+    # Counter increments (see database.counter_buffer), on ux_engagements_post
+    'engagements': ['post_id'],
+}
+
+# Tables in reverse foreign key order, for dropping
+TABLES = [
+    'post_tags', 'post_stats', 'media_type_stats', 'user_stats', 'related_profiles', 'engagement_daily', 'engagement_hourly', 'engagement_snapshots',
+    'comments', 'engagements', 'followers', 'posts', 'users'
+]
+
+# The lookups the API and loaders run on hot paths; `check_indexes` EXPLAINs
+# each one and fails if the backend would answer it with a full table scan
+INDEX_CHECKS = [
+    ("user by id", "SELECT * FROM `users` WHERE `user_id` = :id;", {'id': 1}),
+    ("user by username", "SELECT 1 FROM `users` WHERE `username` = :username LIMIT 1;", {'username': ''}),
+    ("users page", "SELECT * FROM `users` WHERE `user_id` > :after ORDER BY `user_id` LIMIT 100;", {'after': 0}),
+    ("followers of a user", "SELECT * FROM `followers` WHERE `user_id` = :id;", {'id': 1}),
+    ("follow edge", "SELECT 1 FROM `followers` WHERE `user_id` = :id AND `follower_user_id` = :follower LIMIT 1;",
+     {'id': 1, 'follower': 2}),
+    ("accounts a user follows", "SELECT * FROM `followers` WHERE `follower_user_id` = :id;", {'id': 1}),
+    ("posts of a user, newest first", "SELECT * FROM `posts` WHERE `user_id` = :id ORDER BY `timestamp` DESC;", {'id': 1}),
+    ("post by id", "SELECT * FROM `posts` WHERE `post_id` = :id;", {'id': 1}),
+    ("comments of a post", "SELECT * FROM `comments` WHERE `post_id` = :id ORDER BY `timestamp`;", {'id': 1}),
+    ("engagement of a post", "SELECT * FROM `engagements` WHERE `post_id` = :id;", {'id': 1}),
+    ("dashboard totals of a creator", "SELECT * FROM `user_stats` WHERE `user_id` = :id;", {'id': 1}),
+    ("top posts of a creator", "SELECT * FROM `post_stats` WHERE `user_id` = :id ORDER BY `interactions` DESC LIMIT 10;",
+     {'id': 1}),
+    ("caption search", "SELECT `post_id` FROM `posts` WHERE MATCH(`caption`) AGAINST (:expr IN BOOLEAN MODE);",
+     {'expr': '+travel*'}),
+    ("creators listing a related profile", "SELECT `user_id` FROM `related_profiles` WHERE `related_username` = :username;",
+     {'username': ''}),
+]
+
+# FULLTEXT is MySQL's: the other backends search captions with LIKE (see
+# database.search), which scans by design
+MYSQL_ONLY_CHECKS = {"caption search"}
+
+
+def current_version(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS `schema_version` (
+            `version` INT PRIMARY KEY,
+            `description` VARCHAR(255),
+            `applied_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """))
+    return conn.execute(text("SELECT COALESCE(MAX(`version`), 0) FROM `schema_version`;")).scalar()
+
+
+def migrate():
+    """
+    Apply every migration newer than the database's recorded version.
+
+    Returns:
+    int: The schema version after migrating.
+    """
+    engine = Database.get_engine()
+    dialect = Database.get_dialect()
+    try:
+        with engine.begin() as conn:
+            version = current_version(conn)
+
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            with engine.begin() as conn:
+                for statement in statements:
+                    for translated in dialect.translate_ddl(statement):
+                        conn.execute(text(translated))
+                conn.execute(
+                    text("INSERT INTO `schema_version` (`version`, `description`) VALUES (:version, :description);"),
+                    {'version': number, 'description': description}
+                )
+            version = number
+            print(f"Applied schema migration {number}: {description}")
+    except SQLAlchemyError as e:
+        print(f"Error migrating schema: {e}")
+        raise
+
+    return version
+
+
+def check_indexes():
+    """
+    EXPLAIN every query in `INDEX_CHECKS` and report the plan the backend picks.
+
+    Returns:
+    list[str]: Descriptions of the queries that would scan their whole table.
+    """
+    failures = []
+    dialect = Database.get_dialect()
+    with Database.get_engine().connect() as conn:
+        for description, query, params in INDEX_CHECKS:
+            if description in MYSQL_ONLY_CHECKS and dialect.name != 'mysql':
+                continue
+            full_scan, plan = dialect.explain(conn, query, params)
+            print(f"{'SCAN' if full_scan else 'ok':<5} {description}: {plan}")
+            if full_scan:
+                failures.append(description)
+    return failures
+
+
+def drop_all():
+    """Drop every table, including the migration history."""
+    try:
+        with Database.get_engine().begin() as conn:
+            for table_name in TABLES + ['schema_version']:
+                conn.execute(text(f"DROP TABLE IF EXISTS `{table_name}`;"))
+        print("All tables dropped successfully.")
+    except SQLAlchemyError as e:
+        print(f"Error dropping tables: {e}")
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument('--check-indexes', action='store_true',
+                        help="EXPLAIN the hot lookup queries and fail if any needs a full table scan")
+    args = parser.parse_args()
+
+    version = migrate()
+    print(f"Schema is at version {version}.")
+    failures = check_indexes() if args.check_indexes else []
+    Database.close_connection()
+    if failures:
+        sys.exit(f"Full table scans in: {', '.join(failures)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+from .database import BaseTable, statement
+import re
+
+# Keyword, hashtag and mention search over captions, bios and comments.
+#
+# Candidates come from InnoDB FULLTEXT indexes (schema migration 7), which
+# InnoDB keeps current on every insert and update. Its tokenizer drops `#`
+# and `@`, so `#travel` is looked up as the word `travel` and the matching
+# rows are then narrowed with a REGEXP that requires the literal hashtag;
+# the REGEXP only ever runs on FULLTEXT hits, never on the whole table.
+# Words shorter than innodb_ft_min_token_size (3) and stopwords are not indexed.
+#
+# FULLTEXT is MySQL's; on the other backends (see database.dialects) every
+# term is matched as a case-insensitive substring and hits are unranked.
+
+# Searchable sources: type -> (table, key, FULLTEXT columns, text returned and filtered)
+SOURCES = {
+    'post': ('posts', 'post_id', ['caption'], "`caption`"),
+    'user': ('users', 'user_id', ['username', 'bio'], "CONCAT_WS(' ', `username`, `bio`)"),
+    'comment': ('comments', 'comment_id', ['message'], "`message`"),
+}
+
+# Characters of text returned with each hit
+SNIPPET_LENGTH = 280
+
+# innodb_ft_min_token_size: shorter words are not in the index, so they
+# cannot be required of a hit
+MIN_TOKEN_SIZE = 3
+
+_TERM = re.compile(r'"([^"]+)"|([#@])([\w.]+)|(\w+)')
+_WORD = re.compile(r'\w+')
+_EXPR_TERM = re.compile(r'\+"([^"]+)"|\+(\w+)')
+
+
+def parse_query(q):
+    """
+    Turn a search string into a FULLTEXT boolean expression plus REGEXP filters.
+
+    Every term is required. Plain words also match longer words they prefix
+    (`travel` finds `travelling`), quoted phrases match as a phrase, and
+    `#tag` / `@user` must appear literally as a hashtag / mention.
+
+    Returns:
+    tuple: (boolean expression, list of REGEXP patterns), or (None, []) if
+    the query has no searchable term.
+    """
+    terms, patterns = [], []
+    for phrase, sigil, tag, word in _TERM.findall(q):
+        if phrase:
+            words = _WORD.findall(phrase)
+            if words:
+                terms.append('+"' + ' '.join(words) + '"')
+        elif sigil:
+            tag = tag.rstrip('.')
+            words = [word for word in _WORD.findall(tag) if len(word) >= MIN_TOKEN_SIZE]
+            if len(words) == 1:
+                terms.append('+' + words[0])
+            elif words:
+                terms.append('+"' + ' '.join(words) + '"')
+            if tag:
+                patterns.append(re.escape(sigil + tag) + r'\b')
+        elif len(word) >= MIN_TOKEN_SIZE:
+            terms.append('+' + word + '*')
+    return (' '.join(terms) if terms else None), patterns
+
+
+class Search(BaseTable):
+    """Ranked search over `SOURCES`; relevance is InnoDB's FULLTEXT score."""
+
+    @statement
+    def fulltext_query(self, types, pattern_count):
+        selects = []
+        for source_type in types:
+            table, key, match_columns, text_column = SOURCES[source_type]
+            match = "MATCH(" + ", ".join(f"`{column}`" for column in match_columns) + ") AGAINST (:expr IN BOOLEAN MODE)"
+            filters = "".join(f" AND {text_column} REGEXP :pattern_{i}" for i in range(pattern_count))
+            selects.append(
+                f"SELECT '{source_type}' AS `type`, `{key}` AS `id`, `user_id`, "
+                f"LEFT({text_column}, {SNIPPET_LENGTH}) AS `text`, {match} AS `score` "
+                f"FROM `{table}` WHERE {match}{filters}"
+            )
+        union = " UNION ALL ".join(f"({select})" for select in selects)
+        return f"{union} ORDER BY `score` DESC, `type`, `id` LIMIT :limit OFFSET :offset;"
+
+    @statement
+    def substring_query(self, types, term_count, pattern_count):
+        """`fulltext_query` without FULLTEXT: every term is a LIKE on the lowercased text, every score 1."""
+        selects = []
+        for source_type in types:
+            table, key, match_columns, _ = SOURCES[source_type]
+            text_column = " || ' ' || ".join(f"COALESCE(`{column}`, '')" for column in match_columns)
+            filters = [f"LOWER({text_column}) LIKE :term_{i}" for i in range(term_count)]
+            filters += [f"{text_column} REGEXP :pattern_{i}" for i in range(pattern_count)]
+            selects.append(
+                f"SELECT '{source_type}' AS `type`, `{key}` AS `id`, `user_id`, "
+                f"SUBSTR({text_column}, 1, {SNIPPET_LENGTH}) AS `text`, 1.0 AS `score` "
+                f"FROM `{table}` WHERE " + " AND ".join(filters)
+            )
+        union = " UNION ALL ".join(selects)
+        return f"{union} ORDER BY `type`, `id` LIMIT :limit OFFSET :offset;"
+
+    def search_params(self, q, limit, offset):
+        """The query parameters for `q`, or None if it has nothing to search for."""
+        expr, patterns = parse_query(q)
+        if expr is None:
+            return None
+        params = {'limit': limit, 'offset': offset}
+        if self.dialect.name == 'mysql':
+            params['expr'] = expr
+        else:
+            terms = [phrase or word for phrase, word in _EXPR_TERM.findall(expr)]
+            params.update({f'term_{i}': f"%{term.lower()}%" for i, term in enumerate(terms)})
+            if self.dialect.name == 'postgresql':
+                # PostgreSQL spells a word boundary \y; \b is a backspace there
+                patterns = [pattern.replace(r'\b', r'\y') for pattern in patterns]
+        params.update({f'pattern_{i}': pattern for i, pattern in enumerate(patterns)})
+        return params
+
+    def search_query(self, types, params):
+        """The statement for `params` from `search_params`, built once per sources and term/pattern counts."""
+        pattern_count = sum(key.startswith('pattern_') for key in params)
+        if self.dialect.name == 'mysql':
+            return self.fulltext_query(tuple(types), pattern_count)
+        term_count = sum(key.startswith('term_') for key in params)
+        return self.substring_query(tuple(types), term_count, pattern_count)
+
+    def search(self, q, types=tuple(SOURCES), limit=20, offset=0):
+        """
+        One page of hits for `q`, best first.
+
+        Returns:
+        list[dict]: `type`, `id`, `user_id`, `text` (a snippet) and `score`.
+        """
+        params = self.search_params(q, limit, offset)
+        if params is None:
+            return []
+        return self.fetch_dicts(self.search_query(types, params), params) or []
@@ -0,0 +1,130 @@
+from starlette.responses import JSONResponse
+from datetime import datetime, timezone
+from decimal import Decimal
+from email.utils import parsedate_to_datetime
+import hashlib
+import orjson
+import types
+import typing
+
+# Response encoding of database rows for the API.
+#
+# A row returned under a `response_model` goes through three passes:
+# pydantic validates it against the model, converts it back to plain
+# Python, and the result is dumped to JSON. Rows read from our own tables
+# were typed by the schema when they were written, so the endpoints that
+# return them skip that: a `RowMapper`, built once per response model,
+# keeps the model's fields of each row and converts only the values whose
+# driver type differs from the model's (MySQL BOOLEAN comes back as 0/1,
+# computed columns as Decimal), and `FastJSONResponse` encodes the result
+# with orjson. The models still describe these responses in OpenAPI, so
+# every nullable column a mapped model returns is an Optional field there:
+# nothing checks the rows against the model any more.
+#
+# GETs of rows are conditional: the ETag is a digest of the rows' primary
+# keys, versions and update times (see `BaseTable.versioned`), so it is
+# known before anything is serialized, and a client whose If-None-Match
+# still matches gets a 304 without a body. ETags are weak since a row is
+# the same whether it is sent compressed or not.
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def dumps(content):
+    """`content` as JSON bytes; datetimes in ISO 8601, Decimals as numbers, anything else unknown as its str()."""
+    return orjson.dumps(content, default=_default, option=_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _base_type(annotation):
+    # Optional[X] and X | None map like X
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return args[0] if len(args) == 1 else None
+    return annotation
+
+
+class RowMapper:
+    """Maps row dicts, which must have every field, to a pydantic response model's fields in one pass, without validating them."""
+
+    # Model types whose values drivers may return as another type; integer
+    # columns come back as int from every driver
+    CONVERSIONS = {bool: bool, float: float}
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = list(model.model_fields)
+        self.conversions = [
+            (name, self.CONVERSIONS[base]) for name, base in
+            ((name, _base_type(field.annotation)) for name, field in model.model_fields.items())
+            if base in self.CONVERSIONS
+        ]
+
+    def __call__(self, row):
+        if row is None:
+            return None
+        mapped = {name: row[name] for name in self.fields}
+        for name, convert in self.conversions:
+            value = mapped[name]
+            if value is not None and value.__class__ is not convert:
+                mapped[name] = convert(value)
+        return mapped
+
+    def many(self, rows):
+        """Map a list of rows; None entries (ids a batch read did not find) stay None."""
+        return [self(row) for row in rows]
+
+
+def etag(table, rows):
+    """Weak ETag of rows of `table`, from their primary keys, versions and update times."""
+    key = table.primary_key
+    state = "\n".join(f"{row[key]}:{row.get('version')}:{row.get('updated_at')}" for row in rows)
+    return f'W/"{hashlib.blake2b(state.encode(), digest_size=12).hexdigest()}"'
+
+
+def last_modified(row):
+    """The `updated_at` of a row as a UTC datetime in whole seconds, as HTTP dates go; None if it has none."""
+    value = row.get('updated_at')
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # SQLite, and rows from the Redis cache, return it as text
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def _opaque(tag):
+    return tag.strip().removeprefix('W/')
+
+
+def not_modified(headers, etag, modified=None):
+    """
+    Whether the client's copy is current: If-None-Match names `etag` (weak
+    comparison), or, without If-None-Match, `modified` is no later than If-Modified-Since.
+    """
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = {_opaque(tag) for tag in if_none_match.split(',')}
+        return '*' in tags or _opaque(etag) in tags
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since is None or modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return modified <= since
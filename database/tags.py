@@ -0,0 +1,331 @@
+from sqlalchemy.exc import SQLAlchemyError
+from dotenv import load_dotenv
+from .database import BaseTable, Database, DEFAULT_BATCH_SIZE, sql
+import numpy as np
+import pandas as pd
+import argparse
+import os
+import re
+import threading
+import time
+
+# Hashtags, mentions, tagged accounts and co-authors of posts.
+#
+# `post_tags` holds one row per (post, kind, tag). Hashtags and mentions are
+# extracted from captions when a post is written (the `Post` hooks); tagged
+# accounts (tags.csv) and co-authors (Coauthors.csv) come from the gold
+# import. `TagIndex` loads the table into sparse count matrices, so trending
+# tags and collaborations never touch a caption at query time.
+# TAG_INDEX_MAX_AGE (seconds, default 300) bounds how stale the index gets.
+
+HASHTAG = 'hashtag'
+MENTION = 'mention'
+TAGGED = 'tagged'
+COAUTHOR = 'coauthor'
+
+# Kinds extracted from captions; the others are loaded from the exports
+CAPTION_KINDS = (HASHTAG, MENTION)
+
+# Kinds that name another account the creator worked with
+COLLABORATION_KINDS = (MENTION, TAGGED, COAUTHOR)
+
+_HASHTAG = re.compile(r'(?<![\w#])#(\w+)')
+_MENTION = re.compile(r'(?<![\w@])@([\w.]+)')
+
+_CAPTION_KIND_LIST = ", ".join(f"'{kind}'" for kind in CAPTION_KINDS)
+
+# A re-import or a tag seen twice must not fail the write
+_INSERT_TAG = "INSERT IGNORE INTO `post_tags` (`post_id`, `kind`, `tag`) VALUES (:post_id, :kind, :tag);"
+_CLEAR_CAPTION_TAGS = f"DELETE FROM `post_tags` WHERE `kind` IN ({_CAPTION_KIND_LIST})"
+
+
+def extract_tags(caption):
+    """The distinct (kind, tag) pairs of a caption, lowercased, in order of appearance."""
+    if not caption:
+        return []
+    tags = [(HASHTAG, tag.lower()) for tag in _HASHTAG.findall(caption)]
+    tags += [(MENTION, mention.rstrip('.').lower()) for mention in _MENTION.findall(caption) if mention.rstrip('.')]
+    return list(dict.fromkeys(tags))
+
+
+def caption_tag_rows(posts):
+    """`post_tags` rows for the captions of `posts` (dicts with `post_id` and `caption`)."""
+    return [
+        {'post_id': post['post_id'], 'kind': kind, 'tag': tag}
+        for post in posts for kind, tag in extract_tags(post.get('caption'))
+    ]
+
+
+def tag_statements(rows):
+    """Statements adding the caption tags of newly written posts."""
+    with_ids = [row for row in rows if row.get('post_id') is not None]
+    statements = [(PostTag.insert_query, caption_tag_rows(with_ids))]
+    if len(rows) == 1 and not with_ids:
+        # A single post inserted with an AUTO_INCREMENT id; the API writes
+        # bulk posts without ids one at a time (`hooks_read_last_insert_id`),
+        # loads through `bulk_write` are covered by `PostTag.rebuild_from_captions`
+        tags = [{'kind': kind, 'tag': tag} for kind, tag in extract_tags(rows[0].get('caption'))]
+        statements.append((PostTag.insert_last_post_query, tags))
+    return statements
+
+
+def retag_statements(before, after):
+    """Statements replacing the caption tags of a post whose caption changed."""
+    if before.get('caption') == after.get('caption'):
+        return []
+    return [
+        (PostTag.clear_post_query, [{'post_id': before['post_id']}]),
+        (PostTag.insert_query, caption_tag_rows([after])),
+    ]
+
+
+class PostTag(BaseTable):
+    table_name = 'post_tags'
+    columns = ['post_id', 'kind', 'tag']
+    dtypes = {'post_id': 'Int64', 'kind': 'string', 'tag': 'string'}
+
+    insert_query = sql(_INSERT_TAG)
+    insert_last_post_query = sql(_INSERT_TAG.replace(':post_id', 'LAST_INSERT_ID()'))
+    clear_query = sql(_CLEAR_CAPTION_TAGS + ";")
+    clear_post_query = sql(_CLEAR_CAPTION_TAGS + " AND `post_id` = :post_id;")
+
+    def rebuild_from_captions(self, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Re-extract hashtags and mentions from every caption, for posts
+        loaded through `bulk_write` (which skips the write hooks).
+
+        The old tags are replaced in one transaction, so readers see either
+        them or the new ones, and a failure leaves them in place.
+
+        Returns:
+        int: Number of tag rows written.
+        """
+        from .post import Post
+
+        start = time.perf_counter()
+        query = self._insert_query(self.columns, ignore_duplicates=True)
+        total, rows = 0, []
+        try:
+            with self.begin() as conn:
+                conn.execute(self.clear_query)
+                # Captions are read on a connection of their own, while this one writes
+                for post in Post().stream(batch_size=batch_size):
+                    rows += caption_tag_rows([post])
+                    if len(rows) >= batch_size:
+                        total += self.insert_chunk(conn, query, self.columns, rows, ignore_duplicates=True)
+                        rows = []
+                if rows:
+                    total += self.insert_chunk(conn, query, self.columns, rows, ignore_duplicates=True)
+        except SQLAlchemyError as e:
+            print(f"Error rebuilding caption tags: {e}")
+            raise
+        print(f"Extracted {total} caption tags in {time.perf_counter() - start:.2f}s.")
+        return total
+
+
+class SparseCounts:
+    """
+    Counts of (row, column) pairs in CSR form.
+
+    Row `i` has non-zero counts `counts[indptr[i]:indptr[i + 1]]` in the
+    columns `columns[indptr[i]:indptr[i + 1]]`.
+    """
+
+    def __init__(self, rows, columns, row_count):
+        pairs = pd.DataFrame({'row': rows, 'column': columns}).groupby(['row', 'column']).size()
+        pair_rows = pairs.index.get_level_values('row').to_numpy(dtype=np.int64)
+        self.indptr = np.zeros(row_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pair_rows, minlength=row_count), out=self.indptr[1:])
+        self.columns = pairs.index.get_level_values('column').to_numpy(dtype=np.int32)
+        self.counts = pairs.to_numpy(dtype=np.int32)
+
+    def row(self, row, limit=None):
+        """The (columns, counts) of one row, largest counts first."""
+        if row is None or row + 1 >= len(self.indptr):
+            return self.columns[:0], self.counts[:0]
+        start, end = self.indptr[row], self.indptr[row + 1]
+        order = np.argsort(-self.counts[start:end], kind='stable')[:limit]
+        return self.columns[start:end][order], self.counts[start:end][order]
+
+
+class TagIndex:
+    """
+    Tag counters and sparse tag-creator, tag-tag and creator-account matrices.
+
+    Tags are keyed by (kind, tag). Accounts named by mentions, tagged
+    accounts and co-authors are usernames, or the user id when the export
+    had no username for a co-author.
+    """
+
+    def __init__(self, tags, posts, users):
+        """
+        Args:
+        tags (DataFrame): `post_id`, `kind`, `tag` rows of `post_tags`.
+        posts (DataFrame): `post_id`, `user_id`, `timestamp` (datetime64) of the tagged posts.
+        users (DataFrame): `user_id`, `username`.
+        """
+        occurrences = tags.merge(posts, on='post_id').sort_values('timestamp', kind='stable')
+        tag_codes, tag_keys = pd.factorize(pd.MultiIndex.from_frame(occurrences[['kind', 'tag']]))
+        creator_codes, creators = pd.factorize(occurrences['user_id'])
+        self._tag_keys = list(tag_keys)
+        self._tag_index = {key: code for code, key in enumerate(self._tag_keys)}
+        self._creators = creators.to_numpy(dtype=np.int64)
+        self._creator_index = {int(user_id): code for code, user_id in enumerate(self._creators)}
+        tag_count, creator_count = len(self._tag_keys), len(self._creators)
+
+        # Occurrences sorted by time, for windowed counts
+        self._times = occurrences['timestamp'].to_numpy(dtype='datetime64[ns]')
+        self._occurrence_tags = tag_codes
+        self._tag_kinds = np.array([kind for kind, _ in self._tag_keys], dtype=object)
+        self.post_counts = np.bincount(tag_codes, minlength=tag_count)
+
+        self.tag_creators = SparseCounts(tag_codes, creator_codes, tag_count)
+        self.creator_tags = SparseCounts(creator_codes, tag_codes, creator_count)
+
+        # Hashtags sharing a post, counted in both directions
+        hashtags = pd.DataFrame({'post_id': occurrences['post_id'].to_numpy(), 'code': tag_codes})[
+            occurrences['kind'].to_numpy() == HASHTAG
+        ]
+        pairs = hashtags.merge(hashtags, on='post_id')
+        pairs = pairs[pairs['code_x'] != pairs['code_y']]
+        self.cooccurrence = SparseCounts(pairs['code_x'].to_numpy(), pairs['code_y'].to_numpy(), tag_count)
+
+        # Creator -> account it mentioned, tagged or co-authored with, and back
+        usernames = users.dropna(subset=['username']).astype({'username': 'string'})
+        self._usernames = dict(zip(usernames['user_id'].astype('int64'), usernames['username'].str.lower()))
+        self._user_ids = {username: user_id for user_id, username in self._usernames.items()}
+        collaborations = np.isin(self._tag_kinds[tag_codes], COLLABORATION_KINDS) if len(tag_codes) else np.zeros(0, bool)
+        account_codes, accounts = pd.factorize(occurrences['tag'].to_numpy()[collaborations])
+        self._accounts = list(accounts)
+        self._account_index = {account: code for code, account in enumerate(self._accounts)}
+        self.creator_accounts = SparseCounts(creator_codes[collaborations], account_codes, creator_count)
+        self.account_creators = SparseCounts(account_codes, creator_codes[collaborations], len(self._accounts))
+
+    @classmethod
+    def load(cls, engine=None):
+        """Build the index from `post_tags`, the tagged posts and `users`."""
+        engine = engine or Database.get_engine()
+        try:
+            with engine.connect() as conn:
+                tags = pd.read_sql(sql("SELECT `post_id`, `kind`, `tag` FROM `post_tags`;"), conn)
+                posts = pd.read_sql(
+                    sql("""
+                    SELECT `p`.`post_id`, `p`.`user_id`, `p`.`timestamp`
+                    FROM `posts` AS `p` JOIN (SELECT DISTINCT `post_id` FROM `post_tags`) AS `t`
+                        ON `t`.`post_id` = `p`.`post_id`
+                    WHERE `p`.`user_id` IS NOT NULL;
+                    """),
+                    conn, parse_dates=['timestamp']
+                )
+                users = pd.read_sql(sql("SELECT `user_id`, `username` FROM `users`;"), conn)
+        except SQLAlchemyError as e:
+            print(f"Error loading the tag index: {e}")
+            raise
+        return cls(tags, posts, users)
+
+    def _tags(self, codes, counts):
+        return [
+            {'kind': self._tag_keys[code][0], 'tag': self._tag_keys[code][1], 'posts': int(count)}
+            for code, count in zip(codes, counts)
+        ]
+
+    def _creator_list(self, codes, counts):
+        return [{'user_id': int(self._creators[code]), 'posts': int(count)} for code, count in zip(codes, counts)]
+
+    def trending(self, kind=HASHTAG, days=7, until=None, limit=20):
+        """
+        Tags used on the most posts in the `days` up to `until` (default: the
+        newest tagged post), with the change from the `days` before that.
+        """
+        if not len(self._times):
+            return []
+        if until is None:
+            until = self._times[-1]
+        else:
+            # Timestamps are stored as naive UTC
+            until = pd.Timestamp(until)
+            until = (until.tz_convert(None) if until.tzinfo else until).to_datetime64()
+        window = np.timedelta64(int(days * 86400), 's')
+        bounds = np.searchsorted(self._times, [until - 2 * window, until - window, until], side='right')
+        previous = np.bincount(self._occurrence_tags[bounds[0]:bounds[1]], minlength=len(self._tag_keys))
+        recent = np.bincount(self._occurrence_tags[bounds[1]:bounds[2]], minlength=len(self._tag_keys))
+        recent[self._tag_kinds != kind] = 0
+        candidates = np.flatnonzero(recent)
+        ranked = candidates[np.lexsort((-(recent - previous)[candidates], -recent[candidates]))][:limit]
+        return [
+            {**self._tags([code], [recent[code]])[0], 'previous_posts': int(previous[code])}
+            for code in ranked
+        ]
+
+    def tag(self, kind, tag, limit=20):
+        """Post count, top creators and co-occurring hashtags of one tag; None if never used."""
+        code = self._tag_index.get((kind, tag.lower()))
+        if code is None:
+            return None
+        return {
+            'kind': kind,
+            'tag': tag.lower(),
+            'posts': int(self.post_counts[code]),
+            'creators': self._creator_list(*self.tag_creators.row(code, limit)),
+            'related_tags': self._tags(*self.cooccurrence.row(code, limit)),
+        }
+
+    def creator_tags_of(self, user_id, limit=20):
+        """The tags a creator uses on the most posts."""
+        return self._tags(*self.creator_tags.row(self._creator_index.get(user_id), limit))
+
+    def collaborators(self, user_id, limit=20):
+        """
+        Accounts `user_id` mentions, tags or co-authors with (`outgoing`) and
+        creators whose posts name `user_id` (`incoming`), most posts first.
+        """
+        collaborators = {}
+        accounts, counts = self.creator_accounts.row(self._creator_index.get(user_id))
+        for account, count in zip(accounts, counts):
+            collaborators[self._accounts[account]] = {'outgoing': int(count), 'incoming': 0}
+
+        username = self._usernames.get(user_id)
+        creators, counts = self.account_creators.row(self._account_index.get(username))
+        for creator, count in zip(creators, counts):
+            account = self._usernames.get(int(self._creators[creator]), str(self._creators[creator]))
+            collaborators.setdefault(account, {'outgoing': 0, 'incoming': 0})['incoming'] = int(count)
+
+        ranked = sorted(collaborators.items(), key=lambda item: -(item[1]['outgoing'] + item[1]['incoming']))
+        return [
+            {'account': account, 'user_id': self._user_ids.get(account), **counts}
+            for account, counts in ranked[:limit] if account != username
+        ]
+
+
+_index = None
+_built_at = 0.0
+_max_age = None
+_build_lock = threading.Lock()
+
+def get_tag_index():
+    """The process-wide tag index, (re)built when missing or older than TAG_INDEX_MAX_AGE."""
+    global _index, _built_at, _max_age
+    with _build_lock:
+        if _max_age is None:
+            load_dotenv(override=True)
+            _max_age = float(os.getenv('TAG_INDEX_MAX_AGE', 300))
+        if _index is None or time.monotonic() - _built_at > _max_age:
+            start = time.perf_counter()
+            _index = TagIndex.load()
+            _built_at = time.monotonic()
+            print(f"Built the tag index ({len(_index._tag_keys)} tags) in {time.perf_counter() - start:.2f}s.")
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the post_tags table.")
+    parser.add_argument('--rebuild', action='store_true', help="re-extract hashtags and mentions from every caption")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        PostTag().rebuild_from_captions(args.batch_size)
+    Database.close_connection()
+
+if __name__ == "__main__":
+    main()
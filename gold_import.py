@@ -0,0 +1,254 @@
+from concurrent.futures import ProcessPoolExecutor
+from app import load_data_from_csv, DEFAULT_CHUNK_SIZE
+from database.engagement import Engagement
+from database.post import Post
+from database.related_profile import RelatedProfile
+from database.tags import PostTag, COAUTHOR, TAGGED
+from database.user import User
+from database.database import Database, DEFAULT_BATCH_SIZE, report_load
+from database.schema import migrate
+from database.insight_tables import InsightTables
+import pandas as pd
+import argparse
+import ast
+import os
+import time
+
+# Loader for the scraped Instagram exports in gold_part_1/ and gold_part_2/.
+#
+# Files are loaded in dependency waves: every file in a wave runs in its own
+# worker process, and a wave only starts once the previous one has finished,
+# so foreign keys (posts -> users, engagements -> posts) always resolve.
+# Caption hashtags and mentions are extracted once the posts are in, and
+# tags.csv / Coauthors.csv are loaded into post_tags next to them.
+
+GOLD_PART_1 = 'gold_part_1'
+GOLD_PART_2 = 'gold_part_2'
+
+
+def _permalink(shortcode):
+    # The CDN urls in the export are signed and expire; the permalink does not
+    return 'https://www.instagram.com/p/' + shortcode + '/'
+
+
+def _caption_text(captions):
+    # gold_part_1 stores captions as the repr of a Python list of strings
+    try:
+        return '\n'.join(ast.literal_eval(captions)) or None
+    except (ValueError, SyntaxError, TypeError):
+        return captions
+
+
+def _epoch_to_timestamp(column):
+    return pd.to_datetime(pd.to_numeric(column), unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _media_transform(media_type):
+    def transform(chunk):
+        chunk['media_type'] = media_type
+        chunk['media_url'] = chunk['media_url'].map(_permalink, na_action='ignore')
+        chunk['caption'] = chunk['caption'].map(_caption_text, na_action='ignore')
+        chunk['timestamp'] = _epoch_to_timestamp(chunk['timestamp'])
+        return chunk
+    return transform
+
+
+def _verified_users(chunk):
+    chunk['is_influential'] = chunk['is_influential'].fillna(False)
+    return chunk
+
+
+def load_part_1_users(root, chunk_size, batch_size):
+    column_map = {
+        'id': 'user_id', 'username': 'username', 'bio': 'bio', 'followers': 'followers_count',
+        'follows': 'following_count', 'is_verified': 'is_influential'
+    }
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_1, 'users.csv'), User, column_map, _verified_users,
+        chunk_size, batch_size, ignore_duplicates=True
+    )
+
+
+def load_part_2_users(root, chunk_size, batch_size):
+    # User.csv repeats the owner row for every media item
+    column_map = {'user_pk': 'user_id', 'username': 'username', 'is_verified': 'is_influential'}
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_2, 'User.csv'), User, column_map, _verified_users,
+        chunk_size, batch_size, ignore_duplicates=True
+    )
+
+
+def load_image_posts(root, chunk_size, batch_size):
+    column_map = {
+        'image_id': 'post_id', 'user_id': 'user_id', 'shortcode': 'media_url',
+        'captions': 'caption', 'taken_at': 'timestamp'
+    }
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_1, 'images.csv'), Post, column_map, _media_transform('image'),
+        chunk_size, batch_size, ignore_duplicates=True
+    )
+
+
+def load_video_posts(root, chunk_size, batch_size):
+    column_map = {
+        'video_id': 'post_id', 'user_id': 'user_id', 'shortcode': 'media_url',
+        'captions': 'caption', 'taken_at': 'timestamp'
+    }
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_1, 'videos.csv'), Post, column_map, _media_transform('video'),
+        chunk_size, batch_size, ignore_duplicates=True
+    )
+
+
+def load_caption_posts(root, chunk_size, batch_size):
+    # media_id is "<post id>_<owner id>"; MediaOwner.csv is the authoritative owner
+    owners = pd.read_csv(
+        os.path.join(root, GOLD_PART_2, 'MediaOwner.csv'),
+        usecols=['media_id', 'user_id'], dtype={'media_id': 'string', 'user_id': 'Int64'}
+    )
+    owner_by_media = owners.drop_duplicates('media_id').set_index('media_id')['user_id']
+
+    def transform(chunk):
+        chunk['post_id'] = pd.to_numeric(chunk['media_id'].str.split('_').str[0]).astype('Int64')
+        chunk['user_id'] = chunk['media_id'].map(owner_by_media).astype('Int64')
+        # Caption.csv has no shortcode, so these posts have no media_url
+        chunk['media_type'] = 'caption'
+        chunk['timestamp'] = _epoch_to_timestamp(chunk['timestamp'])
+        return chunk[chunk['user_id'].notna()]
+
+    column_map = {'media_id': 'media_id', 'text': 'caption', 'created_at': 'timestamp'}
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_2, 'Caption.csv'), Post, column_map, transform,
+        chunk_size, batch_size, ignore_duplicates=True
+    )
+
+
+def load_related_profiles(root, chunk_size, batch_size):
+    column_map = {'user_id': 'user_id', 'related_profile': 'related_username'}
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_1, 'related_profiles.csv'), RelatedProfile, column_map,
+        chunk_size=chunk_size, batch_size=batch_size, ignore_duplicates=True
+    )
+
+
+def load_image_engagements(root, chunk_size, batch_size):
+    column_map = {'image_id': 'post_id', 'likes': 'likes_count', 'comments_count': 'comments_count'}
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_1, 'images.csv'), Engagement, column_map,
+        chunk_size=chunk_size, batch_size=batch_size, ignore_duplicates=True
+    )
+
+
+def load_video_engagements(root, chunk_size, batch_size):
+    column_map = {
+        'video_id': 'post_id', 'likes': 'likes_count', 'comments_count': 'comments_count', 'views': 'views_count'
+    }
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_1, 'videos.csv'), Engagement, column_map,
+        chunk_size=chunk_size, batch_size=batch_size, ignore_duplicates=True
+    )
+
+
+def load_tagged_accounts(root, chunk_size, batch_size):
+    def transform(chunk):
+        chunk['kind'] = TAGGED
+        chunk['tag'] = chunk['tag'].str.lower()
+        return chunk
+
+    column_map = {'content_id': 'post_id', 'tagged': 'tag'}
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_1, 'tags.csv'), PostTag, column_map, transform,
+        chunk_size, batch_size, ignore_duplicates=True
+    )
+
+
+def load_coauthors(root, chunk_size, batch_size):
+    # Co-authors are user ids; name them like mentions and tags where User.csv knows them
+    users = pd.read_csv(
+        os.path.join(root, GOLD_PART_2, 'User.csv'),
+        usecols=['user_pk', 'username'], dtype={'user_pk': 'string', 'username': 'string'}
+    )
+    username_by_id = users.drop_duplicates('user_pk').set_index('user_pk')['username'].str.lower()
+
+    def transform(chunk):
+        chunk['post_id'] = pd.to_numeric(chunk['media_id'].str.split('_').str[0]).astype('Int64')
+        chunk['kind'] = COAUTHOR
+        coauthor_ids = chunk['coauthor_user_id'].astype('string')
+        chunk['tag'] = coauthor_ids.map(username_by_id).fillna(coauthor_ids)
+        return chunk
+
+    column_map = {'media_id': 'media_id', 'coauthor_user_id': 'coauthor_user_id'}
+    return load_data_from_csv(
+        os.path.join(root, GOLD_PART_2, 'Coauthors.csv'), PostTag, column_map, transform,
+        chunk_size, batch_size, ignore_duplicates=True
+    )
+
+
+def load_caption_tags(root, chunk_size, batch_size):
+    # The posts loaders go through bulk_write, which skips the tag hooks
+    return PostTag().rebuild_from_captions(batch_size)
+
+
+# Each wave only references tables filled by the waves before it
+LOAD_WAVES = [
+    [load_part_1_users, load_part_2_users],
+    [load_image_posts, load_video_posts, load_caption_posts, load_related_profiles],
+    [load_image_engagements, load_video_engagements, load_tagged_accounts, load_coauthors, load_caption_tags],
+]
+
+
+def _run_loader(loader, root, chunk_size, batch_size):
+    return loader.__name__, loader(root, chunk_size, batch_size)
+
+
+def import_gold_data(root='.', workers=None, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Load the gold_part_1 / gold_part_2 exports into the users, posts, related_profiles
+    and engagements tables.
+
+    Args:
+    root (str): Directory containing gold_part_1/ and gold_part_2/.
+    workers (int): Worker processes per wave, defaults to the CPU count.
+    chunk_size (int): Number of CSV rows read per chunk.
+    batch_size (int): Number of rows per INSERT/transaction.
+
+    Returns:
+    dict: Loader name -> number of rows written.
+    """
+    # Bring the schema up to date before any worker starts
+    migrate()
+
+    loaded = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=Database.reset_pool) as executor:
+        for wave in LOAD_WAVES:
+            futures = [
+                executor.submit(_run_loader, loader, root, chunk_size, batch_size) for loader in wave
+            ]
+            for future in futures:
+                name, count = future.result()
+                loaded[name] = count
+
+    report_load('gold datasets', sum(loaded.values()), time.perf_counter() - start)
+
+    # bulk loads skip the per-write deltas, so recompute the aggregates
+    InsightTables().rebuild()
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the gold_part_1 / gold_part_2 Instagram datasets.")
+    parser.add_argument('--root', default='.', help="directory containing gold_part_1/ and gold_part_2/")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes per wave")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    loaded = import_gold_data(args.root, args.workers, args.chunk_size, args.batch_size)
+    for name, count in loaded.items():
+        print(f"{name}: {count} rows")
+
+    Database.close_connection()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import dotenv
+import os
+import sys
+import tempfile
+
+# The tests run on a throwaway SQLite database whatever .env says: the
+# modules reload .env with override=True, so it is switched off before
+# any of them is imported
+dotenv.load_dotenv = lambda *args, **kwargs: False
+os.environ.update({
+    'DB_BACKEND': 'sqlite',
+    'SQLITE_PATH': os.path.join(tempfile.mkdtemp(prefix='lytport-tests-'), 'test.db'),
+    'CACHE_BACKEND': 'memory',
+    'COUNTER_WRITE_BEHIND': 'false',
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from database.schema import migrate
+
+
+@pytest.fixture(scope='session')
+def schema():
+    """The test database, migrated to the latest schema version."""
+    return migrate()
+
+
+@pytest.fixture(scope='session')
+def client(schema):
+    from fastapi.testclient import TestClient
+    from backend import app
+    with TestClient(app) as client:
+        yield client
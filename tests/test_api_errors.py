@@ -0,0 +1,45 @@
+import pytest
+
+# Client errors raised inside a handler's try block must reach the client
+# as they are, not be turned into a 500 by its catch-all
+
+
+def test_search_without_searchable_word_is_400(client):
+    response = client.get('/search', params={'q': 'ab'})
+    assert response.status_code == 400
+
+
+def test_stats_of_missing_post_is_404(client):
+    assert client.get('/posts/987654321/stats').status_code == 404
+
+
+def test_missing_tag_is_404(client):
+    assert client.get('/tags/hashtag/nosuchtag').status_code == 404
+
+
+@pytest.mark.parametrize('path', [
+    '/users/987654321/graph/mutuals',
+    '/users/987654321/graph/common-followers/1',
+    '/users/987654321/graph/reach',
+    '/users/987654321/graph/related',
+])
+def test_graph_of_missing_user_is_404(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_insights_of_missing_user_is_404(client):
+    assert client.get('/users/987654321/insights').status_code == 404
+
+
+def test_stats_of_missing_user_is_404(client):
+    assert client.get('/users/987654321/stats').status_code == 404
+
+
+# Stored rows may hold NULLs the request models do not accept
+@pytest.mark.parametrize('path, body', [
+    ('/users/', {'user_id': 1, 'username': 'strict', 'followers_count': None, 'following_count': 0,
+                 'location': None, 'is_influential': False}),
+    ('/posts/', {'user_id': 1, 'media_type': None, 'media_url': ''}),
+])
+def test_null_required_fields_are_rejected(client, path, body):
+    assert client.post(path, json=body).status_code == 422
@@ -0,0 +1,13 @@
+import pytest
+
+from database.cache import RedisCache
+
+
+def test_redis_outage_reads_through_to_the_database():
+    pytest.importorskip('redis')
+    # Nothing listens on port 1, so every command fails to connect
+    cache = RedisCache('redis://127.0.0.1:1/0')
+    cache.set('posts:1', {'post_id': 1})
+    assert cache.get('posts:1') is None
+    cache.delete('posts:1')
+    assert cache.stats.snapshot()['misses'] == 1
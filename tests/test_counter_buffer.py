@@ -0,0 +1,64 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from database.counter_buffer import CounterBuffer
+
+
+class RecordingTable:
+    def __init__(self):
+        self.deltas = []
+
+    def apply_increments(self, deltas):
+        self.deltas += deltas
+
+
+class FailingTable:
+    def apply_increments(self, deltas):
+        raise OSError("connection reset")
+
+
+def test_failed_flush_spills_and_raises(tmp_path):
+    counters = CounterBuffer(FailingTable(), spill_dir=str(tmp_path))
+    counters.add(1, likes=2)
+    with pytest.raises(OSError):
+        counters.flush()
+    spills = glob.glob(os.path.join(tmp_path, 'pending-*.json'))
+    assert len(spills) == 1
+    with open(spills[0]) as spill:
+        assert json.load(spill) == [{'post_id': 1, 'likes': 2, 'comments': 0, 'shares': 0, 'views': 0}]
+
+
+def test_unspillable_deltas_stay_pending(tmp_path):
+    # A file where the spill directory should be
+    blocked = tmp_path / 'spill'
+    blocked.write_text('')
+    counters = CounterBuffer(FailingTable(), spill_dir=str(blocked))
+    counters.add(1, likes=2)
+    with pytest.raises(OSError):
+        counters.flush()
+    assert counters.snapshot()['pending_posts'] == 1
+
+
+def test_claims_of_a_crashed_worker_are_taken_over(tmp_path):
+    # A worker that claimed a spill file and died before writing it
+    worker = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+    dead_pid = int(worker.stdout)
+    delta = {'post_id': 1, 'likes': 2, 'comments': 0, 'shares': 0, 'views': 0}
+    (tmp_path / f'claimed-{dead_pid}-pending-{dead_pid}-1.json').write_text(json.dumps([delta]))
+
+    table = RecordingTable()
+    counters = CounterBuffer(table, spill_dir=str(tmp_path))
+    assert counters.flush() == 1
+    assert table.deltas == [delta]
+    assert os.listdir(tmp_path) == []
+
+
+def test_claims_of_a_live_worker_are_left_alone(tmp_path):
+    (tmp_path / f'claimed-{os.getppid()}-pending-1-1.json').write_text(json.dumps([{'post_id': 1, 'likes': 2}]))
+    assert CounterBuffer(RecordingTable(), spill_dir=str(tmp_path)).flush() == 0
+    assert len(os.listdir(tmp_path)) == 1
@@ -0,0 +1,9 @@
+from database.dialects import PostgreSQLDialect
+from database.engagement import Engagement
+
+
+def test_qualified_upsert_assignments_target_the_stored_row():
+    query = Engagement.increment_query.__wrapped__(Engagement()).strip()
+    rewritten = PostgreSQLDialect().rewrite(query)
+    assert '"version" = "engagements"."version" + 1' in rewritten
+    assert '"likes_count" = COALESCE("engagements"."likes_count", 0) + :likes' in rewritten
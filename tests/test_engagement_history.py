@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from database.engagement import Engagement
+from database.engagement_history import EngagementHistory
+
+USER_ID = 424242
+
+
+def test_aware_capture_times_are_stored_as_naive_utc():
+    captured_at = datetime(2024, 5, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+    (_, rows), *_ = EngagementHistory().statements([{'post_id': 1, 'captured_at': captured_at}])
+    assert rows[0]['captured_at'] == datetime(2024, 5, 1, 10, 0)
+
+
+@pytest.fixture(scope='module')
+def new_post(client):
+    assert client.post('/users/', json={
+        'user_id': USER_ID, 'username': 'history-test', 'followers_count': 0, 'following_count': 0,
+        'location': '', 'is_influential': False,
+    }).status_code == 200
+
+    def create():
+        assert client.post('/posts/', json={'user_id': USER_ID, 'media_type': 'IMAGE', 'media_url': ''}).status_code == 200
+        return Engagement().fetch_dicts('SELECT MAX(`post_id`) AS `post_id` FROM `posts`')[0]['post_id']
+    return create
+
+
+def last_likes(post_id):
+    rollups = Engagement().fetch_dicts(
+        'SELECT `last_likes_count` FROM `engagement_hourly` WHERE `post_id` = :post_id', {'post_id': post_id}
+    )
+    return [rollup['last_likes_count'] for rollup in rollups]
+
+
+def test_update_snapshots_the_stored_row(client, new_post):
+    engagements = Engagement()
+    post_id = new_post()
+    engagements.write(post_id, 1, 1, 7, 0.5)
+    engagement_id = engagements.fetch_dicts(
+        'SELECT `engagement_id` FROM `engagements` WHERE `post_id` = :post_id', {'post_id': post_id}
+    )[0]['engagement_id']
+
+    # The body names another post and other shares; neither is stored by the PUT
+    response = client.put(f'/engagements/{engagement_id}', json={
+        'post_id': post_id + 1, 'likes_count': 5, 'comments_count': 2,
+        'shares_count': 99, 'video_completion_rate': 0.9,
+    })
+    assert response.status_code == 200
+
+    snapshots = engagements.fetch_dicts(
+        'SELECT `post_id`, `likes_count`, `comments_count`, `shares_count` FROM `engagement_snapshots`'
+        ' WHERE `post_id` IN (:post_id, :other)', {'post_id': post_id, 'other': post_id + 1}
+    )
+    assert snapshots == [{'post_id': post_id, 'likes_count': 5, 'comments_count': 2, 'shares_count': 7}]
+
+
+def test_bulk_writes_and_increments_snapshot_the_counts(client, new_post):
+    post_id = new_post()
+    response = client.post('/engagements/bulk', json=[
+        {'post_id': post_id, 'likes_count': 10, 'comments_count': 0, 'shares_count': 0, 'video_completion_rate': 0.0},
+    ])
+    assert response.json()['written'] == 1
+    assert last_likes(post_id) == [10]
+
+    assert client.post('/engagements/increments', json=[{'post_id': post_id, 'likes': 5}]).status_code == 200
+    assert last_likes(post_id) == [15]
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+pytest.importorskip('pyarrow')
+
+from database.export import TableExport, load_export, read_manifest
+from database.user import User
+
+# Above the ids of the other test modules, so a pk export past them reads only these
+USER_IDS = [9100001, 9100002, 9100003]
+
+
+def write_user(user_id):
+    User().write(user_id, f'export-{user_id}', None, 0, 0, '', False)
+
+
+def export_users(out, incremental=False, key='pk'):
+    return TableExport('users', str(out), partition_rows=2).export(incremental, key)
+
+
+def exported(out, user_ids):
+    users = load_export(str(out), 'users')
+    return users[users['user_id'].isin(user_ids)].sort_values('user_id')
+
+
+def test_full_export_rotates_parts(schema, tmp_path):
+    for user_id in USER_IDS[:2]:
+        write_user(user_id)
+    total = export_users(tmp_path)
+
+    manifest = read_manifest(str(tmp_path / 'users'))
+    assert sum(part['rows'] for part in manifest['parts']) == total >= 2
+    assert all(part['rows'] <= 2 for part in manifest['parts'])
+    assert len(manifest['parts']) == (total + 1) // 2
+    assert manifest['watermark'] >= USER_IDS[1]
+    assert list(exported(tmp_path, USER_IDS)['user_id']) == USER_IDS[:2]
+
+    # A second full export replaces the parts rather than adding to them
+    export_users(tmp_path)
+    assert sorted(path.name for path in (tmp_path / 'users').glob('part-*')) == \
+        [part['file'] for part in read_manifest(str(tmp_path / 'users'))['parts']]
+
+
+def test_incremental_pk_export_reads_new_rows_only(schema, tmp_path):
+    export_users(tmp_path)
+    watermark = read_manifest(str(tmp_path / 'users'))['watermark']
+
+    write_user(USER_IDS[2])
+    assert export_users(tmp_path, incremental=True) == 1
+    assert read_manifest(str(tmp_path / 'users'))['watermark'] == USER_IDS[2] > watermark
+    assert export_users(tmp_path, incremental=True) == 0
+    assert list(exported(tmp_path, USER_IDS)['user_id']) == USER_IDS
+
+
+def test_incremental_updated_export_keeps_the_latest_row(schema, tmp_path):
+    export_users(tmp_path, key='updated')
+    # updated_at has microseconds, but keep the update clearly past the watermark
+    time.sleep(0.01)
+    User().update(USER_IDS[0], bio='updated bio')
+
+    assert export_users(tmp_path, incremental=True, key='updated') >= 1
+    assert len(read_manifest(str(tmp_path / 'users'))['parts']) > 1
+    users = exported(tmp_path, USER_IDS)
+    assert list(users['user_id']) == USER_IDS
+    assert users.set_index('user_id').loc[USER_IDS[0], 'bio'] == 'updated bio'
+
+
+def test_keys_need_their_column(schema, tmp_path):
+    export = TableExport('followers', str(tmp_path))
+    assert not export.supports('updated') and not export.supports('timestamp')
+    with pytest.raises(ValueError):
+        export.export(key='updated')
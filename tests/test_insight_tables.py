@@ -0,0 +1,20 @@
+from database.engagement import Engagement
+
+USER_ID = 454545
+
+
+def test_top_posts_carry_creator_and_engagement_rate(client):
+    assert client.post('/users/', json={
+        'user_id': USER_ID, 'username': 'insights-test', 'followers_count': 10, 'following_count': 0,
+        'location': '', 'is_influential': False,
+    }).status_code == 200
+    assert client.post('/posts/', json={'user_id': USER_ID, 'media_type': 'IMAGE', 'media_url': ''}).status_code == 200
+    post_id = Engagement().fetch_dicts('SELECT MAX(`post_id`) AS `post_id` FROM `posts`')[0]['post_id']
+    assert client.post('/engagements/', json={
+        'post_id': post_id, 'likes_count': 3, 'comments_count': 1, 'shares_count': 1, 'video_completion_rate': 0.0,
+    }).status_code == 200
+
+    top_post, = client.get(f'/users/{USER_ID}/stats').json()['top_posts']
+    assert top_post['user_id'] == USER_ID
+    assert top_post['engagement_rate'] == 0.5
+    assert top_post == client.get(f'/posts/{post_id}/stats').json()
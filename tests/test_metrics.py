@@ -0,0 +1,15 @@
+import re
+
+from database.metrics import render_prometheus
+
+POOL_STATUS = {
+    'checkouts': 3, 'timeouts': 0, 'wait_seconds_total': 0.1, 'wait_seconds_max': 0.05,
+    'checked_out': 1, 'checked_in': 4, 'overflow': 0,
+}
+
+
+def test_counters_are_named_total():
+    exposition = render_prometheus({'sync': POOL_STATUS}, {'hits': 1, 'misses': 2, 'invalidations': 0})
+    counters = re.findall(r'^# TYPE (\S+) counter$', exposition, re.M)
+    assert 'lytport_db_pool_checkouts_total' in counters
+    assert [name for name in counters if not name.endswith('_total')] == []
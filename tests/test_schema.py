@@ -0,0 +1,9 @@
+from database.schema import MIGRATIONS, check_indexes
+
+
+def test_migrations_apply(schema):
+    assert schema == MIGRATIONS[-1][0]
+
+
+def test_hot_lookups_use_an_index(schema):
+    assert check_indexes() == []
@@ -0,0 +1,9 @@
+from database.dialects import _regexp
+from database.search import parse_query
+
+
+def test_hashtag_filter_ignores_case_like_mysql():
+    _, patterns = parse_query('#Travel')
+    assert _regexp(patterns[0], 'Off again #travel')
+    assert _regexp(patterns[0], 'Off again #TRAVEL')
+    assert not _regexp(patterns[0], 'Off again #travelling')
@@ -0,0 +1,50 @@
+import pytest
+
+from database.post import Post
+from database.tags import PostTag
+from database.user import User
+
+USER_ID = 434343
+
+
+@pytest.fixture(scope='module')
+def tagged_post(schema):
+    User().write(USER_ID, 'tags-test', None, 0, 0, None, False)
+    Post().write(USER_ID, 'IMAGE', '', 'Sunset #Golden with @friend')
+
+
+def caption_tags():
+    return PostTag().fetch_dicts(
+        "SELECT `kind`, `tag` FROM `post_tags` JOIN `posts` USING (`post_id`)"
+        " WHERE `user_id` = :user_id ORDER BY `kind`;", {'user_id': USER_ID}
+    )
+
+
+def test_rebuild_extracts_caption_tags(tagged_post):
+    PostTag().rebuild_from_captions()
+    assert caption_tags() == [{'kind': 'hashtag', 'tag': 'golden'}, {'kind': 'mention', 'tag': 'friend'}]
+
+
+def test_failed_rebuild_keeps_the_old_tags(tagged_post, monkeypatch):
+    def failing_stream(self, after=None, batch_size=None):
+        raise OSError("connection lost")
+        yield
+
+    before = caption_tags()
+    monkeypatch.setattr(Post, 'stream', failing_stream)
+    with pytest.raises(OSError):
+        PostTag().rebuild_from_captions()
+    assert caption_tags() == before != []
+
+
+def test_bulk_created_posts_are_tagged(tagged_post, client):
+    response = client.post('/posts/bulk', json=[
+        {'user_id': USER_ID, 'media_type': 'IMAGE', 'media_url': '', 'caption': 'first #bulkone'},
+        {'user_id': USER_ID, 'media_type': 'IMAGE', 'media_url': '', 'caption': 'second #bulktwo'},
+    ])
+    assert [item['status'] for item in response.json()['items']] == ['created', 'created']
+    tags = PostTag().fetch_dicts(
+        "SELECT `caption`, `tag` FROM `post_tags` JOIN `posts` USING (`post_id`)"
+        " WHERE `tag` LIKE 'bulk%' ORDER BY `tag`;"
+    )
+    assert tags == [{'caption': 'first #bulkone', 'tag': 'bulkone'}, {'caption': 'second #bulktwo', 'tag': 'bulktwo'}]